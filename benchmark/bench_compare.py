@@ -0,0 +1,76 @@
+"""Measure how the result comparison scales with rows x columns.
+
+Usage: python -m benchmark.bench_compare
+"""
+
+from itertools import product
+from time import perf_counter
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from tdsql import compare
+
+ROWS = [1_000, 10_000, 100_000, 1_000_000]
+COLUMNS = [1, 10, 50]
+# per-cell loop is too slow for larger results
+MAX_CELLS_FOR_LOOP = 200_000
+
+
+def make_frame(nrow: int, ncol: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data: dict[str, Any] = {}
+    for c in range(ncol):
+        match c % 4:
+            case 0:
+                data[f"c{c}"] = rng.integers(0, 1000, nrow)
+            case 1:
+                data[f"c{c}"] = rng.random(nrow)
+            case 2:
+                data[f"c{c}"] = pd.array(rng.integers(0, 1000, nrow), dtype="Int64")
+            case _:
+                data[f"c{c}"] = rng.choice(["foo", "bar", "baz"], nrow)
+    return pd.DataFrame(data)
+
+
+def per_cell_loop(
+    actual: pd.DataFrame, expected: pd.DataFrame, acceptable_error: float
+) -> tuple[int, int] | None:
+    for i in range(actual.shape[0]):
+        for c in range(actual.shape[1]):
+            if not compare.is_equal(
+                actual.iloc[i, c], expected.iloc[i, c], acceptable_error
+            ):
+                return i, c
+    return None
+
+
+def measure(
+    func: Callable[[pd.DataFrame, pd.DataFrame, float], tuple[int, int] | None],
+    actual: pd.DataFrame,
+    expected: pd.DataFrame,
+) -> float:
+    start = perf_counter()
+    func(actual, expected, 1.0e-3)
+    return perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'rows':>10} {'columns':>8} {'vectorized[s]':>14} {'per-cell[s]':>12}")
+
+    for nrow, ncol in product(ROWS, COLUMNS):
+        actual = make_frame(nrow, ncol)
+        # worst case: every cell is compared
+        expected = actual.copy()
+
+        vectorized = measure(compare.find_first_mismatch, actual, expected)
+        loop = "-"
+        if nrow * ncol <= MAX_CELLS_FOR_LOOP:
+            loop = f"{measure(per_cell_loop, actual, expected):.4f}"
+
+        print(f"{nrow:>10} {ncol:>8} {vectorized:>14.4f} {loop:>12}")
+
+
+if __name__ == "__main__":
+    main()
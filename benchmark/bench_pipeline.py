@@ -0,0 +1,264 @@
+"""Measure the local pipeline of tdsql against a synthetic project.
+
+A project is generated in a temporary directory: yaml files nested by
+`source` globs, sql files with many `tdsql-start/end` markers (one of them
+is some MB) and thousands of tests. Queries are answered by an in-memory fake client,
+so that only tdsql itself is measured.
+
+- parse: `_parse_root_yaml()` including the rendering of all tests
+- render: `TdsqlTestCase()` for a large sql file (MB/s)
+- run: `command.run()` without latency of the database (ms per test)
+- compare: `verdict.compare_results()` for results of various sizes
+
+Results are appended to benchmark/results/bench_pipeline.jsonl
+and compared with the previous one.
+
+Usage: python -m benchmark.bench_pipeline [--scale 1.0] [--no-save]
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+import argparse
+import json
+import logging
+import platform
+import re
+import subprocess
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from tdsql.client.fake import FakeClient
+from tdsql.run_config import TdsqlRunConfig
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql.logger import logger
+from tdsql import client
+from tdsql import command
+from tdsql import util
+from tdsql import verdict
+
+RESULTS_PATH = Path(__file__).resolve().parent / "results" / "bench_pipeline.jsonl"
+
+# multiplied by --scale
+SUITES = 4  # yaml files in the first level
+DEPTH = 3  # levels of nested yaml files
+TESTS_PER_YAML = 150  # 29 yaml files, 4350 tests
+SQL_FILES = 8
+SQL_LINES = 2_000  # around 120KB, each test keeps its rendered sql in memory
+LARGE_SQL_LINES = 40_000  # around 2.4MB, also used by bench_render
+LARGE_EVERY = 100  # tests of the large sql file
+MARKERS = 200  # blocks in each sql file
+COMPARE_ROWS = [1_000, 100_000, 1_000_000]
+COMPARE_COLUMNS = 5
+
+
+def make_sql(n_lines: int, n_markers: int) -> str:
+    lines: list[str] = []
+    block = max(n_lines // max(n_markers, 1), 4)
+    for i in range(n_lines):
+        m = i // block
+        if i % block == 0 and m < n_markers:
+            lines.append(f"  -- tdsql-start: block{m}")
+        elif i % block == block - 1 and m < n_markers:
+            lines.append(f"  -- tdsql-end: block{m}")
+        elif i % block == 1 and m < n_markers:
+            lines.append(f"  SELECT {i} AS c  -- tdsql-line: line{m}")
+        else:
+            lines.append(
+                f"  SELECT {i} AS c, 'padding text of line {i}' AS s UNION ALL"
+            )
+    return "\n".join(lines)
+
+
+def make_project(root: Path, scale: float) -> dict[str, int]:
+    n_suites = max(int(SUITES * scale), 1)
+    n_sql = max(int(SQL_FILES * scale), 1)
+    n_lines = max(int(SQL_LINES * scale), 100)
+
+    for k in range(n_sql):
+        util.write(root / "sql" / f"query{k}.sql", make_sql(n_lines, MARKERS))
+    util.write(
+        root / "sql" / "large.sql",
+        make_sql(max(int(LARGE_SQL_LINES * scale), 100), MARKERS),
+    )
+
+    n_yaml = 0
+    n_tests = 0
+
+    def write_yaml(dir_: Path, depth: int) -> None:
+        nonlocal n_yaml, n_tests
+
+        tests = []
+        for i in range(TESTS_PER_YAML):
+            n = n_tests + i
+            sqlpath = Path("../" * (len(dir_.relative_to(root).parts))) / "sql"
+            tests.append(
+                {
+                    "filepath": str(
+                        sqlpath
+                        / (
+                            "large.sql"
+                            if n % LARGE_EVERY == 0
+                            else f"query{n % n_sql}.sql"
+                        )
+                    ),
+                    "replace": {
+                        f"block{n % MARKERS}": f"SELECT {n} AS c",
+                        f"line{(n + 1) % MARKERS}": "-- tdsql-line: this",
+                    },
+                    "expected": f"SELECT {n} AS c",
+                }
+            )
+        n_tests += len(tests)
+        n_yaml += 1
+
+        doc: dict[str, Any] = {"tests": tests}
+        if depth == 0:
+            doc["database"] = "fake"
+        if depth < DEPTH:
+            doc["source"] = "*/tdsql.yaml"
+            for j in range(n_suites if depth == 0 else 2):
+                write_yaml(dir_ / f"suite{j}", depth + 1)
+
+        util.write(dir_ / "tdsql.yaml", json.dumps(doc))  # json is valid yaml
+
+    write_yaml(root, 0)
+    sql_bytes = sum(p.stat().st_size for p in (root / "sql").iterdir())
+    return {"yaml_files": n_yaml, "tests": n_tests, "sql_bytes": sql_bytes}
+
+
+def bench_parse(root: Path) -> tuple[dict[str, float], command.TestConfigCases]:
+    start = perf_counter()
+    cases = command._parse_root_yaml(root / "tdsql.yaml")
+    return {"parse_seconds": perf_counter() - start}, cases
+
+
+def bench_render(root: Path, repeat: int = 20) -> dict[str, float]:
+    sqlpath = (root / "sql" / "large.sql").resolve()
+    size = sqlpath.stat().st_size
+
+    start = perf_counter()
+    for i in range(repeat):
+        TdsqlTestCase(sqlpath, {f"block{i}": "SELECT 1"}, "SELECT 1")
+    elapsed = perf_counter() - start
+
+    return {"render_mb_per_second": size * repeat / elapsed / 1024**2}
+
+
+def bench_run(root: Path, cases: command.TestConfigCases) -> dict[str, float]:
+    # actual and expected share the same result, tests pass
+    results: dict[str, pd.DataFrame | Exception] = {}
+    n_tests = 0
+    for _, tests in cases.values():
+        for t in tests:
+            df = pd.DataFrame({"c": range(t.id % 10 + 1)})
+            results[t.actual_sql] = df
+            results[t.expected_sql] = df
+            n_tests += 1
+
+    fake = FakeClient(results)
+    original = client.get_client
+    client.get_client = lambda database: fake  # type: ignore
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        start = perf_counter()
+        command.run(root / "tdsql.yaml", TdsqlRunConfig())
+        elapsed = perf_counter() - start
+    finally:
+        client.get_client = original  # type: ignore
+        logger.setLevel(level)
+
+    return {"run_seconds": elapsed, "run_ms_per_test": elapsed / n_tests * 1000}
+
+
+def bench_compare(tmp_dir: Path) -> dict[str, float]:
+    sqlpath = tmp_dir / "compare.sql"
+    util.write(sqlpath, "SELECT 1")
+    rng = np.random.default_rng(0)
+    res: dict[str, float] = {}
+
+    for nrow in COMPARE_ROWS:
+        df = pd.DataFrame(
+            {f"c{c}": rng.integers(0, 1000, nrow) for c in range(COMPARE_COLUMNS)}
+        )
+        for auto_sort in (False, True):
+            test = TdsqlTestCase(sqlpath, {}, "SELECT 1")
+            test.actual_sql_result = df
+            test.expected_sql_result = df.copy()
+            config = TdsqlTestConfig(database="fake", auto_sort=auto_sort)
+
+            start = perf_counter()
+            verdict.compare_results(test, config)
+            key = f"compare_{nrow}_rows{'_sorted' if auto_sort else ''}_seconds"
+            res[key] = perf_counter() - start
+
+    return res
+
+
+def version() -> dict[str, str]:
+    root = Path(__file__).resolve().parent.parent
+    match_ = re.search(r'^version = "(.+)"', util.read(root / "pyproject.toml"), re.M)
+    commit = subprocess.run(
+        ["git", "describe", "--always", "--dirty"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=False,
+    ).stdout.strip()
+    return {"version": match_.group(1) if match_ else "", "commit": commit}
+
+
+def previous(scale: float) -> dict[str, Any] | None:
+    if not RESULTS_PATH.is_file():
+        return None
+    records = [json.loads(line) for line in util.read(RESULTS_PATH).splitlines()]
+    records = [r for r in records if r["scale"] == scale]
+    return records[-1] if len(records) > 0 else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        metrics: dict[str, float] = dict(make_project(root, args.scale))
+        parse, cases = bench_parse(root)
+        metrics.update(parse)
+        metrics.update(bench_render(root))
+        metrics.update(bench_run(root, cases))
+        metrics.update(bench_compare(root))
+
+    record = {
+        **version(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "metrics": metrics,
+    }
+
+    before = previous(args.scale)
+    print(f"{'metric':>36} {'this':>12} {'previous':>12}")
+    for k, v in metrics.items():
+        prev = (
+            "-" if before is None else f"{before['metrics'].get(k, float('nan')):.4f}"
+        )
+        print(f"{k:>36} {v:>12.4f} {prev:>12}")
+    if before is not None:
+        print(f"previous: {before['version']} ({before['commit']})")
+
+    if not args.no_save:
+        RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(RESULTS_PATH, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Measure cold-start latency of the command.
+
+Each target is executed in a new interpreter, so that nothing is cached
+in `sys.modules`. Heavy modules (pandas, pyarrow, google-cloud-bigquery)
+should not be imported by the targets below.
+
+Usage: python -m benchmark.bench_startup
+"""
+
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+import subprocess
+import sys
+import tempfile
+
+REPEAT = 10
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "google.cloud.bigquery"]
+
+# no tests are defined, so that nothing but yaml has to be handled
+EMPTY_YAML = """
+database: bigquery
+tests: []
+"""
+
+TARGETS = {
+    "import": "import tdsql.command",
+    "--help": "import sys; from tdsql import command; sys.argv = ['tdsql', '--help']; "
+    + "command.main()",
+    "no tests": "from pathlib import Path; from tdsql import command; "
+    + "command.run(Path('tdsql.yaml'))",
+}
+
+
+def measure(code: str, cwd: Path) -> float:
+    start = perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return perf_counter() - start
+
+
+def imported_heavy_modules(code: str, cwd: Path) -> list[str]:
+    check = (
+        "import sys, contextlib, io\n"
+        + "with contextlib.suppress(SystemExit), "
+        + "contextlib.redirect_stdout(io.StringIO()):\n"
+        + f"    exec({code!r})\n"
+        + f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    res = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=cwd,
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    return [m for m in res.stdout.strip().split(",") if m != ""]
+
+
+def main() -> None:
+    root = Path(__file__).resolve().parent.parent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = Path(tmp)
+        (cwd / "tdsql.yaml").write_text(EMPTY_YAML)
+        # make tdsql importable from the temporary directory
+        (cwd / "tdsql").symlink_to(root / "tdsql")
+
+        baseline = median(measure("pass", cwd) for _ in range(REPEAT))
+        print(f"{'target':>10} {'median[s]':>10} {'overhead[s]':>12}  heavy modules")
+        print(f"{'python':>10} {baseline:>10.4f} {0:>12.4f}")
+
+        for name, code in TARGETS.items():
+            elapsed = median(measure(code, cwd) for _ in range(REPEAT))
+            heavy = ", ".join(imported_heavy_modules(code, cwd)) or "-"
+            print(f"{name:>10} {elapsed:>10.4f} {elapsed - baseline:>12.4f}  {heavy}")
+
+
+if __name__ == "__main__":
+    main()
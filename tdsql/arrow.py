@@ -0,0 +1,116 @@
+"""Comparison and logging of results as `pyarrow.Table` (see `--arrow`).
+
+pyarrow is an optional dependency (the `arrow` extra),
+import this module only when it is needed.
+"""
+
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pyarrow as pa  # type: ignore
+import pyarrow.compute as pc  # type: ignore
+import pyarrow.csv  # type: ignore
+
+from tdsql import compare
+
+
+def find_first_mismatch(
+    actual: Any, expected: Any, acceptable_error: float
+) -> tuple[int, int] | None:
+    """Same as `compare.find_first_mismatch()` but for `pyarrow.Table`."""
+    if actual.shape != expected.shape:
+        raise ValueError(f"shape does not match: {actual.shape}, {expected.shape}")
+
+    nrow = actual.num_rows
+    first: tuple[int, int] | None = None
+
+    for c in range(actual.num_columns):
+        limit = nrow if first is None else first[0]
+        if limit == 0:
+            break
+
+        mismatch = column_mismatch(
+            actual.column(c).slice(0, limit),
+            expected.column(c).slice(0, limit),
+            acceptable_error,
+        )
+        if mismatch.any():
+            first = (int(mismatch.argmax()), c)
+
+    return first
+
+
+def column_mismatch(actual: Any, expected: Any, acceptable_error: float) -> np.ndarray:
+    """Same as `compare.column_mismatch()` but for `pyarrow.ChunkedArray`."""
+    if len(actual) != len(expected):
+        raise ValueError(f"length does not match: {len(actual)}, {len(expected)}")
+
+    actual_na = _is_na(actual)
+    expected_na = _is_na(expected)
+
+    if actual.type != expected.type:
+        # type of each value differs but null is regarded as the same
+        return np.asarray(~(actual_na & expected_na), dtype=bool)
+
+    if pa.types.is_floating(actual.type):
+        value_equal = compare.within_error(
+            actual.to_numpy(zero_copy_only=False).astype("float64"),
+            expected.to_numpy(zero_copy_only=False).astype("float64"),
+            acceptable_error,
+        )
+    else:
+        try:
+            value_equal = _to_numpy(pc.fill_null(pc.equal(actual, expected), False))
+        except pa.ArrowNotImplementedError:
+            # e.g. STRUCT or ARRAY
+            value_equal = np.fromiter(
+                (a == e for a, e in zip(actual.to_pylist(), expected.to_pylist())),
+                dtype=bool,
+                count=len(actual),
+            )
+
+    equal = (actual_na & expected_na) | (~actual_na & ~expected_na & value_equal)
+    return np.asarray(~equal, dtype=bool)
+
+
+def sort(table: Any) -> Any:
+    # columns are referred by positions, their names may be duplicated
+    keys = table.rename_columns([str(i) for i in range(table.num_columns)])
+    try:
+        indices = pc.sort_indices(
+            keys, sort_keys=[(c, "ascending") for c in keys.column_names]
+        )
+    except (pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # nested types cannot be sorted by arrow
+        df = keys.to_pandas()
+        indices = df.sort_values(by=list(df.columns.values)).index.to_numpy()
+
+    return table.take(indices)
+
+
+def diff_multiset(
+    actual: Any, expected: Any, acceptable_error: float
+) -> tuple[Any, Any]:
+    """Same as `compare.diff_multiset()`, results are converted to pandas."""
+    return compare.diff_multiset(
+        actual.to_pandas(), expected.to_pandas(), acceptable_error
+    )
+
+
+def write_csv(table: Any, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        pyarrow.csv.write_csv(table, path)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # nested types are not supported by arrow csv writer
+        table.to_pandas().to_csv(path, index=False)
+
+
+def _is_na(array: Any) -> np.ndarray:
+    return _to_numpy(pc.is_null(array, nan_is_null=True))
+
+
+def _to_numpy(array: Any) -> np.ndarray:
+    return np.asarray(array.to_numpy(zero_copy_only=False), dtype=bool)
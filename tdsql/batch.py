@@ -0,0 +1,213 @@
+"""Execute many small queries as a single query job (see `--batch-size`).
+
+Each query is wrapped as a subquery whose rows are converted to json
+and tagged with the index of the query, then they are combined by UNION ALL.
+The result is split back into a DataFrame per query.
+
+Because values go through json, types are those of json (e.g. DATE is
+compared as string). The types of columns in the database
+(`BaseClient.schema()`) are kept with each result and compared by
+`verdict.check_types()`, so that a DATE and a STRING with the same json
+do not match. Only tests with `auto_sort: true` can be batched,
+the order of rows is not kept.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Final
+import json
+
+import pandas as pd
+
+from tdsql.client.base import BaseClient
+from tdsql.exception import TdsqlInternalError
+from tdsql.logger import logger
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+from tdsql import verdict
+
+ID_COLUMN: Final[str] = "_tdsql_id"
+ROW_COLUMN: Final[str] = "_tdsql_row"
+ALIAS: Final[str] = "_tdsql_t"
+
+
+class QueryBatcher:
+    """Collect queries and submit them to the pool `batch_size` at a time.
+
+    Queries are grouped by `TdsqlTestConfig.job_key()` (e.g. database and
+    max_bytes_billed) because they are decided per job. If a batched job
+    fails, queries are executed one by one but still through json, so that
+    the types of values do not depend on whether the query was batched.
+    Queries which return no rows are executed as they are, their columns are
+    unknown. Types of columns are looked up query by query (a dry run in
+    BigQuery) in the same thread as the batched job.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, batch_size: int, arrow: bool) -> None:
+        self.pool = pool
+        self.batch_size = batch_size
+        self.arrow = arrow
+        self.job_count = 0
+        self.query_count = 0
+        self._pending: dict[
+            tuple[Any, ...],
+            tuple[BaseClient, TdsqlTestConfig, list[tuple[str, Future[Any]]]],
+        ] = {}
+
+    @staticmethod
+    def accepts(client_: BaseClient, config: TdsqlTestConfig) -> bool:
+        return client_.json_row_expression is not None and config.auto_sort
+
+    def add(
+        self, client_: BaseClient, sql: str, config: TdsqlTestConfig
+    ) -> Future[Any]:
+        key = config.job_key()
+        future: Future[Any] = Future()
+
+        _, _, queries = self._pending.setdefault(key, (client_, config, []))
+        queries.append((sql, future))
+        if len(queries) >= self.batch_size:
+            self._submit(self._pending.pop(key))
+
+        return future
+
+    def flush(self) -> None:
+        for batch in self._pending.values():
+            self._submit(batch)
+        self._pending.clear()
+
+    def _submit(
+        self,
+        batch: tuple[BaseClient, TdsqlTestConfig, list[tuple[str, Future[Any]]]],
+    ) -> None:
+        client_, config, queries = batch
+        if len(queries) == 1:
+            # nothing to be fused
+            sql, future = queries[0]
+            self._retry(client_, sql, config, future)
+            return
+
+        self.job_count += 1
+        self.query_count += len(queries)
+        self.pool.submit(self._execute, client_, config, queries)
+
+    def _execute(
+        self,
+        client_: BaseClient,
+        config: TdsqlTestConfig,
+        queries: list[tuple[str, Future[Any]]],
+    ) -> None:
+        try:
+            expression = client_.json_row_expression
+            if expression is None:
+                raise TdsqlInternalError(f"{config.database} cannot batch queries")
+
+            types = [_types(client_, s, config) for s, _ in queries]
+            df = client_.select(
+                build_query([s for s, _ in queries], expression), config
+            )
+            results = split_result(df, len(queries))
+
+        except Exception as e:
+            # cancelled by --max-failures
+            if all(f.cancelled() for _, f in queries):
+                return
+            logger.warning(f"batched query failed, execute them one by one: {e}")
+            for sql, future in queries:
+                self._retry(client_, sql, config, future)
+            return
+
+        for (sql, future), result, types_ in zip(queries, results, types):
+            # cancelled by --max-failures
+            if future.cancelled():
+                continue
+            if result is None:
+                self._fallback(client_, sql, config, future)
+            else:
+                future.set_result(self._convert(result, types_))
+
+    def _retry(
+        self,
+        client_: BaseClient,
+        sql: str,
+        config: TdsqlTestConfig,
+        future: Future[Any],
+    ) -> None:
+        _chain(self.pool.submit(self._select_alone, client_, sql, config), future)
+
+    def _select_alone(
+        self, client_: BaseClient, sql: str, config: TdsqlTestConfig
+    ) -> Any:
+        """Execute the query as a batch of its own."""
+        select = client_.select_arrow if self.arrow else client_.select
+        expression = client_.json_row_expression
+        if expression is None:
+            raise TdsqlInternalError(f"{config.database} cannot batch queries")
+
+        try:
+            types = _types(client_, sql, config)
+            df = client_.select(build_query([sql], expression), config)
+        except Exception:
+            # the error of the query itself is more helpful
+            return select(sql, config)
+
+        result = split_result(df, 1)[0]
+        if result is None:
+            return select(sql, config)
+        return self._convert(result, types)
+
+    def _convert(self, result: pd.DataFrame, types: list[str]) -> Any:
+        if self.arrow:
+            import pyarrow as pa  # type: ignore
+
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            return verdict.with_types(table, types)
+        return verdict.with_types(result, types)
+
+    def _fallback(
+        self,
+        client_: BaseClient,
+        sql: str,
+        config: TdsqlTestConfig,
+        future: Future[Any],
+    ) -> None:
+        select = client_.select_arrow if self.arrow else client_.select
+        _chain(self.pool.submit(select, sql, config), future)
+
+
+def build_query(sqls: list[str], json_row_expression: str) -> str:
+    row = json_row_expression.format(ALIAS)
+    return "\nUNION ALL\n".join(
+        [
+            f"SELECT {i} AS {ID_COLUMN}, {row} AS {ROW_COLUMN}\n"
+            # new line is needed in case that the query ends with a comment
+            + f"FROM (\n{util.strip_sql(sql)}\n) AS {ALIAS}"
+            for i, sql in enumerate(sqls)
+        ]
+    )
+
+
+def split_result(df: pd.DataFrame, n: int) -> list[pd.DataFrame | None]:
+    """Return the result of each query (None if it has no rows)."""
+    rows: list[list[dict[str, Any]]] = [[] for _ in range(n)]
+    for i, row in zip(df[ID_COLUMN], df[ROW_COLUMN]):
+        rows[int(i)].append(json.loads(row))
+
+    return [pd.DataFrame.from_records(r) if len(r) > 0 else None for r in rows]
+
+
+def _types(client_: BaseClient, sql: str, config: TdsqlTestConfig) -> list[str]:
+    return [t for _, t in client_.schema(sql, config)]
+
+
+def _chain(source: Future[Any], destination: Future[Any]) -> None:
+    def callback(f: Future[Any]) -> None:
+        if f.cancelled() or destination.cancelled():
+            destination.cancel()
+            return
+        error = f.exception()
+        if error is None:
+            destination.set_result(f.result())
+        else:
+            destination.set_exception(error)
+
+    source.add_done_callback(callback)
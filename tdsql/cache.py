@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Any
+from threading import Lock
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pq = None
+
+from tdsql.client.base import BaseClient
+from tdsql.logger import logger
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+
+
+class ResultCache:
+    """Query results stored as parquet files named after the hash of the query."""
+
+    def __init__(self, cache_dir: Path, max_bytes: int, max_age: float) -> None:
+        util.require_pyarrow("to use cache")
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(sql: str, config: TdsqlTestConfig) -> str:
+        # max_bytes_billed is included because it decides whether the query fails
+        text = json.dumps([sql, *config.job_key()])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key: str, arrow: bool = False) -> Any:
+        """Return DataFrame (or `pyarrow.Table` if arrow is True) or None."""
+        path = self._path(key)
+        df: Any = None
+
+        try:
+            if time.time() - path.stat().st_mtime <= self.max_age:
+                df = pq.read_table(path) if arrow else pd.read_parquet(path)
+                # mtime is used as the last access time for LRU eviction
+                os.utime(path)
+        except (OSError, ValueError):
+            # not found or broken
+            df = None
+
+        with self._lock:
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return df
+
+    def put(self, key: str, df: Any) -> None:
+        """Store DataFrame or `pyarrow.Table`."""
+        try:
+            if isinstance(df, pd.DataFrame):
+                util.write_atomic(
+                    self._path(key), lambda p: df.to_parquet(p, index=False)
+                )
+            else:
+                util.write_atomic(self._path(key), lambda p: pq.write_table(df, p))
+        except Exception as e:
+            # e.g. types which are not supported by parquet
+            logger.warning(f"failed to cache result: {e}")
+
+    def evict(self) -> None:
+        now = time.time()
+        files: list[tuple[float, int, Path]] = []
+
+        for path in self.cache_dir.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.parquet"
+
+
+class CachedClient(BaseClient):
+    def __init__(self, client: BaseClient, cache: ResultCache) -> None:
+        self.client = client
+        self.cache = cache
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        key = self.cache.key(sql, config)
+        df = self.cache.get(key)
+
+        if df is None:
+            df = self.client.select(sql, config)
+            self.cache.put(key, df)
+
+        return df
+
+    def select_arrow(self, sql: str, config: TdsqlTestConfig) -> Any:
+        key = self.cache.key(sql, config)
+        table = self.cache.get(key, arrow=True)
+
+        if table is None:
+            table = self.client.select_arrow(sql, config)
+            self.cache.put(key, table)
+
+        return table
+
+    def dry_run(self, sql: str, config: TdsqlTestConfig) -> int:
+        return self.client.dry_run(sql, config)
+
+    def cancel(self) -> None:
+        self.client.cancel()
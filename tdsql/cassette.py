@@ -0,0 +1,111 @@
+"""Record query results to a cassette directory and replay them later.
+
+A cassette contains one parquet file per query (named after the hash of it),
+or a json file if the query failed. Replaying it does not need database,
+network nor credentials (see `--record` and `--replay`).
+"""
+
+from pathlib import Path
+from typing import Any
+import json
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pq = None
+
+from tdsql.cache import ResultCache
+from tdsql.client.base import BaseClient
+from tdsql.exception import InvalidInputError, RecordedQueryError
+from tdsql.logger import logger
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+
+
+class RecordingClient(BaseClient):
+    """Execute queries by the client and write the results to the cassette."""
+
+    def __init__(self, client: BaseClient, cassette_dir: Path) -> None:
+        util.require_pyarrow("to record results")
+
+        self.client = client
+        self.cassette_dir = cassette_dir
+        cassette_dir.mkdir(parents=True, exist_ok=True)
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        return self._record(sql, config, arrow=False)
+
+    def select_arrow(self, sql: str, config: TdsqlTestConfig) -> Any:
+        return self._record(sql, config, arrow=True)
+
+    def dry_run(self, sql: str, config: TdsqlTestConfig) -> int:
+        return self.client.dry_run(sql, config)
+
+    def cancel(self) -> None:
+        self.client.cancel()
+
+    def _record(self, sql: str, config: TdsqlTestConfig, arrow: bool) -> Any:
+        key = ResultCache.key(sql, config)
+
+        try:
+            if arrow:
+                result = self.client.select_arrow(sql, config)
+            else:
+                result = self.client.select(sql, config)
+        except Exception as e:
+            error = json.dumps({"sql": sql, "error": f"{type(e).__name__}: {e}"})
+            util.write_atomic(
+                self.cassette_dir / f"{key}.json", lambda p: p.write_text(error)
+            )
+            raise
+
+        (self.cassette_dir / f"{key}.json").unlink(missing_ok=True)
+        try:
+            if isinstance(result, pd.DataFrame):
+                util.write_atomic(
+                    self.cassette_dir / f"{key}.parquet",
+                    lambda p: result.to_parquet(p, index=False),
+                )
+            else:
+                util.write_atomic(
+                    self.cassette_dir / f"{key}.parquet",
+                    lambda p: pq.write_table(result, p),
+                )
+        except Exception as e:
+            # e.g. types which are not supported by parquet
+            logger.warning(f"failed to record result: {e}")
+
+        return result
+
+
+class ReplayClient(BaseClient):
+    """Return the results in the cassette without executing queries."""
+
+    def __init__(self, cassette_dir: Path) -> None:
+        util.require_pyarrow("to replay results")
+        if not cassette_dir.is_dir():
+            raise InvalidInputError(f"cassette is not found: {cassette_dir}")
+
+        self.cassette_dir = cassette_dir
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        return pd.read_parquet(self._path(sql, config))
+
+    def select_arrow(self, sql: str, config: TdsqlTestConfig) -> Any:
+        return pq.read_table(self._path(sql, config))
+
+    def _path(self, sql: str, config: TdsqlTestConfig) -> Path:
+        key = ResultCache.key(sql, config)
+
+        error = self.cassette_dir / f"{key}.json"
+        if error.is_file():
+            raise RecordedQueryError(json.loads(error.read_text())["error"])
+
+        path = self.cassette_dir / f"{key}.parquet"
+        if not path.is_file():
+            raise InvalidInputError(
+                f"query is not recorded in {self.cassette_dir}\n{sql}"
+            )
+        return path
@@ -7,5 +7,9 @@ def get_client(database: str) -> BaseClient:
         from tdsql.client import bigquery
 
         return bigquery.BigQueryClient()
+    elif database == "duckdb":
+        from tdsql.client import duckdb
+
+        return duckdb.DuckDBClient()
     else:
         raise InvalidInputError(f"{database} is not supported")
@@ -1,11 +1,88 @@
-from abc import ABC, abstractmethod
+from __future__ import annotations
 
-import pandas as pd
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Iterator
 
 from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class BaseClient(ABC):
+    # True if submit(), poll() and fetch() are implemented (see AsyncScheduler)
+    supports_async: bool = False
+    # expression which converts a row of the table alias `{}` into json string
+    # (see tdsql.batch), None if queries cannot be batched
+    json_row_expression: str | None = None
+    # expression which quotes the column name `{}`, None if results cannot be
+    # compared in the database (see tdsql.server_diff)
+    quoted_identifier: str | None = None
+    # expression which hashes the string `{}` into an integer,
+    # None if fingerprints of results cannot be computed (see --fingerprint)
+    fingerprint_expression: str | None = None
+
     @abstractmethod
     def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
         pass
+
+    def select_batches(
+        self, sql: str, config: TdsqlTestConfig
+    ) -> Iterator[pd.DataFrame]:
+        """Yield the result page by page.
+
+        At least one DataFrame (which may be empty) has to be yielded
+        so that the columns are known. Override it if the database supports
+        fetching the result partially.
+        """
+        yield self.select(sql, config)
+
+    def select_arrow(self, sql: str, config: TdsqlTestConfig) -> Any:
+        """Return the result as `pyarrow.Table`.
+
+        Override it if the database can return arrow without pandas.
+        """
+        import pyarrow as pa  # type: ignore
+
+        return pa.Table.from_pandas(self.select(sql, config), preserve_index=False)
+
+    def schema(self, sql: str, config: TdsqlTestConfig) -> list[tuple[str, str]]:
+        """Return the name and the type of each column of the result.
+
+        Types are only compared with each other (e.g. by `tdsql.server_diff`).
+        Override it if the database can tell them without executing the query.
+        """
+        df = self.select(f"SELECT * FROM (\n{util.strip_sql(sql)}\n) LIMIT 0", config)
+        return [(str(c), str(t)) for c, t in zip(df.columns, df.dtypes)]
+
+    def submit(self, sql: str, config: TdsqlTestConfig) -> Any:
+        """Start a query job and return it without waiting for the result."""
+        raise NotImplementedError()
+
+    def poll(self, job: Any) -> bool:
+        """Return True if the job has finished (successfully or not)."""
+        raise NotImplementedError()
+
+    def fetch(self, job: Any, arrow: bool = False) -> Any:
+        """Return the result of the finished job as DataFrame (or pyarrow.Table)."""
+        raise NotImplementedError()
+
+    def dry_run(self, sql: str, config: TdsqlTestConfig) -> int:
+        """Validate the query without executing it.
+
+        Return the estimated number of bytes to be processed,
+        raise an exception if the query is invalid.
+        """
+        raise NotImplementedError()
+
+    def cancel(self) -> None:
+        """Cancel all running query jobs of the database (see `--max-failures`).
+
+        Queries waiting for the jobs in other threads may raise an exception.
+        Override it if the database supports cancellation.
+        """
+
+    def is_throttled(self, error: Exception) -> bool:
+        """Return True if the error is caused by quota or rate limit."""
+        return False
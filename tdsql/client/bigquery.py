@@ -1,21 +1,152 @@
+from threading import Lock
+from typing import Any, Final, Iterator
+
+from google.api_core import exceptions
 from google.cloud import bigquery
 import pandas as pd
 
 from tdsql.client.base import BaseClient
+from tdsql.logger import logger
 from tdsql.test_config import TdsqlTestConfig
+from tdsql import timing
+
+# bigquery.Client is created when it is used for the first time
+# and shared by (project, credentials)
+_CLIENTS: dict[tuple[str, str], bigquery.Client] = {}
+# jobs which may be running, to be cancelled by cancel()
+_JOBS: dict[int, bigquery.QueryJob] = {}
+_LOCK = Lock()
 
-# See https://googleapis.dev/python/google-api-core/latest/auth.html#authentication # noqa
-_CLIENT = bigquery.Client()
+PAGE_SIZE: Final[int] = 10_000
+THROTTLED_REASONS: Final[set[str]] = {"rateLimitExceeded", "quotaExceeded"}
 
 
 class BigQueryClient(BaseClient):
-    def __init__(self) -> None:
-        self.client = _CLIENT
+    supports_async = True
+    json_row_expression = "TO_JSON_STRING({})"
+    quoted_identifier = "`{}`"
+    fingerprint_expression = "FARM_FINGERPRINT({})"
+
+    def _bigquery_client(self, config: TdsqlTestConfig) -> bigquery.Client:
+        key = (config.project, config.credentials)
+        with _LOCK:
+            if key not in _CLIENTS:
+                _CLIENTS[key] = _create_client(*key)
+            return _CLIENTS[key]
 
     def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
-        query_job_config = bigquery.QueryJobConfig(
-            maximum_bytes_billed=config.max_bytes_billed,
-            use_legacy_sql=False,
-        )
-        df = self.client.query(sql, job_config=query_job_config).to_dataframe()
+        job = self._execute(sql, config)
+        with timing.span("download"):
+            df = job.to_dataframe()
         return df
+
+    def select_batches(
+        self, sql: str, config: TdsqlTestConfig
+    ) -> Iterator[pd.DataFrame]:
+        job = self.submit(sql, config)
+        try:
+            rows = job.result(page_size=PAGE_SIZE)
+
+            empty = True
+            for df in rows.to_dataframe_iterable():
+                empty = False
+                yield df
+
+            if empty:
+                yield pd.DataFrame(columns=[f.name for f in rows.schema])
+        finally:
+            _forget(job)
+
+    def select_arrow(self, sql: str, config: TdsqlTestConfig) -> Any:
+        job = self._execute(sql, config)
+        with timing.span("download"):
+            return job.to_arrow()
+
+    def submit(self, sql: str, config: TdsqlTestConfig) -> bigquery.QueryJob:
+        job = self._bigquery_client(config).query(sql, job_config=_job_config(config))
+        with _LOCK:
+            _JOBS[id(job)] = job
+        return job
+
+    def dry_run(self, sql: str, config: TdsqlTestConfig) -> int:
+        job = self._dry_run(sql, config)
+        return int(job.total_bytes_processed or 0)
+
+    def schema(self, sql: str, config: TdsqlTestConfig) -> list[tuple[str, str]]:
+        # dry run is not billed
+        job = self._dry_run(sql, config)
+        return [(f.name, _type_name(f)) for f in job.schema]
+
+    def _dry_run(self, sql: str, config: TdsqlTestConfig) -> bigquery.QueryJob:
+        job_config = _job_config(config)
+        job_config.dry_run = True
+        job_config.use_query_cache = False
+        return self._bigquery_client(config).query(sql, job_config=job_config)
+
+    def _execute(self, sql: str, config: TdsqlTestConfig) -> bigquery.QueryJob:
+        """Wait until the job finishes, the result is not downloaded yet."""
+        with timing.span("execute"):
+            job = self.submit(sql, config)
+            try:
+                job.result()
+            finally:
+                _forget(job)
+        return job
+
+    def poll(self, job: bigquery.QueryJob) -> bool:
+        return bool(job.done())
+
+    def fetch(self, job: bigquery.QueryJob, arrow: bool = False) -> Any:
+        _forget(job)
+        with timing.span("download"):
+            return job.to_arrow() if arrow else job.to_dataframe()
+
+    def cancel(self) -> None:
+        with _LOCK:
+            jobs = list(_JOBS.values())
+            _JOBS.clear()
+
+        for job in jobs:
+            try:
+                job.cancel()
+            except Exception as e:
+                logger.warning(f"failed to cancel {job.job_id}: {e}")
+
+    def is_throttled(self, error: Exception) -> bool:
+        if isinstance(error, exceptions.TooManyRequests):
+            return True
+        if isinstance(error, exceptions.Forbidden):
+            return any(e.get("reason") in THROTTLED_REASONS for e in error.errors)
+        return False
+
+
+def _forget(job: bigquery.QueryJob) -> None:
+    with _LOCK:
+        _JOBS.pop(id(job), None)
+
+
+def _type_name(field: bigquery.SchemaField) -> str:
+    name = str(field.field_type)
+    if name in ("RECORD", "STRUCT"):
+        fields = ", ".join([f"{f.name} {_type_name(f)}" for f in field.fields])
+        name = f"STRUCT<{fields}>"
+    if field.mode == "REPEATED":
+        name = f"ARRAY<{name}>"
+    return name
+
+
+def _job_config(config: TdsqlTestConfig) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(
+        maximum_bytes_billed=config.max_bytes_billed,
+        use_legacy_sql=False,
+    )
+
+
+def _create_client(project: str, credentials: str) -> bigquery.Client:
+    # empty project means the default project of the credentials
+    if credentials != "":
+        return bigquery.Client.from_service_account_json(
+            credentials, project=project or None
+        )
+    # See https://googleapis.dev/python/google-api-core/latest/auth.html#authentication # noqa
+    return bigquery.Client(project=project or None)
@@ -0,0 +1,252 @@
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Final, Iterator
+import bisect
+import re
+
+import duckdb
+import pandas as pd
+
+from tdsql.client.base import BaseClient
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import timing
+from tdsql import util
+
+_CONNECTION: Any = None
+# cursors executing queries, to be interrupted by cancel()
+_CURSORS: dict[int, Any] = {}
+_LOCK = Lock()
+
+# string literals (which may not be closed) and comments
+_LITERAL: Final[str] = (
+    r"'(?:\\.|\\\Z|[^'\\])*(?:'|\Z)"
+    + r'|"(?:\\.|\\\Z|[^"\\])*(?:"|\Z)'
+    + r"|--[^\n]*|#[^\n]*"
+)
+literal_pattern: Final[re.Pattern[str]] = re.compile(_LITERAL, re.DOTALL)
+# literals are matched first so that backticks in them are skipped
+backtick_pattern: Final[re.Pattern[str]] = re.compile(
+    _LITERAL + r"|`(?P<ident>[^`]*)`", re.DOTALL
+)
+unnest_struct_pattern: Final[re.Pattern[str]] = re.compile(
+    r"\bUNNEST\s*\(\s*\[\s*STRUCT\s*\(", re.IGNORECASE
+)
+struct_pattern: Final[re.Pattern[str]] = re.compile(
+    r"^STRUCT\s*\((.*)\)$", re.IGNORECASE | re.DOTALL
+)
+alias_pattern: Final[re.Pattern[str]] = re.compile(
+    r"^(.*?)\s+AS\s+([a-zA-Z_]\w*)$", re.IGNORECASE | re.DOTALL
+)
+
+
+class DuckDBClient(BaseClient):
+    """Execute queries in-process by an in-memory DuckDB database."""
+
+    json_row_expression = "CAST(to_json({}) AS VARCHAR)"
+    quoted_identifier = '"{}"'
+    fingerprint_expression = "hash({})"
+
+    def __init__(self) -> None:
+        global _CONNECTION
+
+        with _LOCK:
+            if _CONNECTION is None:
+                _CONNECTION = duckdb.connect(":memory:")
+        self.connection = _CONNECTION
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        if config.translate_bigquery:
+            sql = translate_bigquery(sql)
+
+        # a cursor is needed for each thread
+        with self._cursor() as cursor:
+            with timing.span("execute"):
+                result = cursor.execute(sql)
+            with timing.span("download"):
+                df: pd.DataFrame = result.df()
+        return df
+
+    def dry_run(self, sql: str, config: TdsqlTestConfig) -> int:
+        if config.translate_bigquery:
+            sql = translate_bigquery(sql)
+
+        # tables are in memory, nothing is billed
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}")
+        return 0
+
+    def schema(self, sql: str, config: TdsqlTestConfig) -> list[tuple[str, str]]:
+        if config.translate_bigquery:
+            sql = translate_bigquery(sql)
+
+        with self.connection.cursor() as cursor:
+            rows = cursor.execute(
+                f"DESCRIBE SELECT * FROM (\n{util.strip_sql(sql)}\n)"
+            ).fetchall()
+        return [(str(r[0]), str(r[1])) for r in rows]
+
+    def select_arrow(self, sql: str, config: TdsqlTestConfig) -> Any:
+        if config.translate_bigquery:
+            sql = translate_bigquery(sql)
+
+        with self._cursor() as cursor:
+            with timing.span("execute"):
+                result = cursor.execute(sql)
+            with timing.span("download"):
+                # fetch_arrow_table() is deprecated by newer versions
+                if hasattr(result, "to_arrow_table"):
+                    return result.to_arrow_table()
+                return result.fetch_arrow_table()
+
+    def cancel(self) -> None:
+        with _LOCK:
+            cursors = list(_CURSORS.values())
+        for cursor in cursors:
+            cursor.interrupt()
+
+    @contextmanager
+    def _cursor(self) -> Iterator[Any]:
+        with self.connection.cursor() as cursor:
+            with _LOCK:
+                _CURSORS[id(cursor)] = cursor
+            try:
+                yield cursor
+            finally:
+                with _LOCK:
+                    _CURSORS.pop(id(cursor), None)
+
+
+def translate_bigquery(sql: str) -> str:
+    """Translate common BigQuery syntax into DuckDB.
+
+    - `project.dataset.table` -> "project"."dataset"."table"
+    - UNNEST([STRUCT(1 AS a, 2 AS b), STRUCT(3, 4)])
+      -> (SELECT * FROM (VALUES (1, 2), (3, 4)) AS _unnest(a, b))
+    """
+    return backtick_pattern.sub(_quote_backtick, _translate_unnest_struct(sql))
+
+
+def _quote_backtick(m: re.Match[str]) -> str:
+    ident = m.group("ident")
+    # string literals and comments are kept as they are
+    if ident is None:
+        return m.group(0)
+    return ".".join([f'"{i}"' for i in ident.split(".")])
+
+
+def _translate_unnest_struct(sql: str) -> str:
+    strings = _string_spans(sql)
+    res: list[str] = []
+    prev = 0
+
+    for m in unnest_struct_pattern.finditer(sql):
+        if m.start() < prev or _is_in(m.start(), strings):
+            continue
+
+        open_ = sql.index("(", m.start())
+        close = _find_closing(sql, open_, strings)
+        if close == -1:
+            continue
+
+        values = _struct_values(sql[open_ + 1 : close].strip())
+        if values is None:
+            continue
+
+        names, rows = values
+        res.extend(
+            [
+                sql[prev : m.start()],
+                "(SELECT * FROM (VALUES "
+                + ", ".join([f"({', '.join(r)})" for r in rows])
+                + f") AS _unnest({', '.join(names)}))",
+            ]
+        )
+        prev = close + 1
+
+    res.append(sql[prev:])
+    return "".join(res)
+
+
+def _struct_values(array: str) -> tuple[list[str], list[list[str]]] | None:
+    """Parse `[STRUCT(...), ...]` into column names and rows."""
+    if not (array.startswith("[") and array.endswith("]")):
+        return None
+
+    names: list[str] = []
+    rows: list[list[str]] = []
+    for i, element in enumerate(_split_top_level(array[1:-1])):
+        m = struct_pattern.match(element)
+        if m is None:
+            return None
+
+        row: list[str] = []
+        for j, field in enumerate(_split_top_level(m.group(1))):
+            alias = alias_pattern.match(field)
+            # column names are decided by the first STRUCT
+            if i == 0:
+                names.append(alias.group(2) if alias else f"_field_{j+1}")
+            row.append(alias.group(1) if alias else field)
+
+        if len(row) != len(names):
+            return None
+        rows.append(row)
+
+    return names, rows
+
+
+def _string_spans(sql: str) -> list[tuple[int, int]]:
+    """Return [start, end) of string literals and comments in order."""
+    return [m.span() for m in literal_pattern.finditer(sql)]
+
+
+def _is_in(pos: int, spans: list[tuple[int, int]]) -> bool:
+    k = bisect.bisect_right(spans, pos, key=lambda s: s[0]) - 1
+    return k >= 0 and pos < spans[k][1]
+
+
+def _code_chars(
+    text: str, start: int, spans: list[tuple[int, int]]
+) -> Iterator[tuple[int, str]]:
+    """Yield (index, character) from `start` except in `spans`."""
+    k = bisect.bisect_right(spans, start, key=lambda s: s[1])
+    i = start
+    while i < len(text):
+        if k < len(spans) and spans[k][0] <= i:
+            i = max(i, spans[k][1])
+            k += 1
+            continue
+        yield i, text[i]
+        i += 1
+
+
+def _find_closing(sql: str, open_: int, spans: list[tuple[int, int]]) -> int:
+    """Return the index of the parenthesis which closes `sql[open_]` (or -1)."""
+    depth = 0
+    for i, c in _code_chars(sql, open_, spans):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _split_top_level(text: str) -> list[str]:
+    """Split by commas which are not in parentheses or string literals."""
+    res: list[str] = []
+    depth = 0
+    prev = 0
+    for i, c in _code_chars(text, 0, _string_spans(text)):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            res.append(text[prev:i].strip())
+            prev = i + 1
+
+    last = text[prev:].strip()
+    if last != "":
+        res.append(last)
+    return res
@@ -0,0 +1,70 @@
+from collections.abc import Mapping
+from threading import Event, Lock
+
+import pandas as pd
+
+from tdsql.client.base import BaseClient
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+
+
+class FakeClient(BaseClient):
+    """Client which returns predefined results, for tests and benchmarks.
+
+    Queries are looked up in `results` (after stripping whitespaces and `;`),
+    a result may be an exception to be raised. Unknown queries are invalid.
+    Each call sleeps `latency` seconds to imitate a database,
+    calls after `cancel()` (including sleeping ones) are failed.
+    """
+
+    def __init__(
+        self,
+        results: Mapping[str, pd.DataFrame | Exception],
+        bytes_processed: Mapping[str, int] | None = None,
+        latency: float = 0.0,
+    ) -> None:
+        self.results = {util.strip_sql(k): v for k, v in results.items()}
+        self.bytes_processed = {
+            util.strip_sql(k): v for k, v in (bytes_processed or {}).items()
+        }
+        self.latency = latency
+        self.select_count = 0
+        self.dry_run_count = 0
+        self.cancel_count = 0
+        self._lock = Lock()
+        self._cancelled = Event()
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        with self._lock:
+            self.select_count += 1
+        self._sleep()
+
+        result = self._lookup(sql)
+        if isinstance(result, Exception):
+            raise result
+        return result.copy()
+
+    def dry_run(self, sql: str, config: TdsqlTestConfig) -> int:
+        with self._lock:
+            self.dry_run_count += 1
+        self._sleep()
+
+        result = self._lookup(sql)
+        if isinstance(result, Exception):
+            raise result
+        return self.bytes_processed.get(util.strip_sql(sql), 0)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancel_count += 1
+        self._cancelled.set()
+
+    def _sleep(self) -> None:
+        if self._cancelled.wait(self.latency):
+            raise RuntimeError("the query was cancelled")
+
+    def _lookup(self, sql: str) -> pd.DataFrame | Exception:
+        result = self.results.get(util.strip_sql(sql))
+        if result is None:
+            return ValueError(f"unknown query: {sql}")
+        return result
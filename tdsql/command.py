@@ -1,125 +1,964 @@
+from __future__ import annotations
+
 from concurrent.futures import ThreadPoolExecutor, Future
 from dataclasses import fields
+from functools import partial
 from pathlib import Path
-from typing import Any, Final, Literal
+from queue import Queue
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Final,
+    Generator,
+    Iterable,
+    Literal,
+    TypeVar,
+)
+import argparse
 import glob
-import shutil
+import json
+import os
+import re
 import sys
 
 import yaml
-import pandas as pd
 
+from tdsql.client.base import BaseClient
+from tdsql.manifest import Manifest
+from tdsql.run_config import TdsqlRunConfig
 from tdsql.test_config import TdsqlTestConfig
-from tdsql.test_case import TdsqlTestCase
+from tdsql.test_case import SqlIndex, TdsqlTestCase
 from tdsql.exception import InvalidInputError, TdsqlAssertionError, TdsqlInternalError
-from tdsql.logger import logger
+from tdsql.log_writer import LOG_FORMATS, LogWriter
+from tdsql.logger import logger, setup as setup_logger
+from tdsql.timing import Timeline, label_of
 from tdsql import client
+from tdsql import timing
+from tdsql import log_writer
 from tdsql import util
+from tdsql import verdict
+
+# pandas, pyarrow and so on are imported when they are needed
+# so that the command starts quickly (see benchmark/bench_startup.py)
+if TYPE_CHECKING:
+    import pandas as pd
 
+    from tdsql.batch import QueryBatcher
+    from tdsql.cache import ResultCache
+    from tdsql.parallel import ComparisonPool
+    from tdsql.scheduler import AsyncScheduler
 
+T = TypeVar("T")
 TestConfigCases = dict[Path, tuple[TdsqlTestConfig, list[TdsqlTestCase]]]
+ResultKind = Literal["actual", "expected"]
 
 LOG_DIR_NAME: Final[str] = ".tdsql_log"
+CACHE_DIR_NAME: Final[str] = ".tdsql_cache"
+MANIFEST_FILE_NAME: Final[str] = "manifest.json"
+# threads to load yaml files of the same level
+YAML_LOAD_THREADS: Final[int] = 8
+# libyaml is much faster if PyYAML is built with it
+YAML_LOADER: Final = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
+def main(argv: list[str] | None = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    setup_logger()
+    if len(argv) > 0 and argv[0] == "merge":
+        merge(argv[1:])
+        return
 
-def main() -> None:
-    # TODO parse command line arguments
+    run_config = _parse_args(argv)
     yamlpath = Path("tdsql.yaml")
     ymlpath = Path("tdsql.yml")
 
     if yamlpath.is_file():
-        run(yamlpath)
+        run(yamlpath, run_config)
 
     elif ymlpath.is_file():
-        run(ymlpath)
+        run(ymlpath, run_config)
 
     else:
         logger.error("tdsql.yaml is not found")
         sys.exit(1)
 
 
-def run(yamlpath: Path) -> None:
+def merge(argv: list[str] | None = None) -> None:
+    """Merge reports of `--result-json` (e.g. of shards) into one."""
+    from tdsql import report
+
+    parser = argparse.ArgumentParser(
+        prog="tdsql merge", description="Merge results written by --result-json"
+    )
+    parser.add_argument("reports", type=Path, nargs="+", metavar="REPORT")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        required=True,
+        metavar="PATH",
+        help="path of the merged report",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        merged = report.merge(args.reports)
+    except InvalidInputError as e:
+        # e.g. shards were split differently
+        logger.error(e)
+        sys.exit(1)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(merged, indent=2))
+
+    for t in merged["tests"]:
+        if not t["passed"]:
+            logger.error(t["error"])
+    logger.info(f"{merged['passed']} tests passed, {merged['failed']} tests failed")
+
+    if merged["failed"] > 0:
+        sys.exit(1)
+
+
+def _parse_args(argv: list[str] | None = None) -> TdsqlRunConfig:
+    parser = argparse.ArgumentParser(
+        prog="tdsql", description="Minimum test flamework for sql"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"reuse query results stored in {CACHE_DIR_NAME}",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="remove cached query results before running tests",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=TdsqlRunConfig.cache_max_bytes,
+        help="maximum total bytes of cached results (default 1GiB)",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=float,
+        default=TdsqlRunConfig.cache_max_age / (24 * 60 * 60),
+        help="days to keep cached results (default 7)",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="run only tests which are changed or failed last time",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="fetch results page by page and stop at the first mismatch "
+        + "(only applied when auto_sort is false)",
+    )
+    parser.add_argument(
+        "--arrow",
+        action="store_true",
+        help="compare results as pyarrow.Table without converting them to pandas",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["thread", "asyncio"],
+        default=TdsqlRunConfig.engine,
+        help="thread executes queries by max_threads threads, asyncio submits "
+        + "query jobs and polls them adjusting concurrency (default thread)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=TdsqlRunConfig.max_concurrency,
+        help="upper limit of query jobs in flight for asyncio engine "
+        + f"(default {TdsqlRunConfig.max_concurrency})",
+    )
+    parser.add_argument(
+        "--compare-processes",
+        type=int,
+        default=TdsqlRunConfig.compare_processes,
+        help="number of processes to compare large results (default 0, disabled)",
+    )
+    parser.add_argument(
+        "--compare-threshold",
+        type=int,
+        default=TdsqlRunConfig.compare_threshold,
+        help="results with at least this number of cells are compared "
+        + f"in the process pool (default {TdsqlRunConfig.compare_threshold})",
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record",
+        type=Path,
+        metavar="DIR",
+        help="write query results to the cassette directory",
+    )
+    cassette.add_argument(
+        "--replay",
+        type=Path,
+        metavar="DIR",
+        help="read query results from the cassette directory "
+        + "instead of executing queries",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=TdsqlRunConfig.batch_size,
+        help="execute up to this number of queries as a single query job "
+        + "(default 0, disabled). only applied to tests with auto_sort: true, "
+        + "not applied with --cache, --record or --replay",
+    )
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        default=TdsqlRunConfig.max_failures,
+        metavar="N",
+        help="stop after N tests failed (default 0, never stop). "
+        + "tests which have not finished are not run "
+        + "and running query jobs are cancelled",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="validate all queries and estimate bytes to be processed "
+        + "before executing them, nothing is executed if any of them fails",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=LOG_FORMATS,
+        default=TdsqlRunConfig.log_format,
+        help=f"format of results written to {LOG_DIR_NAME} (default csv). "
+        + "results of --stream are always written as csv",
+    )
+    parser.add_argument(
+        "--log-compression",
+        default=TdsqlRunConfig.log_compression,
+        metavar="CODEC",
+        help="compression of results written to logs, e.g. gzip or zstd "
+        + "(default none)",
+    )
+    parser.add_argument(
+        "--log-failures-only",
+        action="store_true",
+        help="write logs only for failed tests (not applied to --stream)",
+    )
+    parser.add_argument(
+        "--server-diff",
+        action="store_true",
+        help="compare results in the database and download only mismatching "
+        + f"rows (up to {verdict.MAX_DIFF_ROWS} for each side). only applied to tests "
+        + "with auto_sort: true, not applied with --cache, --record or --replay",
+    )
+    parser.add_argument(
+        "--fingerprint",
+        action="store_true",
+        help="compare fingerprints of results computed in the database first, "
+        + "mismatching rows are searched only if they differ "
+        + "(implies --server-diff)",
+    )
+    parser.add_argument(
+        "--timing-report",
+        type=Path,
+        metavar="PATH",
+        help="write time spent by each phase and each test as json",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        metavar="PATH",
+        help="write phases of each test as Chrome trace event format "
+        + "(open it by chrome://tracing or https://ui.perfetto.dev)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_parse_shard,
+        metavar="I/N",
+        help="run only the I-th of N shards (from 1), balanced by --durations "
+        + "if given, otherwise by count",
+    )
+    parser.add_argument(
+        "--durations",
+        type=Path,
+        metavar="PATH",
+        help="balance --shard by durations of tests in a report written by "
+        + "`tdsql merge` (or --result-json), every shard has to be given "
+        + "the same file",
+    )
+    parser.add_argument(
+        "--result-json",
+        type=Path,
+        metavar="PATH",
+        help="write results of tests as json, "
+        + "those of shards are merged by `tdsql merge`",
+    )
+    args = parser.parse_args(argv)
+
+    return TdsqlRunConfig(
+        cache=args.cache,
+        clear_cache=args.clear_cache,
+        cache_max_bytes=args.cache_max_size,
+        cache_max_age=args.cache_max_age * 24 * 60 * 60,
+        changed_only=args.changed_only,
+        stream=args.stream,
+        arrow=args.arrow,
+        engine=args.engine,
+        max_concurrency=args.max_concurrency,
+        compare_processes=args.compare_processes,
+        compare_threshold=args.compare_threshold,
+        record=args.record,
+        replay=args.replay,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+        log_format=args.log_format,
+        log_compression=args.log_compression,
+        log_failures_only=args.log_failures_only,
+        server_diff=args.server_diff,
+        fingerprint=args.fingerprint,
+        timing_report=args.timing_report,
+        trace=args.trace,
+        shard=args.shard,
+        durations=args.durations,
+        result_json=args.result_json,
+        max_failures=args.max_failures,
+    )
+
+
+def run(yamlpath: Path, run_config: TdsqlRunConfig | None = None) -> None:
+    if run_config is None:
+        run_config = TdsqlRunConfig()
+    if run_config.arrow:
+        util.require_pyarrow("by --arrow")
+
+    timeline: Timeline | None = None
+    if run_config.timing_report is not None or run_config.trace is not None:
+        timeline = Timeline()
+        timing.activate(timeline)
+
     yamlpath = yamlpath.resolve()
-    test_config_cases = _parse_root_yaml(yamlpath)
+    with timing.span("parse_yaml"):
+        test_config_cases = _parse_root_yaml(yamlpath)
 
     for y in test_config_cases.keys():
         _make_log_dir(y.parent)
 
-    # exec query
-    with ThreadPoolExecutor(
-        max_workers=test_config_cases[yamlpath][0].max_threads
-    ) as pool:
+    cache_dir = _make_cache_dir(yamlpath.parent)
+    manifest = Manifest(cache_dir / MANIFEST_FILE_NAME, yamlpath.parent)
+    identities = {
+        manifest.identity(t) for _, tests in test_config_cases.values() for t in tests
+    }
+
+    total_count = len(identities)
+    if run_config.shard is not None:
+        durations: dict[str, float] = {}
+        if run_config.durations is not None:
+            from tdsql import report as report_
+
+            durations = report_.durations(run_config.durations)
+        test_config_cases = _select_shard(
+            test_config_cases, manifest, run_config.shard, durations
+        )
+        shard_count = sum(len(tests) for _, tests in test_config_cases.values())
+        logger.info(
+            f"{shard_count} of {total_count} tests are selected "
+            + f"as shard {run_config.shard[0]}/{run_config.shard[1]}"
+        )
+
+    skip_count = 0
+    if run_config.changed_only:
+        selected: TestConfigCases = {
+            yaml_: (config, [t for t in tests if manifest.is_affected(t, config)])
+            for yaml_, (config, tests) in test_config_cases.items()
+        }
+        skip_count = sum(len(tests) for _, tests in test_config_cases.values()) - sum(
+            len(tests) for _, tests in selected.values()
+        )
+        logger.info(f"{skip_count} tests are skipped because they are not changed")
+        test_config_cases = selected
+
+    result_cache: ResultCache | None = None
+    if run_config.cache or run_config.clear_cache:
+        from tdsql.cache import ResultCache
+
+        result_cache = ResultCache(
+            cache_dir / "results",
+            run_config.cache_max_bytes,
+            run_config.cache_max_age,
+        )
+        if run_config.clear_cache:
+            result_cache.clear()
+        if not run_config.cache:
+            result_cache = None
+
+    max_threads = test_config_cases[yamlpath][0].max_threads
+    with timing.span("dry_run"):
+        dry_run_ok = not run_config.dry_run or _dry_run(
+            test_config_cases, run_config, result_cache, max_threads
+        )
+    if not dry_run_ok:
+        logger.error("dry run failed, no query is executed")
+        sys.exit(1)
+
+    # tests whose queries took longer last time are submitted first
+    ordered, estimates = _order_by_duration(test_config_cases, manifest)
+    # durations of cached or replayed results are not recorded
+    records_seconds = not run_config.cache and run_config.replay is None
+    seconds: dict[TdsqlTestCase, list[list[float]]] = {}
+    test_seconds: dict[str, float] = {}
+    # written by --result-json
+    results: list[dict[str, Any]] = []
+
+    pass_count = 0
+    fail_count = 0
+
+    def report(
+        test: TdsqlTestCase,
+        config: TdsqlTestConfig,
+        error: TdsqlAssertionError | None,
+    ) -> None:
+        nonlocal pass_count, fail_count
+
+        duration = _sum_seconds(seconds.pop(test, []))
+        if duration is not None:
+            test_seconds[f"{test.sqlpath}_{test.id}"] = duration
+        results.append(
+            {
+                "identity": manifest.identity(test),
+                "sqlpath": Path(
+                    os.path.relpath(test.sqlpath, yamlpath.parent)
+                ).as_posix(),
+                "passed": error is None,
+                "seconds": round(duration, 3) if duration is not None else None,
+                "error": str(error) if error is not None else None,
+            }
+        )
+        if not records_seconds:
+            duration = None
+
+        if error is None:
+            pass_count += 1
+            manifest.record(test, config, passed=True, seconds=duration)
+            logger.info(f"{test.sqlpath}_{test.id}: passed")
+        else:
+            fail_count += 1
+            manifest.record(test, config, passed=False, seconds=duration)
+            logger.error(error)
+
+    scheduler: AsyncScheduler | None = None
+    if run_config.engine == "asyncio":
+        from tdsql.scheduler import AsyncScheduler
+
+        scheduler = AsyncScheduler(max_threads, run_config.max_concurrency)
+
+    comparison_pool: ComparisonPool | None = None
+    if run_config.compare_processes > 0:
+        from tdsql import parallel
+
+        comparison_pool = parallel.ComparisonPool(
+            run_config.compare_processes, run_config.compare_threshold
+        )
+
+    writer = LogWriter(run_config.log_format, run_config.log_compression)
+    # clients whose running queries are cancelled by --max-failures
+    clients: dict[str, BaseClient] = {}
+    stopped = False
+    started = perf_counter()
+
+    # exec query and compare results as soon as both of them are available
+    done: Queue[Future[Any]] = Queue()
+    with ThreadPoolExecutor(max_workers=max_threads) as pool:
+        # tests which need the result of each future
         futures: dict[
-            tuple[int, Literal["actual", "expected"]], Future[pd.DataFrame]
+            Future[pd.DataFrame],
+            list[tuple[Path, TdsqlTestConfig, TdsqlTestCase, ResultKind]],
         ] = {}
+        # tests which are compared outside of this loop
+        # (batch by batch in the pool or in the process pool)
+        compare_futures: dict[Future[None], tuple[TdsqlTestConfig, TdsqlTestCase]] = {}
+        # identical queries are executed only once
+        submitted: dict[tuple[Any, ...], Future[pd.DataFrame]] = {}
+        dedup_count = 0
+        # durations of queries (or comparison in the pool), filled when finished
+        query_seconds: dict[tuple[Any, ...], list[float]] = {}
+
+        batcher: QueryBatcher | None = None
+        if run_config.batch_size > 0:
+            from tdsql import batch
 
-        for config, tests in test_config_cases.values():
-            for t in tests:
-                client_ = client.get_client(config.database)
-                futures[(t.id, "actual")] = pool.submit(
-                    client_.select, t.actual_sql, config
+            batcher = batch.QueryBatcher(pool, run_config.batch_size, run_config.arrow)
+
+        compare_in_database = run_config.server_diff or run_config.fingerprint
+        if compare_in_database:
+            from tdsql import server_diff
+
+        for yaml_, config, t in ordered:
+            log_dir = yaml_.parent / LOG_DIR_NAME
+            client_ = _get_client(config, run_config, result_cache)
+            clients.setdefault(config.database, client_)
+            queries: list[tuple[ResultKind, str]] = [
+                ("actual", t.actual_sql),
+                ("expected", t.expected_sql),
+            ]
+            stream = run_config.stream and not config.auto_sort
+            # --log-failures-only is not applied to --stream
+            if stream or not run_config.log_failures_only:
+                writer.write_queries(t, log_dir)
+
+            if stream:
+                stream_future = pool.submit(
+                    timing.timed(
+                        "compare_stream",
+                        label_of(t),
+                        _measure(_compare_stream, _new_cell(seconds, t)),
+                    ),
+                    t,
+                    config,
+                    client_,
+                    log_dir,
                 )
-                futures[(t.id, "expected")] = pool.submit(
-                    client_.select, t.expected_sql, config
+                compare_futures[stream_future] = (config, t)
+                stream_future.add_done_callback(done.put)
+                continue
+
+            if compare_in_database and server_diff.accepts(client_, config):
+                diff_future = pool.submit(
+                    timing.timed(
+                        "server_diff",
+                        label_of(t),
+                        _measure(server_diff.compare, _new_cell(seconds, t)),
+                    ),
+                    t,
+                    config,
+                    client_,
+                    log_dir,
+                    run_config,
                 )
+                compare_futures[diff_future] = (config, t)
+                diff_future.add_done_callback(done.put)
+                continue
 
-        for yaml_, (config, tests) in test_config_cases.items():
-            for t in tests:
-                log_dir = yaml_.parent / LOG_DIR_NAME
+            for kind, sql in queries:
+                key = (*config.job_key(), util.strip_sql(sql))
+                future = submitted.get(key)
+                if future is None:
+                    if batcher is not None and batcher.accepts(client_, config):
+                        future = batcher.add(client_, sql, config)
+                    else:
+                        future = _submit_query(
+                            pool,
+                            scheduler,
+                            client_,
+                            sql,
+                            config,
+                            run_config.arrow,
+                            label_of(t),
+                            query_seconds.setdefault(key, []),
+                        )
+                    submitted[key] = future
+                    futures[future] = []
+                    future.add_done_callback(done.put)
+                else:
+                    dedup_count += 1
+                futures[future].append((log_dir, config, t, kind))
+                # deduplicated queries are counted for each test
+                seconds.setdefault(t, []).append(query_seconds.setdefault(key, []))
 
+        if batcher is not None:
+            batcher.flush()
+            logger.info(
+                f"{batcher.query_count} queries were fused "
+                + f"into {batcher.job_count} query jobs"
+            )
+
+        # do not keep futures (and results) after they are consumed
+        submitted.clear()
+        query_seconds.clear()
+
+        while len(futures) + len(compare_futures) > 0:
+            if 0 < run_config.max_failures <= fail_count:
+                stopped = True
+                _stop(pool, [*futures, *compare_futures], clients.values())
+                break
+
+            # futures are popped to release results after comparison
+            future = done.get()
+
+            if future in compare_futures:
+                config, t = compare_futures.pop(future)
                 try:
-                    util.write(
-                        log_dir / f"{t.sqlpath.stem}_{t.id}_actual.sql", t.actual_sql
+                    future.result()
+                    report(t, config, None)
+                except TdsqlAssertionError as e:
+                    report(t, config, e)
+                continue
+
+            for log_dir, config, t, kind in futures.pop(future):
+                _store_result(t, kind, future)
+                if t.actual_sql_result is None or t.expected_sql_result is None:
+                    continue
+
+                compare_future = None
+                if comparison_pool is not None and comparison_pool.is_large(t):
+                    compare_future = comparison_pool.submit(
+                        t, config, log_dir, run_config
                     )
-                    actual = futures[(t.id, "actual")].result()
-                    actual.to_csv(
-                        log_dir / f"{t.sqlpath.stem}_{t.id}_actual.csv", index=False
+                if compare_future is not None:
+                    compare_futures[compare_future] = (config, t)
+                    compare_future.add_done_callback(
+                        partial(timing.record, "process_compare", perf_counter())
                     )
-                    t.actual_sql_result = actual
-                except Exception as e:
-                    t.actual_sql_result = e
+                    compare_future.add_done_callback(done.put)
+                    continue
 
+                actual = t.actual_sql_result
+                expected = t.expected_sql_result
+                error: TdsqlAssertionError | None = None
                 try:
-                    util.write(
-                        log_dir / f"{t.sqlpath.stem}_{t.id}_expected.sql",
-                        t.expected_sql,
-                    )
-                    expected = futures[(t.id, "expected")].result()
-                    expected.to_csv(
-                        log_dir / f"{t.sqlpath.stem}_{t.id}_expected.csv",
-                        index=False,
-                    )
-                    t.expected_sql_result = expected
-                except Exception as e:
-                    t.expected_sql_result = e
+                    with timing.span("compare", label_of(t)):
+                        verdict.compare_results(t, config)
+                except TdsqlAssertionError as e:
+                    error = e
+                finally:
+                    # results are released after they are written
+                    t.actual_sql_result = None
+                    t.expected_sql_result = None
 
-    # compare results
-    pass_count = 0
-    fail_count = 0
-    errors: list[TdsqlAssertionError] = []
+                report(t, config, error)
+                if error is not None or not run_config.log_failures_only:
+                    if run_config.log_failures_only:
+                        writer.write_queries(t, log_dir)
+                    writer.write_results(t, log_dir, actual, expected)
+                del actual, expected
 
-    for config, tests in test_config_cases.values():
-        for t in tests:
-            try:
-                _compare_results(t, config)
-                pass_count += 1
-            except TdsqlAssertionError as e:
-                errors.append(e)
-                fail_count += 1
+    elapsed = perf_counter() - started
+    writer.close()
+
+    if comparison_pool is not None:
+        comparison_pool.shutdown(cancel=stopped)
+
+    if scheduler is not None:
+        scheduler.shutdown()
+        logger.info(f"concurrency limit reached {scheduler.limiter.peak}")
 
-    for err in errors:
-        logger.error(err)
+    manifest.save(identities)
+    logger.info(f"{dedup_count} query jobs were saved by deduplication")
+    _report_critical_path(estimates, max_threads, test_seconds, elapsed)
+
+    if result_cache is not None:
+        result_cache.evict()
+        logger.info(f"cache: {result_cache.hits} hits, {result_cache.misses} misses")
+
+    if timeline is not None:
+        timing.activate(None)
+        if run_config.timing_report is not None:
+            timeline.write_report(run_config.timing_report)
+            logger.info(f"timing report is written to {run_config.timing_report}")
+        if run_config.trace is not None:
+            timeline.write_trace(run_config.trace)
+            logger.info(f"trace is written to {run_config.trace}")
+
+    if run_config.result_json is not None:
+        from tdsql import report as report_
+
+        report_.write(
+            run_config.result_json,
+            results,
+            total_count,
+            skip_count,
+            elapsed,
+            run_config.shard,
+        )
+        logger.info(f"results are written to {run_config.result_json}")
 
     logger.info(f"{pass_count} tests passed, {fail_count} tests failed")
+    if stopped:
+        logger.error(
+            f"stopped after {fail_count} failures, "
+            + f"{len(ordered) - pass_count - fail_count} tests were not run"
+        )
 
     if fail_count > 0:
         sys.exit(1)
 
 
+def _dry_run(
+    test_config_cases: TestConfigCases,
+    run_config: TdsqlRunConfig,
+    result_cache: ResultCache | None,
+    max_threads: int,
+) -> bool:
+    """Dry-run all queries concurrently.
+
+    Return False if any of them is invalid or exceeds max_bytes_billed.
+    """
+    ok = True
+    unsupported: set[str] = set()
+
+    with ThreadPoolExecutor(max_workers=max_threads) as pool:
+        # identical queries are validated only once
+        submitted: dict[tuple[Any, ...], Future[int]] = {}
+        tests: list[tuple[TdsqlTestConfig, TdsqlTestCase, list[Future[int]]]] = []
+
+        for config, tests_ in test_config_cases.values():
+            for t in tests_:
+                client_ = _get_client(config, run_config, result_cache)
+                futures: list[Future[int]] = []
+                for sql in (t.actual_sql, t.expected_sql):
+                    key = (*config.job_key(), util.strip_sql(sql))
+                    if key not in submitted:
+                        submitted[key] = pool.submit(client_.dry_run, sql, config)
+                    futures.append(submitted[key])
+                tests.append((config, t, futures))
+
+        for config, t, futures in tests:
+            estimates: list[int] = []
+            for sql, future in zip((t.actual_sql, t.expected_sql), futures):
+                try:
+                    estimates.append(future.result())
+                except NotImplementedError:
+                    if config.database not in unsupported:
+                        logger.warning(f"{config.database} does not support dry run")
+                        unsupported.add(config.database)
+                    break
+                except Exception as e:
+                    ok = False
+                    logger.error(f"{t.sqlpath}_{t.id}: invalid query\n{sql}\n{e}")
+                    break
+
+                if estimates[-1] > config.max_bytes_billed:
+                    ok = False
+                    logger.error(
+                        f"{t.sqlpath}_{t.id}: {estimates[-1]} bytes will be processed "
+                        + f"but max_bytes_billed is {config.max_bytes_billed}\n{sql}"
+                    )
+                    break
+
+            else:
+                logger.info(
+                    f"{t.sqlpath}_{t.id}: {estimates[0]} (actual), "
+                    + f"{estimates[1]} (expected) bytes will be processed"
+                )
+
+    return ok
+
+
+def _stop(
+    pool: ThreadPoolExecutor,
+    futures: list[Future[Any]],
+    clients: Iterable[BaseClient],
+) -> None:
+    """Cancel futures which have not started and query jobs which are running."""
+    pool.shutdown(wait=False, cancel_futures=True)
+    for future in futures:
+        future.cancel()
+    for client_ in clients:
+        client_.cancel()
+
+
+def _get_client(
+    config: TdsqlTestConfig,
+    run_config: TdsqlRunConfig,
+    result_cache: ResultCache | None,
+) -> BaseClient:
+    client_: BaseClient
+    if run_config.replay is not None:
+        from tdsql.cassette import ReplayClient
+
+        client_ = ReplayClient(run_config.replay)
+    else:
+        client_ = client.get_client(config.database)
+
+    if run_config.record is not None:
+        from tdsql.cassette import RecordingClient
+
+        client_ = RecordingClient(client_, run_config.record)
+
+    if result_cache is not None:
+        from tdsql.cache import CachedClient
+
+        client_ = CachedClient(client_, result_cache)
+
+    return client_
+
+
+def _submit_query(
+    pool: ThreadPoolExecutor,
+    scheduler: AsyncScheduler | None,
+    client_: BaseClient,
+    sql: str,
+    config: TdsqlTestConfig,
+    arrow: bool,
+    label: str = "",
+    seconds: list[float] | None = None,
+) -> Future[Any]:
+    """Submit the query, its duration is appended to `seconds` when it finishes."""
+    if seconds is None:
+        seconds = []
+
+    if scheduler is not None and client_.supports_async:
+        future = scheduler.submit(client_, sql, config, arrow)
+        # including the time waiting for concurrency limit
+        future.add_done_callback(partial(_record_query, perf_counter(), label, seconds))
+        return future
+
+    select = client_.select_arrow if arrow else client_.select
+    return pool.submit(
+        timing.timed("query", label, _measure(select, seconds)), sql, config
+    )
+
+
+def _record_query(
+    start: float, label: str, seconds: list[float], _: Future[Any]
+) -> None:
+    seconds.append(perf_counter() - start)
+    timing.record("query", start, label)
+
+
+def _measure(func: Callable[..., T], seconds: list[float]) -> Callable[..., T]:
+    """Wrap the function so that its duration is appended to `seconds`."""
+
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds.append(perf_counter() - start)
+
+    return wrapper
+
+
+def _new_cell(
+    seconds: dict[TdsqlTestCase, list[list[float]]], test: TdsqlTestCase
+) -> list[float]:
+    cell: list[float] = []
+    seconds.setdefault(test, []).append(cell)
+    return cell
+
+
+def _sum_seconds(cells: list[list[float]]) -> float | None:
+    """Duration of a test, None if none of its queries is measured (e.g. batched)."""
+    if all(len(c) == 0 for c in cells):
+        return None
+    return sum(sum(c) for c in cells)
+
+
+def _order_by_duration(
+    test_config_cases: TestConfigCases, manifest: Manifest
+) -> tuple[list[tuple[Path, TdsqlTestConfig, TdsqlTestCase]], list[float]]:
+    """Order tests longest first by durations in the previous runs.
+
+    Estimated durations are also returned, tests are kept in the order
+    of definition if nothing is known.
+    """
+    from tdsql import plan
+
+    tests = [
+        (yaml_, config, t)
+        for yaml_, (config, tests_) in test_config_cases.items()
+        for t in tests_
+    ]
+    known = [manifest.seconds(t, config) for _, config, t in tests]
+    if all(s is None for s in known):
+        return tests, []
+
+    estimates = plan.estimate(known)
+    order = plan.lpt_order(estimates)
+    return [tests[i] for i in order], [estimates[i] for i in order]
+
+
+def _select_shard(
+    test_config_cases: TestConfigCases,
+    manifest: Manifest,
+    shard: tuple[int, int],
+    durations: dict[str, float],
+) -> TestConfigCases:
+    """Tests of the shard, balanced by `durations` if any of them is known.
+
+    Tests are identified by `Manifest.identity()`. The manifest of each
+    machine is not used, so that every machine gets the same partition
+    as long as they are given the same durations (see `--durations`).
+    """
+    from tdsql import plan
+
+    tests = [
+        (config, t) for config, tests_ in test_config_cases.values() for t in tests_
+    ]
+    keys = [manifest.identity(t) for _, t in tests]
+    known = [durations.get(k) for k in keys]
+    if all(s is None for s in known):
+        estimates = [1.0] * len(tests)  # balanced by count
+    else:
+        estimates = plan.estimate(known)
+
+    shards = plan.partition(estimates, keys, shard[1])
+    selected = {t for (_, t), s in zip(tests, shards) if s == shard[0] - 1}
+    return {
+        yaml_: (config, [t for t in tests_ if t in selected])
+        for yaml_, (config, tests_) in test_config_cases.items()
+    }
+
+
+def _parse_shard(text: str) -> tuple[int, int]:
+    match_ = re.fullmatch(r"([0-9]+)/([0-9]+)", text)
+    if match_ is None:
+        raise argparse.ArgumentTypeError(f"expected I/N but got {text}")
+
+    index, count = int(match_.group(1)), int(match_.group(2))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            f"shard should be 1 to {count} but got {index}"
+        )
+    return index, count
+
+
+def _report_critical_path(
+    estimates: list[float],
+    max_threads: int,
+    test_seconds: dict[str, float],
+    elapsed: float,
+) -> None:
+    """Compare the expected duration of the run with the actual one."""
+    from tdsql import plan
+
+    if len(estimates) > 0:
+        logger.info(
+            f"expected critical path {plan.makespan(estimates, max_threads):.1f}s "
+            + f"(by durations of the previous runs), actual {elapsed:.1f}s"
+        )
+    if len(test_seconds) > 0:
+        label, longest = max(test_seconds.items(), key=lambda kv: kv[1])
+        logger.info(f"the longest test is {label} ({longest:.1f}s)")
+
+
+def _store_result(test: TdsqlTestCase, kind: ResultKind, future: Future[Any]) -> None:
+    result: Any
+    try:
+        result = future.result()
+    except Exception as e:
+        result = e
+
+    if kind == "actual":
+        test.actual_sql_result = result
+    else:
+        test.expected_sql_result = result
+
+
+def _load_yaml(yamlpath: Path) -> dict[str, Any]:
+    yamldict: dict[str, Any] = yaml.load(util.read(yamlpath), Loader=YAML_LOADER)
+    return yamldict
+
+
 def _detect_test_config(
-    yamlpath: Path, parent_config: TdsqlTestConfig | None = None
+    yamlpath: Path,
+    parent_config: TdsqlTestConfig | None = None,
+    yamldict: dict[str, Any] | None = None,
 ) -> TdsqlTestConfig:
-    yamldict = yaml.safe_load(util.read(yamlpath))
+    if yamldict is None:
+        yamldict = _load_yaml(yamlpath)
     kwargs: dict[str, Any] = {}
 
     for f in fields(TdsqlTestConfig):
@@ -138,193 +977,197 @@ def _detect_test_config(
             except ValueError:
                 kwargs[f.name] = f.type(eval(val))
 
+    # relative to the yaml file which declares it (like filepath)
+    if yamldict.get("credentials"):
+        kwargs["credentials"] = str(
+            (yamlpath.parent / Path(kwargs["credentials"]).expanduser()).resolve()
+        )
+
     return TdsqlTestConfig(**kwargs)
 
 
-def _detect_test_cases(yamlpath: Path) -> list[TdsqlTestCase]:
-    yamldict = yaml.safe_load(util.read(yamlpath))
+def _detect_test_cases(
+    yamlpath: Path,
+    yamldict: dict[str, Any] | None = None,
+    indexes: dict[Path, SqlIndex] | None = None,
+) -> list[TdsqlTestCase]:
+    if yamldict is None:
+        yamldict = _load_yaml(yamlpath)
     tests = yamldict.get("tests", [])
 
-    return [
-        TdsqlTestCase(
+    res: list[TdsqlTestCase] = []
+    for i, t in enumerate(tests):
+        start = perf_counter()
+        test = TdsqlTestCase(
             (yamlpath.parent / t["filepath"]).resolve(),
             t.get("replace", {}),
             t["expected"],
+            yamlpath=yamlpath,
+            index=i,
+            indexes=indexes,
         )
-        for t in tests
-    ]
+        timing.record("render", start, label_of(test))
+        res.append(test)
 
+    return res
 
-def _compare_results(test: TdsqlTestCase, config: TdsqlTestConfig) -> None:
-    if test.actual_sql_result is None or test.expected_sql_result is None:
-        raise TdsqlInternalError()
 
-    if isinstance(test.actual_sql_result, Exception):
-        raise TdsqlAssertionError(
-            f"{test.sqlpath}_{test.id}: invalid query\n"
-            + f"{test.actual_sql}\n{test.expected_sql_result}"
-        )
+def _compare_stream(
+    test: TdsqlTestCase,
+    config: TdsqlTestConfig,
+    client_: BaseClient,
+    log_dir: Path,
+) -> None:
+    """Compare results batch by batch and stop fetching at the first mismatch.
 
-    elif isinstance(test.expected_sql_result, Exception):
-        raise TdsqlAssertionError(
-            f"{test.sqlpath}_{test.id}: invalid query\n"
-            + f"{test.expected_sql}\n{test.expected_sql_result}"
-        )
+    Only available when the order of rows is defined (auto_sort is false).
+    """
+    actual_batches = _fetch_batches(test, "actual", client_, config, log_dir)
+    expected_batches = _fetch_batches(test, "expected", client_, config, log_dir)
 
-    if config.auto_sort:
-        test.actual_sql_result.sort_values(
-            by=list(test.actual_sql_result.columns.values),
-            inplace=True,
-            ignore_index=True,
-        )
-        test.expected_sql_result.sort_values(
-            by=list(test.expected_sql_result.columns.values),
-            inplace=True,
-            ignore_index=True,
-        )
+    try:
+        # clients yield at least one batch
+        actual: pd.DataFrame | None = next(actual_batches, None)
+        expected: pd.DataFrame | None = next(expected_batches, None)
+        if actual is None or expected is None:
+            raise TdsqlInternalError(f"{test.sqlpath}_{test.id}: no batch is returned")
 
-    if config.ignore_column_name:
-        actual_ncol = len(test.actual_sql_result.columns)
-        expected_ncol = len(test.expected_sql_result.columns)
+        verdict.check_columns(test, actual, expected, config)
+        columns = list(actual.columns.values)
 
-        if actual_ncol != expected_ncol:
-            raise TdsqlAssertionError(
-                f"{test.sqlpath}_{test.id}: number of columns does not match\n"
-                + f"actual: {actual_ncol}, expected {expected_ncol}"
-            )
+        offset = 0
+        while actual is not None and expected is not None:
+            if not config.ignore_column_name:
+                expected = expected[columns]
 
-    else:
-        actual_column_set = set(test.actual_sql_result.columns.values)
-        expected_column_set = set(test.expected_sql_result.columns.values)
+            nrow = min(actual.shape[0], expected.shape[0])
+            verdict.check_values(
+                test, actual.iloc[:nrow], expected.iloc[:nrow], config, offset
+            )
+            offset += nrow
+            actual = actual.iloc[nrow:]
+            expected = expected.iloc[nrow:]
 
-        actual_only_set = actual_column_set - expected_column_set
-        expected_only_set = expected_column_set - actual_column_set
+            if actual.shape[0] == 0:
+                actual = next(actual_batches, None)
+            if expected.shape[0] == 0:
+                expected = next(expected_batches, None)
 
-        if len(actual_only_set) > 0:
+        if actual is not None and (
+            actual.shape[0] > 0 or any(b.shape[0] > 0 for b in actual_batches)
+        ):
             raise TdsqlAssertionError(
                 f"{test.sqlpath}_{test.id}: "
-                + f"{actual_only_set} only exsists in actual result"
+                + "actual result is longer than expected result"
             )
-        elif len(expected_only_set) > 0:
+        elif expected is not None and (
+            expected.shape[0] > 0 or any(b.shape[0] > 0 for b in expected_batches)
+        ):
             raise TdsqlAssertionError(
                 f"{test.sqlpath}_{test.id}: "
-                + f"{expected_only_set} only exsists in expected result"
+                + "expected result is longer than actual result"
             )
 
-    for i in range(
-        min(test.actual_sql_result.shape[0], test.expected_sql_result.shape[0])
-    ):
-        if config.ignore_column_name:
-            for c in range(test.actual_sql_result.shape[1]):
-                actual_value = test.actual_sql_result.iloc[i, c]
-                expected_value = test.expected_sql_result.iloc[i, c]
-                if not _is_equal(
-                    actual_value,
-                    expected_value,
-                    config.acceptable_error,
-                ):
-                    raise TdsqlAssertionError(
-                        f"{test.sqlpath}_{test.id}: value does not match "
-                        + f"at line: {i+1}, column: {c+1}\n"
-                        + f"actual: {actual_value}, expected: {expected_value}"
-                    )
+    finally:
+        # stop fetching the rest of results
+        actual_batches.close()
+        expected_batches.close()
 
-        else:
-            for c in test.actual_sql_result.columns.values:
-                actual_value = test.actual_sql_result[c][i]
-                expected_value = test.expected_sql_result[c][i]
-                if not _is_equal(
-                    actual_value,
-                    expected_value,
-                    config.acceptable_error,
-                ):
-                    raise TdsqlAssertionError(
-                        f"{test.sqlpath}_{test.id}: value does not match "
-                        + f"at line: {i+1}, column: {c}\n"
-                        + f"actual: {actual_value}, expected: {expected_value}"
-                    )
 
-    if test.actual_sql_result.shape[0] > test.expected_sql_result.shape[0]:
-        raise TdsqlAssertionError(
-            f"{test.sqlpath}_{test.id}: actual result is longer than expected result"
-        )
-    elif test.actual_sql_result.shape[0] < test.expected_sql_result.shape[0]:
+def _fetch_batches(
+    test: TdsqlTestCase,
+    kind: ResultKind,
+    client_: BaseClient,
+    config: TdsqlTestConfig,
+    log_dir: Path,
+) -> Generator[pd.DataFrame, None, None]:
+    sql = test.actual_sql if kind == "actual" else test.expected_sql
+    csvpath = Path(f"{log_writer.log_stem(test, log_dir, kind)}.csv")
+
+    try:
+        for i, batch in enumerate(client_.select_batches(sql, config)):
+            batch.to_csv(
+                csvpath, index=False, mode="w" if i == 0 else "a", header=i == 0
+            )
+            yield batch
+    except Exception as e:
         raise TdsqlAssertionError(
-            f"{test.sqlpath}_{test.id}: expected result is longer than actual result"
-        )
+            f"{test.sqlpath}_{test.id}: invalid query\n{sql}\n{e}"
+        ) from e
+
+
+def _make_cache_dir(dir_: Path) -> Path:
+    cache_dir = dir_ / CACHE_DIR_NAME
+    util.write(cache_dir / ".gitignore", "# created by tdsql\n*")
+    return cache_dir
 
 
 def _make_log_dir(dir_: Path) -> Path:
     result_dir = dir_ / LOG_DIR_NAME
-    shutil.rmtree(result_dir, ignore_errors=True)
-    util.write(result_dir / ".gitignore", "# created by tdsql\n*")
+    log_writer.make_log_dir(result_dir)
     return result_dir
 
 
-def _is_equal(actual: Any, expected: Any, acceptable_error: float) -> bool:
-    res: bool
+def _parse_root_yaml(root_yaml: Path) -> TestConfigCases:
+    root_yaml = root_yaml.resolve()
+    yamldicts: dict[Path, dict[str, Any]] = {root_yaml: _load_yaml(root_yaml)}
+    childs: dict[Path, list[Path]] = {}
 
-    if type(actual) != type(expected):
-        res = False
+    # each yaml file is loaded once, those of the same level concurrently
+    with ThreadPoolExecutor(max_workers=YAML_LOAD_THREADS) as pool:
+        level = [root_yaml]
+        while len(level) > 0:
+            expanded = pool.map(lambda y: _expand_source(y, yamldicts[y]), level)
 
-    elif pd.isna(actual):
-        res = pd.isna(expected)
+            next_level: list[Path] = []
+            found: set[Path] = set()
+            for yaml_, expanded_childs in zip(level, expanded):
+                for ec in expanded_childs:
+                    if ec in yamldicts or ec in found:
+                        raise InvalidInputError(f"{yaml_}: detected circular reference")
+                    next_level.append(ec)
+                    found.add(ec)
+                childs[yaml_] = expanded_childs
 
-    elif isinstance(actual, float):
-        res = (
-            expected * (1 - acceptable_error)
-            <= actual
-            <= expected * (1 + acceptable_error)
-        )
+            yamldicts.update(zip(next_level, pool.map(_load_yaml, next_level)))
+            level = next_level
 
-    else:
-        res = actual == expected
+    # configs are inherited and tests are rendered in the order of definition
+    result: TestConfigCases = {}
+    # each sql file is read and indexed once while parsing
+    indexes: dict[Path, SqlIndex] = {}
 
-    return res
+    def _detect(yaml_: Path, parent_config: TdsqlTestConfig | None) -> None:
+        config = _detect_test_config(yaml_, parent_config, yamldicts[yaml_])
+        result[yaml_] = (config, _detect_test_cases(yaml_, yamldicts[yaml_], indexes))
+        for ec in childs[yaml_]:
+            _detect(ec, config)
+
+    _detect(root_yaml, None)
+    return result
 
 
-def _parse_root_yaml(root_yaml: Path) -> TestConfigCases:
-    root_yaml = root_yaml.resolve()
-    result: TestConfigCases = {
-        root_yaml: (
-            _detect_test_config(root_yaml),
-            _detect_test_cases(root_yaml),
-        )
-    }
+def _expand_source(yaml_: Path, yamldict: dict[str, Any]) -> list[Path]:
+    """Resolve `source` of the yaml file into paths of child yaml files."""
+    raw_childs = yamldict.get("source", [])
 
-    def _parse_yaml(yaml_: Path) -> None:
-        yamldict = yaml.safe_load(util.read(yaml_))
-        raw_childs = yamldict.get("source", [])
-
-        if raw_childs is None:
-            return
-        if not isinstance(raw_childs, list):
-            raw_childs = [raw_childs]
-
-        expanded_childs = []
-        for rc in raw_childs:
-            if not isinstance(rc, str):
-                raise InvalidInputError(f"{yaml_}: expected str but got {rc}")
-
-            matches = glob.glob(rc, root_dir=yaml_.parent)
-            if len(matches) == 0:
-                logger.warning(f"{yaml_}: {rc} was not found")
-            expanded_childs.extend([Path(m) for m in matches])
-
-        expanded_childs = [
-            (yaml_.parent / ec).resolve()
-            for ec in expanded_childs
-            if (yaml_.parent / ec).resolve() != yaml_
-        ]
-        for ec in expanded_childs:
-            if result.get(ec) is not None:
-                raise InvalidInputError(f"{yaml_}: detected circular reference")
-
-            result[ec] = (
-                _detect_test_config(ec, result[yaml_][0]),
-                _detect_test_cases(ec),
-            )
-            _parse_yaml(ec)
+    if raw_childs is None:
+        return []
+    if not isinstance(raw_childs, list):
+        raw_childs = [raw_childs]
 
-    _parse_yaml(root_yaml)
-    return result
+    expanded_childs = []
+    for rc in raw_childs:
+        if not isinstance(rc, str):
+            raise InvalidInputError(f"{yaml_}: expected str but got {rc}")
+
+        matches = glob.glob(rc, root_dir=yaml_.parent)
+        if len(matches) == 0:
+            logger.warning(f"{yaml_}: {rc} was not found")
+        expanded_childs.extend([Path(m) for m in matches])
+
+    return [
+        (yaml_.parent / ec).resolve()
+        for ec in expanded_childs
+        if (yaml_.parent / ec).resolve() != yaml_
+    ]
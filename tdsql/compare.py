@@ -0,0 +1,345 @@
+from typing import Any, Final
+import itertools
+
+import numpy as np
+import pandas as pd
+
+_HASH_MULTIPLIER: Final[np.uint64] = np.uint64(1_000_003)
+# see _float_buckets(), values within the error are in the neighbouring
+# buckets only if the error is less than (sqrt(5) - 1) / 2
+_MIN_BUCKET_WIDTH: Final[float] = 1.0e-9
+_MAX_BUCKETED_ERROR: Final[float] = 0.5
+_MAX_PROBE_COLUMNS: Final[int] = 2
+
+
+def is_equal(actual: Any, expected: Any, acceptable_error: float) -> bool:
+    res: bool
+
+    if type(actual) is not type(expected):
+        res = False
+
+    elif pd.isna(actual):
+        res = pd.isna(expected)
+
+    elif isinstance(actual, float):
+        res = bool(
+            within_error(np.float64(actual), np.float64(expected), acceptable_error)
+        )
+
+    else:
+        res = actual == expected
+
+    return res
+
+
+def find_first_mismatch(
+    actual: pd.DataFrame, expected: pd.DataFrame, acceptable_error: float
+) -> tuple[int, int] | None:
+    """Return (row, column) of the first mismatching cell in row-major order.
+
+    Both DataFrames must have the same shape and their columns must already be
+    aligned by position. Each column is compared at once
+    and later columns are only checked above the best row found so far.
+    """
+    if actual.shape != expected.shape:
+        raise ValueError(f"shape does not match: {actual.shape}, {expected.shape}")
+
+    nrow = actual.shape[0]
+    first: tuple[int, int] | None = None
+
+    for c in range(actual.shape[1]):
+        limit = nrow if first is None else first[0]
+        if limit == 0:
+            break
+
+        mismatch = column_mismatch(
+            actual.iloc[:limit, c], expected.iloc[:limit, c], acceptable_error
+        )
+        if mismatch.any():
+            # first[0] is always greater than this row
+            # because only rows above it are checked
+            first = (int(mismatch.argmax()), c)
+
+    return first
+
+
+def column_mismatch(
+    actual: pd.Series, expected: pd.Series, acceptable_error: float
+) -> np.ndarray:
+    """Return a boolean mask which is True where `is_equal()` is False."""
+    if len(actual) != len(expected):
+        raise ValueError(f"length does not match: {len(actual)}, {len(expected)}")
+
+    if actual.dtype == expected.dtype and _is_vectorizable(actual.dtype):
+        actual_na = np.asarray(actual.isna(), dtype=bool)
+        expected_na = np.asarray(expected.isna(), dtype=bool)
+
+        if pd.api.types.is_float_dtype(actual.dtype):
+            value_equal = within_error(
+                actual.to_numpy(dtype="float64", na_value=np.nan),
+                expected.to_numpy(dtype="float64", na_value=np.nan),
+                acceptable_error,
+            )
+        else:
+            value_equal = _to_bool(actual.array == expected.array)
+
+        equal = (actual_na & expected_na) | (~actual_na & ~expected_na & value_equal)
+        return np.asarray(~equal, dtype=bool)
+
+    if _is_numpy_number(actual.dtype) and _is_numpy_number(expected.dtype):
+        # type of each value always differs
+        return np.ones(len(actual), dtype=bool)
+
+    # fallback for object columns (e.g. STRUCT or ARRAY) and mixed types
+    return np.fromiter(
+        (
+            not is_equal(a, e, acceptable_error)
+            for a, e in zip(actual.array, expected.array)
+        ),
+        dtype=bool,
+        count=len(actual),
+    )
+
+
+def within_error(actual: Any, expected: Any, acceptable_error: float) -> Any:
+    """True where |actual - expected| <= |expected| * acceptable_error.
+
+    Infinities are only equal to themselves and NaN is not equal to anything.
+    """
+    with np.errstate(invalid="ignore", over="ignore"):
+        return (actual == expected) | (
+            np.isfinite(expected)
+            & (np.abs(actual - expected) <= np.abs(expected) * acceptable_error)
+        )
+
+
+def diff_multiset(
+    actual: pd.DataFrame, expected: pd.DataFrame, acceptable_error: float
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Compare rows ignoring their order.
+
+    Returns rows which only exist in actual and rows which only exist in
+    expected (duplicated rows are counted). Columns must already be aligned by
+    position. Each row is hashed in linear time, float columns are bucketed so
+    that values in the same bucket are within `acceptable_error`.
+    """
+    if actual.shape[1] != expected.shape[1]:
+        raise ValueError(
+            f"number of columns does not match: {actual.shape[1]}, {expected.shape[1]}"
+        )
+
+    actual_hash = _hash_rows(actual, acceptable_error)
+    expected_hash = _hash_rows(expected, acceptable_error)
+
+    actual_only = actual.iloc[_surplus(actual_hash, expected_hash)]
+    expected_only = expected.iloc[_surplus(expected_hash, actual_hash)]
+
+    if len(actual_only) == 0 or len(expected_only) == 0 or acceptable_error == 0:
+        return actual_only, expected_only
+
+    # values near the border of buckets are within acceptable_error
+    # but they may be hashed differently
+    return _match_residual(actual_only, expected_only, acceptable_error)
+
+
+def _hash_rows(df: pd.DataFrame, acceptable_error: float) -> np.ndarray:
+    res = np.zeros(df.shape[0], dtype=np.uint64)
+
+    with np.errstate(over="ignore"):
+        for c in range(df.shape[1]):
+            res = res * _HASH_MULTIPLIER ^ _hash_column(df.iloc[:, c], acceptable_error)
+
+    return res
+
+
+def _hash_column(col: pd.Series, acceptable_error: float) -> np.ndarray:
+    # values of different types should not be equal (see `is_equal()`)
+    dtype = col.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        tag = "bool"
+    elif pd.api.types.is_integer_dtype(dtype):
+        tag = "int"
+    elif pd.api.types.is_float_dtype(dtype):
+        tag = "float"
+    else:
+        tag = "other"
+
+    if tag == "float" and acceptable_error > 0:
+        hashed = _hash_float_buckets(
+            col.to_numpy(dtype="float64", na_value=np.nan), acceptable_error
+        )
+    else:
+        try:
+            hashed = pd.util.hash_pandas_object(col, index=False).to_numpy()
+        except TypeError:
+            # unhashable values such as dict (STRUCT) or ndarray (ARRAY)
+            hashed = pd.util.hash_pandas_object(
+                col.map(lambda x: f"{type(x).__name__}:{x!r}"), index=False
+            ).to_numpy()
+
+    tag_hash = pd.util.hash_array(np.array([tag], dtype=object))[0]
+    return np.asarray(hashed ^ tag_hash, dtype=np.uint64)
+
+
+def _hash_float_buckets(values: np.ndarray, acceptable_error: float) -> np.ndarray:
+    """Hash values whose ratio is within 1 + acceptable_error into the same bucket.
+
+    0, NaN and infinities are hashed as they are.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bucket = np.floor(np.log(np.abs(values)) / np.log1p(acceptable_error))
+    # buckets of too small acceptable_error do not fit in int64,
+    # such values are matched by _match_residual() instead
+    bucketed = np.isfinite(bucket) & (np.abs(bucket) < 2.0**60)
+    # the bucket is an exact integer, the sign is kept in the lowest bits
+    key = np.where(bucketed, bucket, 0).astype("int64") * 3 + np.sign(
+        np.where(bucketed, values, 0)
+    ).astype("int64")
+    return np.asarray(
+        np.where(bucketed, pd.util.hash_array(key), pd.util.hash_array(values)),
+        dtype=np.uint64,
+    )
+
+
+def _surplus(hash_: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """Return positions of rows in `hash_` which have no counterpart in `other`."""
+    other_counts = pd.Series(other).value_counts()
+    series = pd.Series(hash_)
+    rank = series.groupby(series).cumcount().to_numpy()
+    counterpart = series.map(other_counts).fillna(0).to_numpy()
+    return np.flatnonzero(rank >= counterpart)
+
+
+def _match_residual(
+    actual: pd.DataFrame, expected: pd.DataFrame, acceptable_error: float
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Match rows whose float values are within acceptable_error one by one.
+
+    Rows are paired only with rows of the same other columns whose float
+    values are in the same or neighbouring buckets (see `_float_buckets()`).
+    """
+    float_columns = [
+        c
+        for c in range(actual.shape[1])
+        if pd.api.types.is_float_dtype(actual.dtypes.iloc[c])
+        and pd.api.types.is_float_dtype(expected.dtypes.iloc[c])
+    ]
+    if len(float_columns) == 0:
+        return actual, expected
+
+    other_columns = [c for c in range(actual.shape[1]) if c not in float_columns]
+    actual_float = actual.iloc[:, float_columns].to_numpy(
+        dtype="float64", na_value=np.nan
+    )
+    expected_float = expected.iloc[:, float_columns].to_numpy(
+        dtype="float64", na_value=np.nan
+    )
+
+    # columns of the most distinct buckets make the fewest pairs
+    # (neighbours grow exponentially by the number of columns)
+    probes = sorted(
+        range(len(float_columns)),
+        key=lambda c: -len(
+            np.unique(_float_buckets(expected_float[:, c], acceptable_error)[1])
+        ),
+    )[:_MAX_PROBE_COLUMNS]
+
+    actual_probe = pd.DataFrame({"key": _hash_rows(actual.iloc[:, other_columns], 0)})
+    expected_probe = pd.DataFrame(
+        {"key": _hash_rows(expected.iloc[:, other_columns], 0)}
+    )
+    for c in probes:
+        actual_probe[f"kind{c}"], actual_probe[f"bucket{c}"] = _float_buckets(
+            actual_float[:, c], acceptable_error
+        )
+        expected_probe[f"kind{c}"], expected_probe[f"bucket{c}"] = _float_buckets(
+            expected_float[:, c], acceptable_error
+        )
+
+    # pairs of rows in the neighbouring buckets
+    pairs: list[pd.DataFrame] = []
+    for offsets in itertools.product([-1, 0, 1], repeat=len(probes)):
+        shifted = actual_probe.assign(
+            **{
+                f"bucket{c}": actual_probe[f"bucket{c}"] + o
+                for c, o in zip(probes, offsets)
+            }
+        )
+        pairs.append(
+            shifted.reset_index(names="i").merge(
+                expected_probe.reset_index(names="j"), on=list(actual_probe.columns)
+            )
+        )
+    pair = pd.concat(pairs)
+    i_array = pair["i"].to_numpy()
+    j_array = pair["j"].to_numpy()
+
+    a = actual_float[i_array]
+    e = expected_float[j_array]
+    within = (within_error(a, e, acceptable_error) | (np.isnan(a) & np.isnan(e))).all(
+        axis=1
+    )
+    i_array = i_array[within]
+    j_array = j_array[within]
+    order = np.lexsort((j_array, i_array))
+
+    # the first expected row of each actual row is taken
+    actual_matched = [False] * len(actual)
+    expected_matched = [False] * len(expected)
+    for i, j in zip(i_array[order].tolist(), j_array[order].tolist()):
+        if not actual_matched[i] and not expected_matched[j]:
+            actual_matched[i] = True
+            expected_matched[j] = True
+
+    return (
+        actual[~np.array(actual_matched, dtype=bool)],
+        expected[~np.array(expected_matched, dtype=bool)],
+    )
+
+
+def _float_buckets(
+    values: np.ndarray, acceptable_error: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return kinds and buckets, values within acceptable_error of each other
+    are of the same kind and in the same or neighbouring buckets.
+
+    Kinds are the signs, 2 for NaN and 3 (or -3) for infinities. Buckets of
+    log|v| are at least twice as wide as the error.
+    """
+    kind = np.sign(values)
+    kind[np.isnan(values)] = 2
+    kind[np.isinf(values)] *= 3
+
+    if acceptable_error >= _MAX_BUCKETED_ERROR:
+        # signs may differ and 0 is within the error of any value
+        kind[np.isfinite(values)] = 1
+        return kind.astype("int64"), np.zeros(len(values), dtype="int64")
+
+    # not too narrow to fit in int64 even if acceptable_error is tiny
+    width = 2 * max(np.log1p(acceptable_error), _MIN_BUCKET_WIDTH)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bucket = np.floor(np.log(np.abs(values)) / width)
+    bucket[~np.isfinite(bucket)] = 0
+    return kind.astype("int64"), bucket.astype("int64")
+
+
+def _is_vectorizable(dtype: Any) -> bool:
+    if dtype == object or isinstance(dtype, pd.CategoricalDtype):
+        return False
+
+    return bool(
+        pd.api.types.is_numeric_dtype(dtype)
+        or pd.api.types.is_bool_dtype(dtype)
+        or pd.api.types.is_datetime64_any_dtype(dtype)
+        or pd.api.types.is_timedelta64_dtype(dtype)
+        or pd.api.types.is_string_dtype(dtype)
+    )
+
+
+def _is_numpy_number(dtype: Any) -> bool:
+    return isinstance(dtype, np.dtype) and dtype.kind in "biuf"
+
+
+def _to_bool(values: Any) -> np.ndarray:
+    # NA (e.g. comparison with pd.NA) is regarded as False
+    return np.asarray(pd.array(values, dtype="boolean").fillna(False), dtype=bool)
@@ -8,3 +8,7 @@ class TdsqlAssertionError(Exception):
 
 class TdsqlInternalError(Exception):
     """Raised when unnexpected error is detected"""
+
+
+class RecordedQueryError(Exception):
+    """Raised when a query failed while it was recorded (see `--replay`)"""
@@ -0,0 +1,182 @@
+"""Logs of queries and results written to `.tdsql_log`.
+
+Results are written by a background thread (see `LogWriter`) as csv,
+parquet or Arrow IPC files (see `--log-format`).
+"""
+
+from functools import partial
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+from typing import Any, Callable, Final, Literal
+import shutil
+import uuid
+
+from tdsql.logger import logger
+from tdsql.test_case import TdsqlTestCase
+from tdsql import timing
+from tdsql import util
+
+LOG_FORMATS: Final[tuple[str, ...]] = ("csv", "parquet", "arrow")
+# suffixes of compressed csv, other formats are compressed internally
+CSV_SUFFIXES: Final[dict[str, str]] = {
+    "gzip": ".gz",
+    "bz2": ".bz2",
+    "xz": ".xz",
+    "zstd": ".zst",
+}
+MAX_PENDING: Final[int] = 16
+
+
+class LogWriter:
+    """Write logs in a background thread.
+
+    The queue is bounded so that results waiting to be written do not
+    consume too much memory, `write_*()` blocks while it is full.
+    """
+
+    def __init__(
+        self,
+        log_format: str = "csv",
+        compression: str = "",
+        max_pending: int = MAX_PENDING,
+    ) -> None:
+        if log_format != "csv":
+            util.require_pyarrow(f"to write logs as {log_format}")
+
+        self.log_format = log_format
+        self.compression = compression
+        self._queue: Queue[Callable[[], None] | None] = Queue(maxsize=max_pending)
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write_queries(self, test: TdsqlTestCase, log_dir: Path) -> None:
+        self._queue.put(partial(write_queries, test, log_dir))
+
+    def write_results(
+        self, test: TdsqlTestCase, log_dir: Path, actual: Any, expected: Any
+    ) -> None:
+        self._queue.put(
+            partial(
+                write_results,
+                test,
+                log_dir,
+                actual,
+                expected,
+                self.log_format,
+                self.compression,
+            )
+        )
+
+    def close(self) -> None:
+        """Wait until all logs are written."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+
+            try:
+                task()
+            except Exception as e:
+                # tests should not fail because of logs
+                logger.warning(f"failed to write log: {e}")
+
+
+def log_stem(
+    test: TdsqlTestCase, log_dir: Path, kind: Literal["actual", "expected"]
+) -> Path:
+    """Path of the log without suffix."""
+    return log_dir / f"{test.sqlpath.stem}_{test.id}_{kind}"
+
+
+def write_queries(test: TdsqlTestCase, log_dir: Path) -> None:
+    util.write(Path(f"{log_stem(test, log_dir, 'actual')}.sql"), test.actual_sql)
+    util.write(Path(f"{log_stem(test, log_dir, 'expected')}.sql"), test.expected_sql)
+
+
+def write_results(
+    test: TdsqlTestCase,
+    log_dir: Path,
+    actual: Any,
+    expected: Any,
+    log_format: str = "csv",
+    compression: str = "",
+) -> None:
+    with timing.span("write_log", timing.label_of(test)):
+        results: list[tuple[Literal["actual", "expected"], Any]] = [
+            ("actual", actual),
+            ("expected", expected),
+        ]
+        for kind, result in results:
+            write_result(result, log_stem(test, log_dir, kind), log_format, compression)
+
+
+def write_result(
+    result: Any, stem: Path, log_format: str = "csv", compression: str = ""
+) -> None:
+    """Write DataFrame or `pyarrow.Table`, nothing is written for exceptions."""
+    if result is None or isinstance(result, Exception):
+        return
+
+    import pandas as pd
+
+    stem.parent.mkdir(parents=True, exist_ok=True)
+    is_pandas = isinstance(result, pd.DataFrame)
+
+    if log_format == "csv":
+        path = Path(f"{stem}.csv{CSV_SUFFIXES.get(compression, '')}")
+        if is_pandas:
+            result.to_csv(path, index=False, compression=compression or None)
+        elif compression != "":
+            result.to_pandas().to_csv(path, index=False, compression=compression)
+        else:
+            from tdsql import arrow
+
+            arrow.write_csv(result, path)
+        return
+
+    import pyarrow as pa  # type: ignore
+
+    table = pa.Table.from_pandas(result, preserve_index=False) if is_pandas else result
+
+    if log_format == "parquet":
+        import pyarrow.parquet as pq  # type: ignore
+
+        pq.write_table(table, f"{stem}.parquet", compression=compression or "none")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression or None)
+        with pa.OSFile(f"{stem}.arrow", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+
+
+def make_log_dir(log_dir: Path) -> None:
+    """Replace the log directory with an empty one.
+
+    Old logs are moved aside and removed in background,
+    so that tests can start without waiting for it.
+    """
+    old_dirs = list(log_dir.parent.glob(f"{log_dir.name}.old-*"))
+    if log_dir.exists():
+        old_dir = log_dir.with_name(f"{log_dir.name}.old-{uuid.uuid4().hex}")
+        try:
+            log_dir.rename(old_dir)
+            old_dirs.append(old_dir)
+        except OSError:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+    # .gitignore ignores itself and the directory even after it is renamed
+    util.write(log_dir / ".gitignore", "# created by tdsql\n*")
+
+    if len(old_dirs) > 0:
+        # not daemon, the process waits for it before exit
+        Thread(target=_remove, args=(old_dirs,)).start()
+
+
+def _remove(dirs: list[Path]) -> None:
+    for d in dirs:
+        shutil.rmtree(d, ignore_errors=True)
@@ -1,3 +1,28 @@
 import logging
+import sys
 
 logger = logging.getLogger("tdsql.execution")
+
+
+class _StderrHandler(logging.Handler):
+    """Write to sys.stderr of the time (it may be replaced, e.g. by pytest)."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            sys.stderr.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+def setup() -> None:
+    """Write logs of INFO and above to stderr (see `tdsql.command.main()`).
+
+    Without it, only WARNING and above are written by the last resort handler.
+    """
+    if any(isinstance(h, _StderrHandler) for h in logger.handlers):
+        return
+
+    handler = _StderrHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
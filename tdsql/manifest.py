@@ -0,0 +1,92 @@
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+import hashlib
+import json
+import os
+
+from tdsql.exception import TdsqlInternalError
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+
+
+class Manifest:
+    """Content hashes, results and durations of tests in the previous runs.
+
+    A test is identified by the yaml file (relative to the root yaml) and its
+    position in `tests`. Its digest covers the rendered sql and the config,
+    so any change of sql or yaml files which affects the test is detected.
+    """
+
+    def __init__(self, path: Path, root_dir: Path) -> None:
+        self.path = path
+        self.root_dir = root_dir
+        self.tests: dict[str, dict[str, Any]] = {}
+
+        if path.is_file():
+            try:
+                self.tests = json.loads(util.read(path)).get("tests", {})
+            except ValueError:
+                # broken manifest means all tests are affected
+                self.tests = {}
+
+    def identity(self, test: TdsqlTestCase) -> str:
+        if test.yamlpath is None:
+            raise TdsqlInternalError(f"{test.sqlpath}_{test.id}: yamlpath is unknown")
+
+        relpath = Path(os.path.relpath(test.yamlpath, self.root_dir)).as_posix()
+        return f"{relpath}:{test.index}"
+
+    @staticmethod
+    def digest(test: TdsqlTestCase, config: TdsqlTestConfig) -> str:
+        hash_ = hashlib.sha256()
+        for text in (
+            test.actual_sql,
+            test.expected_sql,
+            json.dumps(asdict(config), sort_keys=True),
+        ):
+            hash_.update(text.encode())
+            hash_.update(b"\0")
+        return hash_.hexdigest()
+
+    def is_affected(self, test: TdsqlTestCase, config: TdsqlTestConfig) -> bool:
+        """Return True if the test is new, changed or failed last time."""
+        entry = self.tests.get(self.identity(test))
+        if entry is None:
+            return True
+        return not entry.get("passed") or entry.get("digest") != self.digest(
+            test, config
+        )
+
+    def seconds(self, test: TdsqlTestCase, config: TdsqlTestConfig) -> float | None:
+        """Duration of the test last time, None if it is unknown or changed."""
+        entry = self.tests.get(self.identity(test))
+        if entry is None or entry.get("digest") != self.digest(test, config):
+            return None
+        seconds = entry.get("seconds")
+        return float(seconds) if seconds is not None else None
+
+    def record(
+        self,
+        test: TdsqlTestCase,
+        config: TdsqlTestConfig,
+        passed: bool,
+        seconds: float | None = None,
+    ) -> None:
+        """`seconds` is the time spent by the queries of the test.
+
+        If it is not given, the duration of the previous run is kept.
+        """
+        if seconds is None:
+            seconds = self.seconds(test, config)
+
+        entry: dict[str, Any] = {"digest": self.digest(test, config), "passed": passed}
+        if seconds is not None:
+            entry["seconds"] = round(seconds, 3)
+        self.tests[self.identity(test)] = entry
+
+    def save(self, identities: set[str]) -> None:
+        """Save entries of `identities`, tests which no longer exist are removed."""
+        tests = {k: v for k, v in self.tests.items() if k in identities}
+        util.write(self.path, json.dumps({"tests": tests}, indent=2, sort_keys=True))
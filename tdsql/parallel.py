@@ -0,0 +1,169 @@
+"""Comparison of large results in a process pool (see `--compare-processes`).
+
+Results are passed to worker processes as Arrow IPC files (memory-mapped
+when they are read) instead of pickled DataFrames.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+import multiprocessing
+import tempfile
+import uuid
+
+import pandas as pd
+
+from tdsql.exception import TdsqlAssertionError
+from tdsql.logger import logger
+from tdsql.run_config import TdsqlRunConfig
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import util
+from tdsql import verdict
+
+
+class ComparisonPool:
+    def __init__(self, max_workers: int, threshold: int) -> None:
+        util.require_pyarrow("to compare results in processes")
+
+        self.threshold = threshold  # number of cells
+        # do not fork the process which has running threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        # /dev/shm is backed by memory on linux
+        shm = Path("/dev/shm")
+        self._tmp_dir = tempfile.TemporaryDirectory(
+            prefix="tdsql_", dir=shm if shm.is_dir() else None
+        )
+
+    def is_large(self, test: TdsqlTestCase) -> bool:
+        if isinstance(test.actual_sql_result, Exception) or isinstance(
+            test.expected_sql_result, Exception
+        ):
+            return False
+        return (
+            max(_size(test.actual_sql_result), _size(test.expected_sql_result))
+            >= self.threshold
+        )
+
+    def submit(
+        self,
+        test: TdsqlTestCase,
+        config: TdsqlTestConfig,
+        log_dir: Path,
+        run_config: TdsqlRunConfig,
+    ) -> Future[None] | None:
+        """Compare results of the test in a worker and release them here.
+
+        None is returned if the results cannot be passed as they are
+        (e.g. a column of mixed types), then they are left to be compared
+        in this process so that the verdict does not depend on the size.
+        """
+        is_pandas = isinstance(test.actual_sql_result, pd.DataFrame)
+        actual = _to_arrow(test.actual_sql_result)
+        expected = _to_arrow(test.expected_sql_result)
+        if actual is None or expected is None:
+            return None
+
+        actual_path = self._write(actual)
+        expected_path = self._write(expected)
+        test.actual_sql_result = None
+        test.expected_sql_result = None
+
+        future = self._pool.submit(
+            compare_in_worker,
+            test,
+            config,
+            actual_path,
+            expected_path,
+            is_pandas,
+            log_dir,
+            run_config,
+        )
+        future.add_done_callback(lambda _: _remove(actual_path, expected_path))
+        return future
+
+    def shutdown(self, cancel: bool = False) -> None:
+        """`cancel` means comparisons which have not started are discarded."""
+        self._pool.shutdown(cancel_futures=cancel)
+        self._tmp_dir.cleanup()
+
+    def _write(self, table: Any) -> Path:
+        import pyarrow as pa  # type: ignore
+
+        path = Path(self._tmp_dir.name) / f"{uuid.uuid4().hex}.arrow"
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return path
+
+
+def compare_in_worker(
+    test: TdsqlTestCase,
+    config: TdsqlTestConfig,
+    actual_path: Path,
+    expected_path: Path,
+    is_pandas: bool,
+    log_dir: Path,
+    run_config: TdsqlRunConfig,
+) -> None:
+    """Write logs and compare results, TdsqlAssertionError is raised to the caller."""
+    test.actual_sql_result = _read(actual_path, is_pandas)
+    test.expected_sql_result = _read(expected_path, is_pandas)
+    try:
+        verdict.compare_results(test, config)
+    except TdsqlAssertionError:
+        verdict.write_result_logs(test, log_dir, run_config)
+        raise
+
+    if not run_config.log_failures_only:
+        verdict.write_result_logs(test, log_dir, run_config)
+
+
+def _read(path: Path, is_pandas: bool) -> Any:
+    import pyarrow as pa  # type: ignore
+
+    with pa.memory_map(str(path), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    if not is_pandas:
+        return table
+
+    df = table.to_pandas()
+    types = verdict.column_types(table)
+    return df if types is None else verdict.with_types(df, types)
+
+
+def _to_arrow(result: Any) -> Any:
+    """Return pyarrow.Table, None if DataFrame is not read back as it is."""
+    import pyarrow as pa  # type: ignore
+
+    if not isinstance(result, pd.DataFrame):
+        return result
+
+    try:
+        table = pa.Table.from_pandas(result, preserve_index=False)
+    except pa.ArrowException as e:
+        logger.info(f"result is compared in this process: {e}")
+        return None
+
+    # e.g. integers in an object column are read as int64, which is not
+    # equal to int64 column in this process
+    dtypes = table.schema.empty_table().to_pandas().dtypes
+    if list(dtypes) != list(result.dtypes):
+        return None
+
+    types = verdict.column_types(result)
+    return table if types is None else verdict.with_types(table, types)
+
+
+def _size(result: Any) -> int:
+    if result is None:
+        return 0
+    nrow, ncol = result.shape
+    return int(nrow * ncol)
+
+
+def _remove(*paths: Path) -> None:
+    for p in paths:
+        p.unlink(missing_ok=True)
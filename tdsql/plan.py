@@ -0,0 +1,43 @@
+"""Order and partition tests by their durations in the previous runs.
+
+Durations are recorded in `Manifest`.
+"""
+
+import heapq
+
+
+def estimate(seconds: list[float | None]) -> list[float]:
+    """Unknown durations are regarded as the mean of known ones."""
+    known = [s for s in seconds if s is not None]
+    mean = sum(known) / len(known) if len(known) > 0 else 0.0
+    return [mean if s is None else s for s in seconds]
+
+
+def lpt_order(seconds: list[float]) -> list[int]:
+    """Indices of the longest first (LPT), ties are kept in the original order."""
+    return sorted(range(len(seconds)), key=lambda i: -seconds[i])
+
+
+def makespan(seconds: list[float], workers: int) -> float:
+    """Time to finish all tasks if each of them is given to the first idle worker."""
+    finish = [0.0] * max(workers, 1)
+    for s in seconds:
+        heapq.heappush(finish, heapq.heappop(finish) + s)
+    return max(finish)
+
+
+def partition(seconds: list[float], keys: list[str], n: int) -> list[int]:
+    """Assign tasks to `n` shards (0-based) balancing the total of `seconds`.
+
+    The longest task is given to the least loaded shard first. Ties are
+    broken by `keys` and the index of shards, so that every machine which
+    has the same tasks and durations gets the same partition.
+    """
+    order = sorted(range(len(seconds)), key=lambda i: (-seconds[i], keys[i]))
+    loads = [(0.0, s) for s in range(n)]
+    shards = [0] * len(seconds)
+    for i in order:
+        load, s = heapq.heappop(loads)
+        shards[i] = s
+        heapq.heappush(loads, (load + seconds[i], s))
+    return shards
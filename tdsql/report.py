@@ -0,0 +1,104 @@
+"""Results of a run as json (see `--result-json`) and merging them.
+
+Each shard of `--shard` writes its own file, they are combined into one
+report by `tdsql merge`. Durations of tests in a merged report balance
+shards of the next run (see `--durations`).
+"""
+
+from pathlib import Path
+from typing import Any
+import json
+
+from tdsql.exception import InvalidInputError
+from tdsql import util
+
+
+def write(
+    path: Path,
+    tests: list[dict[str, Any]],
+    total: int,
+    skipped: int,
+    seconds: float,
+    shard: tuple[int, int] | None = None,
+) -> None:
+    """`total` is the number of all tests before they are split into shards,
+    `skipped` is the number of tests skipped by `--changed-only` in this shard.
+    """
+    report = {
+        "shard": list(shard) if shard is not None else None,
+        "total": total,
+        "skipped": skipped,
+        "seconds": round(seconds, 3),
+        "passed": sum(1 for t in tests if t["passed"]),
+        "failed": sum(1 for t in tests if not t["passed"]),
+        "tests": sorted(tests, key=lambda t: str(t["identity"])),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+
+
+def merge(paths: list[Path]) -> dict[str, Any]:
+    """Combine reports of shards.
+
+    InvalidInputError is raised if any test is missing or duplicated
+    (e.g. shards were split by different durations).
+    """
+    reports = [_read(p) for p in paths]
+
+    tests: dict[str, dict[str, Any]] = {}
+    for p, r in zip(paths, reports):
+        for t in r["tests"]:
+            if t["identity"] in tests:
+                raise InvalidInputError(f"{p}: {t['identity']} is reported twice")
+            tests[t["identity"]] = t
+
+    shards = sorted(tuple(r["shard"]) for r in reports if r["shard"] is not None)
+    counts = {s[1] for s in shards}
+    if len(counts) > 1:
+        raise InvalidInputError(
+            f"reports of different number of shards: {sorted(counts)}"
+        )
+    elif len(counts) == 1:
+        n = counts.pop()
+        missing = set(range(1, n + 1)) - {s[0] for s in shards}
+        if len(missing) > 0:
+            raise InvalidInputError(f"reports of shard {sorted(missing)} are missing")
+
+    totals = {r["total"] for r in reports}
+    skipped = sum(r["skipped"] for r in reports)
+    if len(totals) > 1:
+        raise InvalidInputError(f"reports of different number of tests: {totals}")
+    elif len(totals) == 1 and totals != {len(tests) + skipped}:
+        raise InvalidInputError(
+            f"{len(tests)} tests are reported and {skipped} tests are skipped "
+            + f"but {totals.pop()} tests exist"
+        )
+
+    values = sorted(tests.values(), key=lambda t: str(t["identity"]))
+    return {
+        "shards": [list(s) for s in shards],
+        "total": len(values) + skipped,
+        "skipped": skipped,
+        # shards run in parallel
+        "seconds": max((r["seconds"] for r in reports), default=0.0),
+        "passed": sum(1 for t in values if t["passed"]),
+        "failed": sum(1 for t in values if not t["passed"]),
+        "tests": values,
+    }
+
+
+def durations(path: Path) -> dict[str, float]:
+    """Seconds of each test (by identity) in the report, if it was measured."""
+    return {
+        str(t["identity"]): float(t["seconds"])
+        for t in _read(path)["tests"]
+        if t["seconds"] is not None
+    }
+
+
+def _read(path: Path) -> dict[str, Any]:
+    try:
+        report: dict[str, Any] = json.loads(util.read(path))
+    except (OSError, ValueError) as e:
+        raise InvalidInputError(f"{path}: cannot read the report: {e}")
+    return report
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(eq=True)
+class TdsqlRunConfig:
+    """Options of a single run, given by command line arguments."""
+
+    cache: bool = False
+    clear_cache: bool = False
+    cache_max_bytes: int = 1024**3  # 1GiB
+    cache_max_age: float = 7 * 24 * 60 * 60.0  # 7 days
+    changed_only: bool = False
+    stream: bool = False
+    arrow: bool = False
+    engine: str = "thread"  # thread or asyncio
+    max_concurrency: int = 256
+    compare_processes: int = 0
+    compare_threshold: int = 1_000_000  # cells
+    record: Path | None = None  # cassette directory
+    replay: Path | None = None  # cassette directory
+    batch_size: int = 0  # 0 means disabled
+    dry_run: bool = False
+    log_format: str = "csv"  # csv, parquet or arrow
+    log_compression: str = ""  # empty means no compression
+    log_failures_only: bool = False
+    server_diff: bool = False
+    fingerprint: bool = False  # implies server_diff
+    timing_report: Path | None = None  # json
+    shard: tuple[int, int] | None = None  # (index from 1, number of shards)
+    durations: Path | None = None  # report of `tdsql merge` to balance shards
+    result_json: Path | None = None
+    trace: Path | None = None  # Chrome trace event format
+    max_failures: int = 0  # 0 means unlimited
@@ -0,0 +1,143 @@
+from concurrent.futures import Future
+from threading import Thread
+from typing import Any, Final
+import asyncio
+import time
+
+from tdsql.client.base import BaseClient
+from tdsql.exception import TdsqlInternalError
+from tdsql.logger import logger
+from tdsql.test_config import TdsqlTestConfig
+
+# latency is regarded as stable while it is within this ratio of the average
+LATENCY_TOLERANCE: Final[float] = 1.5
+MAX_RETRIES: Final[int] = 5
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted by AIMD.
+
+    The limit is increased additively while latency is stable
+    and halved when the database throttles requests.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1) -> None:
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.peak = self.limit
+        self.in_flight = 0
+        self._latency: float | None = None
+        self._credit = 0.0
+        self._condition: asyncio.Condition | None = None
+
+    async def acquire(self) -> None:
+        async with self._get_condition():
+            await self._get_condition().wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._get_condition():
+            self.in_flight -= 1
+            self._get_condition().notify_all()
+
+    def on_success(self, latency: float) -> None:
+        if self._latency is None:
+            self._latency = latency
+
+        stable = latency <= self._latency * LATENCY_TOLERANCE
+        self._latency = 0.8 * self._latency + 0.2 * latency
+        if not stable:
+            return
+
+        # +1 after `limit` successes in a row
+        self._credit += 1 / self.limit
+        if self._credit >= 1:
+            self._credit = 0
+            self.limit = min(self.limit + 1, self.maximum)
+            self.peak = max(self.peak, self.limit)
+
+    def on_throttled(self) -> None:
+        self._credit = 0
+        self.limit = max(self.limit // 2, self.minimum)
+
+    def _get_condition(self) -> asyncio.Condition:
+        # created lazily to bind it to the running loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+
+class AsyncScheduler:
+    """Execute queries on an event loop in a background thread.
+
+    The client has to support `submit()`, `poll()` and `fetch()`, so that
+    waiting for query jobs does not occupy threads. Blocking API calls are
+    executed by the default executor of the loop.
+    """
+
+    def __init__(
+        self,
+        initial_concurrency: int,
+        max_concurrency: int,
+        poll_interval: float = 1.0,
+        backoff: float = 1.0,
+    ) -> None:
+        self.limiter = AdaptiveLimiter(initial_concurrency, max_concurrency)
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        client_: BaseClient,
+        sql: str,
+        config: TdsqlTestConfig,
+        arrow: bool = False,
+    ) -> Future[Any]:
+        return asyncio.run_coroutine_threadsafe(
+            self._execute(client_, sql, config, arrow), self._loop
+        )
+
+    def shutdown(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _execute(
+        self,
+        client_: BaseClient,
+        sql: str,
+        config: TdsqlTestConfig,
+        arrow: bool,
+    ) -> Any:
+        for retry in range(MAX_RETRIES + 1):
+            await self.limiter.acquire()
+            start = time.monotonic()
+
+            try:
+                job = await asyncio.to_thread(client_.submit, sql, config)
+                while not await asyncio.to_thread(client_.poll, job):
+                    await asyncio.sleep(self.poll_interval)
+                result = await asyncio.to_thread(client_.fetch, job, arrow)
+
+            except Exception as e:
+                if not client_.is_throttled(e) or retry == MAX_RETRIES:
+                    raise
+                self.limiter.on_throttled()
+                logger.warning(
+                    f"throttled, concurrency is decreased to {self.limiter.limit}"
+                )
+
+            else:
+                self.limiter.on_success(time.monotonic() - start)
+                return result
+
+            finally:
+                await self.limiter.release()
+
+            await asyncio.sleep(self.backoff * 2**retry)
+
+        raise TdsqlInternalError()
@@ -0,0 +1,329 @@
+"""Compare results inside the database (see `--server-diff`).
+
+Both queries are combined into a single query which returns only rows
+existing in one side but not in the other, so that large results are not
+downloaded. Each row is converted to json and numbered among identical
+rows by ROW_NUMBER(), then the sides are compared by EXCEPT DISTINCT
+in both directions. Because duplicated rows are numbered, a different
+number of rows is also found as a difference.
+
+Values are compared as json, so the types of columns
+(`BaseClient.schema()`) are compared first (e.g. DATE and STRING have
+the same json). Rows which differ only within `acceptable_error` are
+downloaded as mismatches and matched again by `compare.diff_multiset()`.
+Only tests with `auto_sort: true` are compared in the database. Results
+are downloaded and compared as usual if names or types of columns do not
+match, the query fails or there are too many mismatches to be matched here.
+
+With `--fingerprint`, an order-independent fingerprint of each side
+(the number of rows, and BIT_XOR and SUM of the hashes of rows) is
+computed first and the diff query is executed only if they differ.
+Fingerprints are compared only if types of columns match (rows of
+different types may have the same json and hash). Rows with the same json
+have the same hash, so equal results always have the same fingerprint.
+Different results are almost never fingerprinted the same, but it is not
+impossible. Floats differing within `acceptable_error` have different
+fingerprints, they are matched by the diff.
+"""
+
+from pathlib import Path
+from typing import Any, Final
+import json
+
+import pandas as pd
+
+from tdsql.client.base import BaseClient
+from tdsql.exception import TdsqlAssertionError
+from tdsql.logger import logger
+from tdsql.run_config import TdsqlRunConfig
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import log_writer
+from tdsql import util
+from tdsql import verdict
+
+SIDE_COLUMN: Final[str] = "_tdsql_side"
+ROW_COLUMN: Final[str] = "_tdsql_row"
+NUMBER_COLUMN: Final[str] = "_tdsql_n"
+COUNT_COLUMN: Final[str] = "_tdsql_count"
+ALIAS: Final[str] = "_tdsql_t"
+HASH_COLUMN: Final[str] = "_tdsql_hash"
+# hashes are summed modulo this so that the sum does not overflow
+FINGERPRINT_MODULUS: Final[int] = 1_000_000_007
+
+
+def accepts(client_: BaseClient, config: TdsqlTestConfig) -> bool:
+    return (
+        client_.json_row_expression is not None
+        and client_.quoted_identifier is not None
+        and config.auto_sort
+    )
+
+
+def compare(
+    test: TdsqlTestCase,
+    config: TdsqlTestConfig,
+    client_: BaseClient,
+    log_dir: Path,
+    run_config: TdsqlRunConfig,
+) -> None:
+    """Raise TdsqlAssertionError if the results differ in the database.
+
+    Only mismatching rows are downloaded and written as logs of the test.
+    """
+    diff = _select_diff(test, config, client_, run_config.fingerprint)
+    if diff is None:
+        _compare_downloaded(test, config, client_, log_dir, run_config)
+        return
+
+    actual_only, expected_only, actual_count, expected_count = diff
+    complete = max(actual_count, expected_count) <= verdict.MAX_DIFF_ROWS
+
+    if config.acceptable_error > 0 and actual_count > 0 and expected_count > 0:
+        if not complete:
+            if actual_count == expected_count:
+                # all of them may match within acceptable_error
+                _compare_downloaded(test, config, client_, log_dir, run_config)
+                return
+        else:
+            from tdsql import compare
+
+            actual_only, expected_only = compare.diff_multiset(
+                actual_only, expected_only, config.acceptable_error
+            )
+            actual_count, expected_count = len(actual_only), len(expected_only)
+
+    if actual_count == 0 and expected_count == 0:
+        return
+
+    # only mismatching rows are written
+    if run_config.log_failures_only:
+        log_writer.write_queries(test, log_dir)
+    log_writer.write_results(
+        test,
+        log_dir,
+        actual_only,
+        expected_only,
+        run_config.log_format,
+        run_config.log_compression,
+    )
+
+    raise TdsqlAssertionError(
+        f"{test.sqlpath}_{test.id}: rows do not match\n"
+        + verdict.format_rows("actual only", actual_only, actual_count)
+        + "\n"
+        + verdict.format_rows("expected only", expected_only, expected_count)
+    )
+
+
+def build_query(
+    actual_sql: str,
+    expected_sql: str,
+    actual_columns: list[str],
+    expected_columns: list[str],
+    json_row_expression: str,
+    quoted_identifier: str,
+    limit: int = verdict.MAX_DIFF_ROWS,
+) -> str:
+    """Query which returns mismatching rows (as json) of each side.
+
+    Columns are aligned by position, they are renamed to `_c0`, `_c1`, ...
+    """
+
+    def numbered(sql: str, columns: list[str]) -> str:
+        rows = _json_rows(sql, columns, json_row_expression, quoted_identifier)
+        return (
+            f"SELECT {ROW_COLUMN}, "
+            + f"ROW_NUMBER() OVER (PARTITION BY {ROW_COLUMN}) AS {NUMBER_COLUMN}\n"
+            + f"FROM ({rows})"
+        )
+
+    return f"""
+WITH _tdsql_actual AS (
+{numbered(actual_sql, actual_columns)}
+), _tdsql_expected AS (
+{numbered(expected_sql, expected_columns)}
+), _tdsql_diff AS (
+  SELECT 'actual' AS {SIDE_COLUMN}, * FROM (
+    SELECT * FROM _tdsql_actual EXCEPT DISTINCT SELECT * FROM _tdsql_expected
+  )
+  UNION ALL
+  SELECT 'expected' AS {SIDE_COLUMN}, * FROM (
+    SELECT * FROM _tdsql_expected EXCEPT DISTINCT SELECT * FROM _tdsql_actual
+  )
+)
+SELECT {SIDE_COLUMN}, {ROW_COLUMN}, {COUNT_COLUMN} FROM (
+  SELECT
+    *,
+    COUNT(*) OVER (PARTITION BY {SIDE_COLUMN}) AS {COUNT_COLUMN},
+    ROW_NUMBER() OVER (PARTITION BY {SIDE_COLUMN}) AS _tdsql_i
+  FROM _tdsql_diff
+)
+WHERE _tdsql_i <= {limit}
+""".strip()
+
+
+def build_fingerprint_query(
+    actual_sql: str,
+    expected_sql: str,
+    actual_columns: list[str],
+    expected_columns: list[str],
+    json_row_expression: str,
+    quoted_identifier: str,
+    fingerprint_expression: str,
+) -> str:
+    """Query which returns a row of fingerprint (as strings) for each side."""
+
+    def fingerprint(side: str, sql: str, columns: list[str]) -> str:
+        rows = _json_rows(sql, columns, json_row_expression, quoted_identifier)
+        hashed = fingerprint_expression.format(ROW_COLUMN)
+        return (
+            f"SELECT '{side}' AS {SIDE_COLUMN}, "
+            + f"CAST(COUNT(*) AS STRING) AS {COUNT_COLUMN}, "
+            + f"CAST(BIT_XOR({HASH_COLUMN}) AS STRING) AS _tdsql_xor, "
+            + f"CAST(SUM(MOD({HASH_COLUMN}, {FINGERPRINT_MODULUS})) AS STRING) "
+            + "AS _tdsql_sum\n"
+            + f"FROM (SELECT {hashed} AS {HASH_COLUMN} FROM ({rows}))"
+        )
+
+    return (
+        fingerprint("actual", actual_sql, actual_columns)
+        + "\nUNION ALL\n"
+        + fingerprint("expected", expected_sql, expected_columns)
+    )
+
+
+def _json_rows(
+    sql: str, columns: list[str], json_row_expression: str, quoted_identifier: str
+) -> str:
+    select = ", ".join(
+        [f"{quoted_identifier.format(c)} AS _c{i}" for i, c in enumerate(columns)]
+    )
+    row = json_row_expression.format(ALIAS)
+    return (
+        f"SELECT {row} AS {ROW_COLUMN} FROM (\n"
+        + f"SELECT {select} FROM (\n{util.strip_sql(sql)}\n)\n) AS {ALIAS}"
+    )
+
+
+def _select_diff(
+    test: TdsqlTestCase,
+    config: TdsqlTestConfig,
+    client_: BaseClient,
+    fingerprint: bool = False,
+) -> tuple[pd.DataFrame, pd.DataFrame, int, int] | None:
+    """Return mismatching rows and the number of them of each side.
+
+    None is returned if the results cannot be compared in the database.
+    """
+    label = f"{test.sqlpath}_{test.id}"
+    try:
+        actual_schema = client_.schema(test.actual_sql, config)
+        expected_schema = client_.schema(test.expected_sql, config)
+    except Exception as e:
+        logger.warning(f"{label}: cannot get columns, download results: {e}")
+        return None
+
+    actual_columns = [c for c, _ in actual_schema]
+    expected_columns = [c for c, _ in expected_schema]
+    if config.ignore_column_name:
+        if len(actual_columns) != len(expected_columns):
+            return None
+    elif set(actual_columns) != set(expected_columns):
+        return None
+    else:
+        expected_types = dict(expected_schema)
+        expected_schema = [(c, expected_types[c]) for c in actual_columns]
+        expected_columns = actual_columns
+
+    # values of different types may have the same json (e.g. DATE and STRING)
+    if [t for _, t in actual_schema] != [t for _, t in expected_schema]:
+        logger.info(f"{label}: types of columns differ, download results")
+        return None
+
+    json_row_expression = client_.json_row_expression
+    quoted_identifier = client_.quoted_identifier
+    if json_row_expression is None or quoted_identifier is None:
+        return None
+
+    fingerprint_expression = client_.fingerprint_expression
+    if fingerprint and fingerprint_expression is not None:
+        sql = build_fingerprint_query(
+            test.actual_sql,
+            test.expected_sql,
+            actual_columns,
+            expected_columns,
+            json_row_expression,
+            quoted_identifier,
+            fingerprint_expression,
+        )
+        try:
+            df = client_.select(sql, config)
+        except Exception as e:
+            logger.warning(f"{label}: cannot compute fingerprints: {e}")
+        else:
+            fingerprints = df.set_index(SIDE_COLUMN).astype(str)
+            if fingerprints.loc["actual"].equals(fingerprints.loc["expected"]):
+                empty = pd.DataFrame(columns=actual_columns)
+                return empty, empty, 0, 0
+
+    sql = build_query(
+        test.actual_sql,
+        test.expected_sql,
+        actual_columns,
+        expected_columns,
+        json_row_expression,
+        quoted_identifier,
+        verdict.MAX_DIFF_ROWS,
+    )
+    try:
+        df = client_.select(sql, config)
+    except Exception as e:
+        logger.warning(f"{label}: cannot compare in the database: {e}")
+        return None
+
+    positions = [f"_c{i}" for i in range(len(actual_columns))]
+    rows: list[pd.DataFrame] = []
+    counts: list[int] = []
+    for side in ("actual", "expected"):
+        side_df = df[df[SIDE_COLUMN] == side]
+        records = [json.loads(r) for r in side_df[ROW_COLUMN]]
+        rows.append(
+            pd.DataFrame.from_records(records, columns=positions).set_axis(
+                actual_columns, axis=1
+            )
+        )
+        counts.append(int(side_df[COUNT_COLUMN].iloc[0]) if len(side_df) > 0 else 0)
+
+    return rows[0], rows[1], counts[0], counts[1]
+
+
+def _compare_downloaded(
+    test: TdsqlTestCase,
+    config: TdsqlTestConfig,
+    client_: BaseClient,
+    log_dir: Path,
+    run_config: TdsqlRunConfig,
+) -> None:
+    select = client_.select_arrow if run_config.arrow else client_.select
+    results: list[Any] = []
+    for sql in (test.actual_sql, test.expected_sql):
+        try:
+            results.append(select(sql, config))
+        except Exception as e:
+            results.append(e)
+    test.actual_sql_result, test.expected_sql_result = results
+
+    error: TdsqlAssertionError | None = None
+    try:
+        verdict.compare_results(test, config)
+    except TdsqlAssertionError as e:
+        error = e
+
+    if error is not None or not run_config.log_failures_only:
+        verdict.write_result_logs(test, log_dir, run_config)
+    test.actual_sql_result = None
+    test.expected_sql_result = None
+
+    if error is not None:
+        raise error
@@ -1,12 +1,16 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
 from pathlib import Path
-from typing import ClassVar
+from typing import TYPE_CHECKING, ClassVar
 import re
 
-import pandas as pd
-
 from tdsql.exception import InvalidInputError
 from tdsql import util
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class TdsqlTestCase:
     cnt: ClassVar[int] = 0
@@ -16,9 +20,15 @@ class TdsqlTestCase:
         sqlpath: Path,
         replace: dict[str, str],
         expected: str,
+        yamlpath: Path | None = None,
+        index: int = 0,
+        indexes: dict[Path, SqlIndex] | None = None,
     ):
         self.sqlpath = sqlpath
-        self.actual_sql = _replace_sql(sqlpath, replace)
+        # where the test is defined
+        self.yamlpath = yamlpath
+        self.index = index
+        self.actual_sql = _replace_sql(sqlpath, replace, indexes)
         self.expected_sql = expected
         self.actual_sql_result: pd.DataFrame | Exception | None = None
         self.expected_sql_result: pd.DataFrame | Exception | None = None
@@ -33,13 +43,31 @@ end_comment_pattern = re.compile(r"^.*--\s*tdsql-end:\s*([a-zA-Z]\w+)\s*$")
 range_ident_pattern = re.compile(r"^([0-9]+),([0-9]+)$")
 
 
-def _replace_sql(sqlpath: Path, replace: dict[str, str]) -> str:
-    original_sql = util.read(sqlpath)
-    original_sql_lines = original_sql.splitlines()
+@dataclass(frozen=True)
+class SqlIndex:
+    lines: list[str]
+    # 0-based line numbers where each identifier starts and ends
+    position: dict[str, tuple[int, int]]
 
-    # check where to replace
+
+def _index_sql(sqlpath: Path, indexes: dict[Path, SqlIndex] | None) -> SqlIndex:
+    """Read the sql file and find markers, memoized in `indexes` if given."""
+    if indexes is None:
+        return _build_index(sqlpath, util.read(sqlpath).splitlines())
+
+    key = sqlpath.resolve()
+    if key not in indexes:
+        indexes[key] = _build_index(sqlpath, util.read(sqlpath).splitlines())
+    return indexes[key]
+
+
+def _build_index(sqlpath: Path, lines: list[str]) -> SqlIndex:
     position: dict[str, tuple[int, int]] = {}
-    for i, l in enumerate(original_sql_lines):
+    for i, l in enumerate(lines):
+        # most lines have no marker
+        if "tdsql-" not in l:
+            continue
+
         match_ = oneline_comment_pattern.match(l)
         if match_ is not None:
             ident = match_.group(1)
@@ -76,19 +104,39 @@ def _replace_sql(sqlpath: Path, replace: dict[str, str]) -> str:
                 f"{sqlpath}: `{k}` started at line {v[0]+1} but it does not end"
             )
 
-    # exec replacement
-    replaced_sql_lines: list[str | None] = original_sql_lines.copy()  # type: ignore
+    return SqlIndex(lines, position)
+
+
+def _replace_sql(
+    sqlpath: Path,
+    replace: dict[str, str],
+    indexes: dict[Path, SqlIndex] | None = None,
+) -> str:
+    index = _index_sql(sqlpath, indexes)
+    original_sql_lines = index.lines
+
+    # check where to replace
+    replacements: list[tuple[int, int, str]] = []
     collision_check: set[int] = set()
 
     for ident, text in replace.items():
         match_ = range_ident_pattern.match(ident)
         if match_ is not None:
             # convert 1-based row number into 0-based index
-            position[ident] = (int(match_.group(1)) - 1, int(match_.group(2)) - 1)
-        elif ident not in position.keys():
+            s, e = int(match_.group(1)) - 1, int(match_.group(2)) - 1
+        elif ident in index.position.keys():
+            s, e = index.position[ident]
+        else:
             raise InvalidInputError(f"{sqlpath}: `{ident}` does not appear")
 
-        for i in range(position[ident][0], position[ident][1] + 1):
+        # 1-based line numbers must be in the file
+        n = len(original_sql_lines)
+        if not 0 <= s < n or e >= n:
+            raise InvalidInputError(
+                f"{sqlpath}: line {ident} is out of range ({n} lines)"
+            )
+
+        for i in range(s, e + 1):
             if i in collision_check:
                 raise InvalidInputError(f"{sqlpath}: cannot replace line {i+1} twice")
             else:
@@ -100,7 +148,6 @@ def _replace_sql(sqlpath: Path, replace: dict[str, str]) -> str:
             if match_ is None:
                 continue
             if match_.group(1) == "this":
-                s, e = position[ident]
                 text = "\n".join(
                     text_lines[:i] + original_sql_lines[s : e + 1] + text_lines[i + 1 :]
                 )
@@ -109,9 +156,15 @@ def _replace_sql(sqlpath: Path, replace: dict[str, str]) -> str:
                     f"only `-- tdsql-line: this` is allowed but got `{ident}`"
                 )
 
-        start, end = position[ident]
-        replaced_sql_lines[start] = text
-        for i in range(start, end):
-            replaced_sql_lines[i + 1] = None
+        replacements.append((s, e, text))
 
-    return "\n".join([line for line in replaced_sql_lines if line is not None])
+    # exec replacement
+    replaced_sql_lines: list[str] = []
+    prev = 0
+    for s, e, text in sorted(replacements):
+        replaced_sql_lines.extend(original_sql_lines[prev:s])
+        replaced_sql_lines.append(text)
+        prev = max(s, e) + 1
+    replaced_sql_lines.extend(original_sql_lines[prev:])
+
+    return "\n".join(replaced_sql_lines)
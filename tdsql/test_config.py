@@ -1,4 +1,7 @@
 from dataclasses import dataclass
+from typing import Any
+
+from tdsql.exception import InvalidInputError
 
 
 @dataclass(eq=True)
@@ -6,6 +9,30 @@ class TdsqlTestConfig:
     database: str  # NOTE cannnot use Literal here
     max_bytes_billed: int = 1024**3  # 1GiB
     auto_sort: bool = True
+    auto_sort_method: str = "sort"  # sort or hash
     acceptable_error: float = 1.0e-3
     ignore_column_name: bool = False
     max_threads: int = 4
+    translate_bigquery: bool = False  # only for duckdb
+    project: str = ""  # only for bigquery
+    credentials: str = ""  # only for bigquery
+
+    def __post_init__(self) -> None:
+        if self.auto_sort_method not in ("sort", "hash"):
+            raise InvalidInputError(
+                "auto_sort_method should be sort or hash "
+                + f"but got {self.auto_sort_method}"
+            )
+
+    def job_key(self) -> tuple[Any, ...]:
+        """Fields which decide the result of a query other than the sql.
+
+        Queries are deduplicated, batched and cached by them.
+        """
+        return (
+            self.database,
+            self.max_bytes_billed,
+            self.translate_bigquery,
+            self.project,
+            self.credentials,
+        )
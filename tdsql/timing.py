@@ -0,0 +1,195 @@
+"""Timing of each phase of a run (see `--timing-report` and `--trace`).
+
+Phases are recorded by `span()` or `record()` into the active `Timeline`,
+they do nothing unless a timeline is activated. Each span is labeled
+with a test (or a query), which is taken over by the thread executing
+the task (see `task()`) so that clients do not have to know it.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock, current_thread, local
+from typing import Any, Callable, Iterator, TypeVar
+import json
+import os
+import time
+
+from tdsql.test_case import TdsqlTestCase
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Span:
+    name: str
+    label: str
+    thread_id: int
+    thread_name: str
+    start: float  # seconds from the origin of the timeline
+    end: float
+
+
+class Timeline:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.spans: list[Span] = []
+        self._lock = Lock()
+
+    def add(self, name: str, start: float, end: float, label: str = "") -> None:
+        """Add a span, start and end are given by `time.perf_counter()`."""
+        thread = current_thread()
+        span = Span(
+            name,
+            label,
+            thread.ident or 0,
+            thread.name,
+            start - self.origin,
+            end - self.origin,
+        )
+        with self._lock:
+            self.spans.append(span)
+
+    def report(self) -> dict[str, Any]:
+        """Total time of each phase and of each test (the slowest first).
+
+        Time of a test is covered by any of its spans, nested spans
+        (e.g. `execute` in `query`) are not counted twice.
+        """
+        phases: dict[str, dict[str, Any]] = {}
+        tests: dict[str, dict[str, float]] = {}
+        intervals: dict[str, list[tuple[float, float]]] = {}
+
+        for s in self.spans:
+            duration = s.end - s.start
+            phase = phases.setdefault(s.name, {"count": 0, "seconds": 0.0, "max": 0.0})
+            phase["count"] += 1
+            phase["seconds"] += duration
+            phase["max"] = max(phase["max"], duration)
+
+            if s.label != "":
+                test = tests.setdefault(s.label, {})
+                test[s.name] = test.get(s.name, 0.0) + duration
+                intervals.setdefault(s.label, []).append((s.start, s.end))
+
+        return {
+            "seconds": max((s.end for s in self.spans), default=0.0),
+            "phases": phases,
+            "tests": sorted(
+                [
+                    {"label": label, "seconds": _covered(intervals[label]), "phases": p}
+                    for label, p in tests.items()
+                ],
+                key=lambda t: -float(t["seconds"]),
+            ),
+        }
+
+    def write_report(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(), indent=2))
+
+    def write_trace(self, path: Path) -> None:
+        """Write Chrome trace event format (open it by chrome://tracing or Perfetto)."""
+        pid = os.getpid()
+        events: list[dict[str, Any]] = []
+
+        threads = {s.thread_id: s.thread_name for s in self.spans}
+        for tid, name in threads.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+
+        for s in self.spans:
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": "tdsql",
+                    "ph": "X",
+                    "ts": s.start * 1e6,
+                    "dur": (s.end - s.start) * 1e6,
+                    "pid": pid,
+                    "tid": s.thread_id,
+                    "args": {"label": s.label},
+                }
+            )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+
+_active: Timeline | None = None
+_local = local()
+
+
+def activate(timeline: Timeline | None) -> None:
+    """Record spans into the timeline (or stop recording if None)."""
+    global _active
+    _active = timeline
+
+
+def record(name: str, start: float, label: str | None = None) -> None:
+    """Record a span which started at `start` and ends now."""
+    if _active is not None:
+        _active.add(name, start, time.perf_counter(), _label(label))
+
+
+@contextmanager
+def span(name: str, label: str | None = None) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, label)
+
+
+@contextmanager
+def task(label: str) -> Iterator[None]:
+    """Spans in this context (and in this thread) are labeled by default."""
+    previous = getattr(_local, "label", "")
+    _local.label = label
+    try:
+        yield
+    finally:
+        _local.label = previous
+
+
+def timed(name: str, label: str, func: Callable[..., T]) -> Callable[..., T]:
+    """Wrap the function to be submitted to a pool.
+
+    Time between now and the call is recorded as `queue_wait`.
+    """
+    submitted = time.perf_counter()
+
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        record("queue_wait", submitted, label)
+        with task(label), span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _covered(intervals: list[tuple[float, float]]) -> float:
+    """Length of the union of the intervals."""
+    total = 0.0
+    covered_until = float("-inf")
+    for start, end in sorted(intervals):
+        if end > covered_until:
+            total += end - max(start, covered_until)
+            covered_until = end
+    return total
+
+
+def label_of(test: TdsqlTestCase) -> str:
+    return f"{test.sqlpath.stem}_{test.id}"
+
+
+def _label(label: str | None) -> str:
+    if label is not None:
+        return label
+    return str(getattr(_local, "label", ""))
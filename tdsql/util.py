@@ -1,4 +1,9 @@
 from pathlib import Path
+from typing import Callable
+import os
+import uuid
+
+from tdsql.exception import InvalidInputError
 
 
 def read(filepath: Path) -> str:
@@ -12,3 +17,35 @@ def write(filepath: Path, text: str) -> None:
 
     with open(filepath, "w") as f:
         f.write(text)
+
+
+def strip_sql(sql: str) -> str:
+    """Remove whitespaces and `;` at both ends.
+
+    The result can be embedded as a subquery and identical queries are
+    written in the same way.
+    """
+    return sql.strip().rstrip(";").rstrip()
+
+
+def write_atomic(filepath: Path, write_: Callable[[Path], object]) -> None:
+    """Write by `write_(tmp_path)` and rename it, readers never see a partial file.
+
+    The temporary file is removed if `write_` fails.
+    """
+    tmp_path = filepath.with_name(f"{filepath.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        write_(tmp_path)
+        os.replace(tmp_path, filepath)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def require_pyarrow(purpose: str) -> None:
+    """Raise InvalidInputError if pyarrow (the `arrow` extra) is not installed."""
+    try:
+        import pyarrow  # type: ignore # noqa: F401
+    except ImportError:
+        raise InvalidInputError(
+            f"pyarrow is required {purpose}, run `pip install 'tdsql[arrow]'`"
+        ) from None
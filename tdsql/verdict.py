@@ -0,0 +1,292 @@
+"""Verdicts of tests by their downloaded results.
+
+Used by the command and also by comparison elsewhere (see `tdsql.parallel`
+and `tdsql.server_diff`), results are pd.DataFrame or pyarrow.Table
+(`--arrow`).
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final
+import json
+
+from tdsql.exception import TdsqlAssertionError, TdsqlInternalError
+from tdsql.run_config import TdsqlRunConfig
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import log_writer
+
+# pandas is imported when it is needed (see tdsql.command)
+if TYPE_CHECKING:
+    import pandas as pd
+
+MAX_REPORTED_ROWS: Final[int] = 10
+# mismatching rows downloaded for each side by tdsql.server_diff
+MAX_DIFF_ROWS: Final[int] = 1000
+# types of columns in the database, kept by results whose values
+# went through json (see tdsql.batch)
+TYPES_KEY: Final[str] = "tdsql_types"
+
+
+def compare_results(test: TdsqlTestCase, config: TdsqlTestConfig) -> None:
+    if test.actual_sql_result is None or test.expected_sql_result is None:
+        raise TdsqlInternalError()
+
+    if isinstance(test.actual_sql_result, Exception):
+        raise TdsqlAssertionError(
+            f"{test.sqlpath}_{test.id}: invalid query\n"
+            + f"{test.actual_sql}\n{test.expected_sql_result}"
+        )
+
+    elif isinstance(test.expected_sql_result, Exception):
+        raise TdsqlAssertionError(
+            f"{test.sqlpath}_{test.id}: invalid query\n"
+            + f"{test.expected_sql}\n{test.expected_sql_result}"
+        )
+
+    # pd.DataFrame or pyarrow.Table (--arrow)
+    actual: Any = test.actual_sql_result
+    expected: Any = test.expected_sql_result
+    is_arrow = not _is_pandas(actual)
+    if is_arrow:
+        from tdsql import arrow
+
+    check_columns(test, actual, expected, config)
+    check_types(test, actual, expected, config)
+    if not config.ignore_column_name:
+        expected = _select_columns(expected, _columns(actual))
+
+    if config.auto_sort and config.auto_sort_method == "hash":
+        from tdsql import compare
+
+        diff_multiset = arrow.diff_multiset if is_arrow else compare.diff_multiset
+        actual_only, expected_only = diff_multiset(
+            actual, expected, config.acceptable_error
+        )
+        if len(actual_only) > 0 or len(expected_only) > 0:
+            raise TdsqlAssertionError(
+                f"{test.sqlpath}_{test.id}: rows do not match\n"
+                + format_rows("actual only", actual_only)
+                + "\n"
+                + format_rows("expected only", expected_only)
+            )
+        return
+
+    if config.auto_sort and is_arrow:
+        actual = arrow.sort(actual)
+        expected = arrow.sort(expected)
+    elif config.auto_sort:
+        # do not sort in place, results may be shared
+        actual = actual.sort_values(by=list(actual.columns.values), ignore_index=True)
+        expected = expected.sort_values(
+            by=list(expected.columns.values), ignore_index=True
+        )
+
+    nrow = min(actual.shape[0], expected.shape[0])
+    check_values(test, _head(actual, nrow), _head(expected, nrow), config)
+
+    if actual.shape[0] > expected.shape[0]:
+        raise TdsqlAssertionError(
+            f"{test.sqlpath}_{test.id}: actual result is longer than expected result"
+        )
+    elif actual.shape[0] < expected.shape[0]:
+        raise TdsqlAssertionError(
+            f"{test.sqlpath}_{test.id}: expected result is longer than actual result"
+        )
+
+
+def check_columns(
+    test: TdsqlTestCase,
+    actual: Any,
+    expected: Any,
+    config: TdsqlTestConfig,
+) -> None:
+    if config.ignore_column_name:
+        actual_ncol = len(_columns(actual))
+        expected_ncol = len(_columns(expected))
+
+        if actual_ncol != expected_ncol:
+            raise TdsqlAssertionError(
+                f"{test.sqlpath}_{test.id}: number of columns does not match\n"
+                + f"actual: {actual_ncol}, expected {expected_ncol}"
+            )
+
+    else:
+        actual_column_set = set(_columns(actual))
+        expected_column_set = set(_columns(expected))
+
+        actual_only_set = actual_column_set - expected_column_set
+        expected_only_set = expected_column_set - actual_column_set
+
+        if len(actual_only_set) > 0:
+            raise TdsqlAssertionError(
+                f"{test.sqlpath}_{test.id}: "
+                + f"{actual_only_set} only exsists in actual result"
+            )
+        elif len(expected_only_set) > 0:
+            raise TdsqlAssertionError(
+                f"{test.sqlpath}_{test.id}: "
+                + f"{expected_only_set} only exsists in expected result"
+            )
+
+        # names may be duplicated (e.g. `SELECT 1 a, 2 a` in DuckDB)
+        actual_counts = Counter(_columns(actual))
+        expected_counts = Counter(_columns(expected))
+        if actual_counts != expected_counts:
+            duplicated = {
+                c for c in actual_counts if actual_counts[c] != expected_counts[c]
+            }
+            raise TdsqlAssertionError(
+                f"{test.sqlpath}_{test.id}: "
+                + f"number of columns named {duplicated} does not match"
+            )
+
+
+def check_types(
+    test: TdsqlTestCase,
+    actual: Any,
+    expected: Any,
+    config: TdsqlTestConfig,
+) -> None:
+    """Compare types of columns if both results keep them (see `with_types()`)."""
+    actual_types = column_types(actual)
+    expected_types = column_types(expected)
+    if actual_types is None or expected_types is None:
+        return
+
+    if not config.ignore_column_name:
+        positions = _positions(_columns(expected), _columns(actual))
+        expected_types = [expected_types[i] for i in positions]
+
+    for i, (a, e) in enumerate(zip(actual_types, expected_types)):
+        if a != e:
+            column = i + 1 if config.ignore_column_name else _columns(actual)[i]
+            raise TdsqlAssertionError(
+                f"{test.sqlpath}_{test.id}: type does not match "
+                + f"at column: {column}\n"
+                + f"actual: {a}, expected: {e}"
+            )
+
+
+def with_types(result: Any, types: list[str]) -> Any:
+    """Keep types of columns in the database with the result.
+
+    Used where values lose their types (e.g. through json in `tdsql.batch`).
+    """
+    if _is_pandas(result):
+        result.attrs[TYPES_KEY] = types
+        return result
+
+    metadata = dict(result.schema.metadata or {})
+    metadata[TYPES_KEY.encode()] = json.dumps(types).encode()
+    return result.replace_schema_metadata(metadata)
+
+
+def column_types(result: Any) -> list[str] | None:
+    """Return types kept by `with_types()`, None if they are not kept."""
+    if _is_pandas(result):
+        types = result.attrs.get(TYPES_KEY)
+        return None if types is None else list(types)
+
+    value = (result.schema.metadata or {}).get(TYPES_KEY.encode())
+    return None if value is None else list(json.loads(value))
+
+
+def check_values(
+    test: TdsqlTestCase,
+    actual: Any,
+    expected: Any,
+    config: TdsqlTestConfig,
+    offset: int = 0,
+) -> None:
+    """Compare results of the same shape, `offset` is added to line numbers."""
+    if _is_pandas(actual):
+        from tdsql import compare
+
+        mismatch = compare.find_first_mismatch(
+            actual, expected, config.acceptable_error
+        )
+    else:
+        from tdsql import arrow
+
+        mismatch = arrow.find_first_mismatch(actual, expected, config.acceptable_error)
+
+    if mismatch is not None:
+        i, c = mismatch
+        column = c + 1 if config.ignore_column_name else _columns(actual)[c]
+        raise TdsqlAssertionError(
+            f"{test.sqlpath}_{test.id}: value does not match "
+            + f"at line: {offset+i+1}, column: {column}\n"
+            + f"actual: {_value(actual, i, c)}, expected: {_value(expected, i, c)}"
+        )
+
+
+def format_rows(title: str, rows: pd.DataFrame, total: int | None = None) -> str:
+    """`total` is given if `rows` is a part of them."""
+    if total is None:
+        total = len(rows)
+    res = f"{title}: {total} rows"
+    if len(rows) > 0:
+        res += "\n" + rows.head(MAX_REPORTED_ROWS).to_string(index=False)
+    if total > MAX_REPORTED_ROWS:
+        res += "\n..."
+    return res
+
+
+def write_result_logs(
+    test: TdsqlTestCase, log_dir: Path, run_config: TdsqlRunConfig
+) -> None:
+    """Write logs synchronously (used where LogWriter is not available)."""
+    if run_config.log_failures_only:
+        log_writer.write_queries(test, log_dir)
+    log_writer.write_results(
+        test,
+        log_dir,
+        test.actual_sql_result,
+        test.expected_sql_result,
+        run_config.log_format,
+        run_config.log_compression,
+    )
+
+
+# helpers to handle both pd.DataFrame and pyarrow.Table
+def _is_pandas(result: Any) -> bool:
+    import pandas as pd
+
+    return isinstance(result, pd.DataFrame)
+
+
+def _columns(result: Any) -> list[Any]:
+    if _is_pandas(result):
+        return list(result.columns.values)
+    return list(result.column_names)
+
+
+def _select_columns(result: Any, columns: list[Any]) -> Any:
+    """Select by positions, n-th column of a duplicated name is the n-th one."""
+    indices = _positions(_columns(result), columns)
+    if _is_pandas(result):
+        return result.iloc[:, indices]
+    return result.select(indices)
+
+
+def _positions(names: list[Any], columns: list[Any]) -> list[int]:
+    """Return the position in `names` of each of `columns`."""
+    positions: dict[Any, list[int]] = {}
+    for i, c in enumerate(names):
+        positions.setdefault(c, []).append(i)
+    return [positions[c].pop(0) for c in columns]
+
+
+def _head(result: Any, n: int) -> Any:
+    if _is_pandas(result):
+        return result.iloc[:n]
+    return result.slice(0, n)
+
+
+def _value(result: Any, i: int, c: int) -> Any:
+    if _is_pandas(result):
+        return result.iloc[i, c]
+    return result.column(c)[i].as_py()
@@ -0,0 +1,58 @@
+"""Set `TDSQL_RECORD` or `TDSQL_REPLAY` (path of a cassette directory)
+to record query results of the tests or to run them without database.
+
+    TDSQL_RECORD=tests/cassette pytest  # once, with credentials
+    TDSQL_REPLAY=tests/cassette pytest  # offline
+"""
+
+from pathlib import Path
+from typing import Any, Iterator
+import os
+
+import pandas as pd
+import pytest
+
+from tdsql import client
+from tdsql.cassette import RecordingClient, ReplayClient
+from tdsql.test_config import TdsqlTestConfig
+
+
+@pytest.fixture(autouse=True)
+def cassette(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    record = os.environ.get("TDSQL_RECORD")
+    replay = os.environ.get("TDSQL_REPLAY")
+    get_client = client.get_client
+
+    if replay:
+        monkeypatch.setattr(
+            client, "get_client", lambda database: ReplayClient(Path(replay))
+        )
+    elif record:
+        monkeypatch.setattr(
+            client,
+            "get_client",
+            lambda database: RecordingClient(get_client(database), Path(record)),
+        )
+
+    yield
+
+
+@pytest.fixture
+def duckdb_client() -> Any:
+    """DuckDBClient which keeps executed queries in `sqls`."""
+    duckdb = pytest.importorskip("tdsql.client.duckdb")
+
+    class _CountingClient(duckdb.DuckDBClient):  # type: ignore
+        def __init__(self) -> None:
+            super().__init__()
+            self.sqls: list[str] = []
+
+        def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+            self.sqls.append(sql)
+            return super().select(sql, config)
+
+        def schema(self, sql: str, config: TdsqlTestConfig) -> list[tuple[str, str]]:
+            self.sqls.append(sql)
+            return super().schema(sql, config)
+
+    return _CountingClient()
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tdsql import compare
+
+pa = pytest.importorskip("pyarrow")
+arrow = pytest.importorskip("tdsql.arrow")
+
+
+@pytest.mark.parametrize(
+    "actual,expected",
+    [
+        (
+            pd.DataFrame({"a": [1, 2, 3], "b": ["x", "z", "y"]}),
+            pd.DataFrame({"a": [1, 2, 4], "b": ["x", "y", "y"]}),
+        ),
+        (
+            pd.DataFrame({"a": [1.0, 1.0, np.nan, 2.0]}),
+            pd.DataFrame({"a": [1.001, 1.002, np.nan, 2.0]}),
+        ),
+        (
+            pd.DataFrame({"a": [1, 2]}),
+            pd.DataFrame({"a": [1.0, 2.0]}),
+        ),
+        (
+            pd.DataFrame({"a": pd.array([None, 1, 2], dtype="Int64")}),
+            pd.DataFrame({"a": pd.array([None, None, 2], dtype="Int64")}),
+        ),
+        (
+            pd.DataFrame({"a": [{"x": 1}, {"x": 2}]}),
+            pd.DataFrame({"a": [{"x": 1}, {"x": 3}]}),
+        ),
+        (
+            pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}),
+            pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}),
+        ),
+    ],
+)
+def test_find_first_mismatch(actual: pd.DataFrame, expected: pd.DataFrame) -> None:
+    result = arrow.find_first_mismatch(
+        pa.Table.from_pandas(actual), pa.Table.from_pandas(expected), 1.0e-3
+    )
+
+    assert result == compare.find_first_mismatch(actual, expected, 1.0e-3)
+
+
+def test_sort() -> None:
+    table = pa.table({"a": [2, 1, 1], "b": ["x", "z", "y"]})
+
+    assert arrow.sort(table).to_pydict() == {"a": [1, 1, 2], "b": ["y", "z", "x"]}
+
+
+def test_write_csv(tmp_path: Path) -> None:
+    arrow.write_csv(pa.table({"a": [1], "b": [{"x": 1}]}), tmp_path / "nested.csv")
+
+    assert (tmp_path / "nested.csv").is_file()
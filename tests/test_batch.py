@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from tdsql.batch import QueryBatcher
+from tdsql.client.base import BaseClient
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import verdict
+
+duckdb = pytest.importorskip("tdsql.client.duckdb")
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_query_batcher(arrow: bool, duckdb_client: Any) -> None:
+    config = TdsqlTestConfig(database="duckdb")
+    queries = [
+        "SELECT 1 AS i, 'a' AS s UNION ALL SELECT 2, NULL;",
+        "SELECT [1, 2] AS l -- comment",
+        # no rows
+        "SELECT 1 AS i WHERE false",
+    ]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        batcher = QueryBatcher(pool, batch_size=3, arrow=arrow)
+        futures = [batcher.add(duckdb_client, sql, config) for sql in queries]
+        batcher.flush()
+        results: list[Any] = [f.result(timeout=10) for f in futures]
+
+    types = [verdict.column_types(r) for r in results]
+    if arrow:
+        results = [r.to_pandas() for r in results]
+
+    first = results[0].sort_values("i", ignore_index=True)
+    assert list(first["i"]) == [1, 2]
+    assert first["s"][0] == "a" and pd.isna(first["s"][1])
+    assert [list(v) for v in results[1]["l"]] == [[1, 2]]
+    assert list(results[2].columns) == ["i"] and len(results[2]) == 0
+    # the empty result is fetched again
+    assert batcher.job_count == 1
+    # types of each query and the batched job
+    assert len(duckdb_client.sqls) == (4 if arrow else 5)
+    # the empty result is not through json
+    assert types == [["INTEGER", "VARCHAR"], ["INTEGER[]"], None]
+
+
+def test_query_batcher_fallback(duckdb_client: Any) -> None:
+    config = TdsqlTestConfig(database="duckdb")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        batcher = QueryBatcher(pool, batch_size=2, arrow=False)
+        ok = batcher.add(duckdb_client, "SELECT 1 AS i", config)
+        ng = batcher.add(duckdb_client, "SELECT foo", config)
+        batcher.flush()
+
+        assert ok.result(timeout=10)["i"][0] == 1
+        with pytest.raises(Exception):
+            ng.result(timeout=10)
+
+    # types of the batch (failed at the invalid one), two queries executed
+    # one by one through json and the invalid one executed as it is
+    assert len(duckdb_client.sqls) == 6
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_query_batcher_fallback_types(arrow: bool, duckdb_client: Any) -> None:
+    config = TdsqlTestConfig(database="duckdb")
+    sql = "SELECT TIMESTAMP '2020-01-01' AS t, DATE '2020-01-02' AS d"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        batcher = QueryBatcher(pool, batch_size=2, arrow=arrow)
+        # the batch of actual fails, that of expected does not
+        actual = batcher.add(duckdb_client, sql, config)
+        batcher.add(duckdb_client, "SELECT foo", config)
+        expected = batcher.add(duckdb_client, sql + " -- expected", config)
+        batcher.add(duckdb_client, "SELECT 1 AS i", config)
+        batcher.flush()
+
+        actual_result = actual.result(timeout=10)
+        expected_result = expected.result(timeout=10)
+
+    # types of values do not depend on whether the batch failed
+    assert actual_result.equals(expected_result)
+
+
+def test_query_batcher_accepts() -> None:
+    class _Client(BaseClient):
+        def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+            raise NotImplementedError()
+
+    assert QueryBatcher.accepts(duckdb.DuckDBClient(), TdsqlTestConfig("duckdb"))
+    assert not QueryBatcher.accepts(
+        duckdb.DuckDBClient(), TdsqlTestConfig("duckdb", auto_sort=False)
+    )
+    assert not QueryBatcher.accepts(_Client(), TdsqlTestConfig("stub"))
@@ -0,0 +1,92 @@
+from pathlib import Path
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+from tdsql.cache import CachedClient, ResultCache
+from tdsql.client.base import BaseClient
+from tdsql.exception import InvalidInputError
+from tdsql.test_config import TdsqlTestConfig
+
+pytest.importorskip("pyarrow")
+
+
+class _CountingClient(BaseClient):
+    def __init__(self) -> None:
+        self.cnt = 0
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        self.cnt += 1
+        return pd.DataFrame({"sql": [sql], "i": [self.cnt]})
+
+
+def test_cached_client(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path, 1024**2, 60)
+    inner = _CountingClient()
+    client_ = CachedClient(inner, cache)
+    config = TdsqlTestConfig(database="foo")
+
+    first = client_.select("SELECT 1", config)
+    second = client_.select("SELECT 1", config)
+    client_.select("SELECT 1", TdsqlTestConfig(database="foo", max_bytes_billed=0))
+
+    assert inner.cnt == 2
+    assert first.equals(second)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        TdsqlTestConfig(database="foo", translate_bigquery=True),
+        TdsqlTestConfig(database="foo", project="bar"),
+        TdsqlTestConfig(database="foo", credentials="./bar.json"),
+    ],
+)
+def test_key(config: TdsqlTestConfig) -> None:
+    default = TdsqlTestConfig(database="foo")
+    assert ResultCache.key("SELECT 1", config) != ResultCache.key("SELECT 1", default)
+    assert config.job_key() != default.job_key()
+
+
+def test_evict(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path, 1024**2, 60)
+    config = TdsqlTestConfig(database="foo")
+    keys = [cache.key(f"SELECT {i}", config) for i in range(3)]
+
+    for k in keys:
+        cache.put(k, pd.DataFrame({"i": range(100)}))
+
+    # expired
+    past = time.time() - 120
+    os.utime(tmp_path / f"{keys[0]}.parquet", (past, past))
+    # least recently used
+    past = time.time() - 30
+    os.utime(tmp_path / f"{keys[1]}.parquet", (past, past))
+    cache.max_bytes = (tmp_path / f"{keys[2]}.parquet").stat().st_size
+
+    cache.evict()
+
+    assert [cache.get(k) is not None for k in keys] == [False, False, True]
+
+
+def test_clear(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path, 1024**2, 60)
+    key = cache.key("SELECT 1", TdsqlTestConfig(database="foo"))
+    cache.put(key, pd.DataFrame({"i": [1]}))
+
+    cache.clear()
+
+    assert cache.get(key) is None
+    assert tmp_path.is_dir()
+
+
+def test_pyarrow_required(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # import of the module fails
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    with pytest.raises(InvalidInputError, match=r"tdsql\[arrow\]"):
+        ResultCache(tmp_path, 1024**2, 60)
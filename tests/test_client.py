@@ -6,10 +6,79 @@ from tdsql.test_config import TdsqlTestConfig
 
 @pytest.mark.parametrize(
     "database",
-    ["bigquery"],
+    ["bigquery", "duckdb"],
 )
 def test_select(database: str) -> None:
     client_ = client.get_client(database=database)
     df = client_.select("SELECT 1 AS i;", TdsqlTestConfig(database=database))
 
     assert df["i"].values[0] == 1
+
+
+@pytest.mark.parametrize(
+    "sql,expected",
+    [
+        (
+            "SELECT * FROM `project.dataset.table`",
+            'SELECT * FROM "project"."dataset"."table"',
+        ),
+        # backticks in string literals are not translated
+        ("SELECT '`a`' AS s", "SELECT '`a`' AS s"),
+        (
+            "SELECT * FROM UNNEST([STRUCT(1 AS a, 'x,)' AS b), STRUCT(2, 'y')])",
+            "SELECT * FROM (SELECT * FROM (VALUES (1, 'x,)'), (2, 'y')) "
+            + "AS _unnest(a, b))",
+        ),
+        (
+            "SELECT * FROM UNNEST([STRUCT(STRUCT(1 AS x) AS a)]) AS t",
+            "SELECT * FROM (SELECT * FROM (VALUES (STRUCT(1 AS x))) "
+            + "AS _unnest(a)) AS t",
+        ),
+        # not STRUCT
+        ("SELECT * FROM UNNEST([1, 2])", "SELECT * FROM UNNEST([1, 2])"),
+    ],
+)
+def test_translate_bigquery(sql: str, expected: str) -> None:
+    duckdb = pytest.importorskip("tdsql.client.duckdb")
+    assert duckdb.translate_bigquery(sql) == expected
+
+
+def test_select_duckdb_translated() -> None:
+    pytest.importorskip("duckdb")
+    client_ = client.get_client(database="duckdb")
+    config = TdsqlTestConfig(database="duckdb", translate_bigquery=True)
+    df = client_.select(
+        """
+        WITH `data` AS (
+          SELECT * FROM UNNEST([
+            STRUCT('2020-01-01' AS dt, 100 AS id),
+            STRUCT('2020-01-01', NULL)
+          ])
+        )
+        SELECT dt, COUNT(id) AS cnt FROM `data` GROUP BY dt
+        """,
+        config,
+    )
+
+    assert df.to_dict("list") == {"dt": ["2020-01-01"], "cnt": [1]}
+
+
+def test_dry_run_duckdb() -> None:
+    pytest.importorskip("duckdb")
+    client_ = client.get_client(database="duckdb")
+    config = TdsqlTestConfig(database="duckdb")
+
+    assert client_.dry_run("SELECT 1 AS i", config) == 0
+    with pytest.raises(Exception, match="foo"):
+        client_.dry_run("SELECT foo", config)
+
+
+def test_schema_duckdb() -> None:
+    pytest.importorskip("duckdb")
+    client_ = client.get_client(database="duckdb")
+    config = TdsqlTestConfig(database="duckdb")
+
+    assert client_.schema("SELECT DATE '2020-01-01' AS d, 'a' AS s;", config) == [
+        ("d", "DATE"),
+        ("s", "VARCHAR"),
+    ]
@@ -1,9 +1,20 @@
 from pathlib import Path
+from typing import Any, Iterator
+import contextlib
+import json
+import re
+import shutil
 
+import pandas as pd
 import pytest
 
+from tdsql.client.base import BaseClient
+from tdsql.client.fake import FakeClient
+from tdsql.run_config import TdsqlRunConfig
+from tdsql.test_case import TdsqlTestCase
 from tdsql.test_config import TdsqlTestConfig
 from tdsql.exception import InvalidInputError, TdsqlAssertionError
+from tdsql.logger import logger
 from tdsql import command
 from tdsql import util
 from tdsql import client
@@ -52,212 +63,19 @@ def test_detect_test_config(
     assert actual == expected
 
 
-@pytest.mark.parametrize(
-    "msg,yamlstr,sqlstr",
-    [
-        # most simple
-        (
-            r"value does not match at line: 1, column: 1\nactual: 2, expected: 1",
-            """
-database: bigquery
-ignore_column_name: true
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1
-""",
-            """
-SELECT 2
-""",
-        ),
-        (
-            r"value does not match at line: 2, column: 1\nactual: 3, expected: 2",
-            """
-database: bigquery
-ignore_column_name: true
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1 UNION ALL SELECT 2
-""",
-            """
-SELECT 1 UNION ALL SELECT 3
-""",
-        ),
-        # invalid query
-        (
-            r"invalid query\nSELECT foo",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT foo
-""",
-            """
-SELECT 1
-""",
-        ),
-        (
-            r"invalid query\nSELECT foo",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1
-""",
-            "SELECT foo",
-        ),
-        # auto_sort
-        (
-            r"value does not match at line: 1, column: num\n"
-            + r"actual: 2, expected: 1",
-            """
-database: bigquery
-auto_sort: false
-tests:
-  - filepath: ./tdsql.sql
-    expected: |
-      SELECT 1 AS num UNION ALL
-      SELECT 2
-""",
-            """
-SELECT 2 AS num UNION ALL
-SELECT 1
-""",
-        ),
-        # column does not match
-        (
-            r"""number of columns does not match
-actual: 2, expected 1""",
-            """
-database: bigquery
-ignore_column_name: true
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1
-""",
-            """
-SELECT 1, 2
-""",
-        ),
-        (
-            r"\{'two'\} only exsists in actual result",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1 AS one
-""",
-            """
-SELECT 1 AS one, 2 AS two
-""",
-        ),
-        (
-            r"\{'two'\} only exsists in expected result",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1 AS one, 2 AS two
-""",
-            """
-SELECT 1 AS one
-""",
-        ),
-        # equality
-        (
-            r"value does not match at line: 1, column: one\n"
-            + r"actual: 1, expected: 1.0",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1.0 AS one
-""",
-            """
-SELECT 1 AS one -- type does not match
-""",
-        ),
-        (
-            r"value does not match at line: 1, column: col\n"
-            + r"actual: 1.0, expected: 1.002",
-            """
-database: bigquery
-acceptable_error: 1.0e-3
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1.001 AS col
-  - filepath: ./tdsql.sql
-    expected: SELECT 1.002 AS col
-""",
-            """
-SELECT 1.0 AS col
-""",
-        ),
-        (
-            r"value does not match at line: 1, column: col\n"
-            + r"actual: 1, expected: <NA>",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT NULL AS col
-""",
-            """
-SELECT 1 AS col
-""",
-        ),
-        # number of rows does not match
-        (
-            "actual result is longer than expected result",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: SELECT 1 AS col
-""",
-            """
-SELECT 1 AS col UNION ALL
-SELECT 2
-""",
-        ),
-        (
-            "expected result is longer than actual result",
-            """
-database: bigquery
-tests:
-  - filepath: ./tdsql.sql
-    expected: |
-      SELECT 1 AS col UNION ALL
-      SELECT 2
-""",
-            """
-SELECT 1 AS col
-""",
-        ),
-    ],
-)
-def test_compare_results(msg: str, yamlstr: str, sqlstr: str, tmp_path: Path) -> None:
-    yamlpath = Path(tmp_path) / "tdsql.yaml"
-    sqlpath = Path(tmp_path) / "tdsql.sql"
-
-    util.write(yamlpath, yamlstr)
-    util.write(sqlpath, sqlstr)
-
-    test_config = command._detect_test_config(yamlpath)
-    test_cases = command._detect_test_cases(yamlpath)
-    client_ = client.get_client(test_config.database)
-
-    with pytest.raises(TdsqlAssertionError, match=msg):
-        for t in test_cases:
-            try:
-                t.actual_sql_result = client_.select(t.actual_sql, test_config)
-            except Exception as e:
-                t.actual_sql_result = e
-            try:
-                t.expected_sql_result = client_.select(t.expected_sql, test_config)
-            except Exception as e:
-                t.expected_sql_result = e
+def test_detect_test_config_credentials(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    util.write(tmp_path / "tdsql.yaml", "database: bigquery\ncredentials: ./key.json")
+    util.write(tmp_path / "a" / "tdsql.yaml", "database: bigquery")
+    monkeypatch.chdir(tmp_path / "a")
 
-            command._compare_results(t, test_config)
+    # relative to the yaml file, not to the current directory
+    parent = command._detect_test_config(tmp_path / "tdsql.yaml")
+    assert parent.credentials == str(tmp_path.resolve() / "key.json")
+    # inherited as it is
+    child = command._detect_test_config(tmp_path / "a" / "tdsql.yaml", parent)
+    assert child.credentials == parent.credentials
 
 
 @pytest.mark.parametrize(
@@ -328,3 +146,671 @@ def test_parse_root_yaml_err(msg: str, files: dict[str, str], tmp_path: Path) ->
 
     with pytest.raises(InvalidInputError, match=msg):
         command._parse_root_yaml(tmp_path / "tdsql.yaml")
+
+
+def test_parse_root_yaml_tree(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml", "database: foo\nsource: [a/tdsql.yaml, b/tdsql.yaml]"
+    )
+    for d in ["a", "b"]:
+        util.write(
+            tmp_path / d / "tdsql.yaml", "max_threads: 3\nsource: [x.yml, y.yml]"
+        )
+        for c in ["x", "y"]:
+            util.write(tmp_path / d / f"{c}.yml", "auto_sort: false")
+
+    loaded: list[Path] = []
+    load_yaml = command._load_yaml
+
+    def _load_yaml(yamlpath: Path) -> dict[str, Any]:
+        loaded.append(yamlpath)
+        return load_yaml(yamlpath)
+
+    monkeypatch.setattr(command, "_load_yaml", _load_yaml)
+    test_config_cases = command._parse_root_yaml(tmp_path / "tdsql.yaml")
+
+    expected = ["tdsql.yaml", "a/tdsql.yaml", "a/x.yml", "a/y.yml", "b/tdsql.yaml"]
+    expected += ["b/x.yml", "b/y.yml"]
+    # in the order of definition (depth-first)
+    assert list(test_config_cases.keys()) == [tmp_path / e for e in expected]
+    # loaded once for each
+    assert sorted(loaded) == sorted(test_config_cases.keys())
+
+    config = test_config_cases[tmp_path / "b" / "y.yml"][0]
+    assert (config.database, config.max_threads, config.auto_sort) == ("foo", 3, False)
+
+
+class _StubClient(BaseClient):
+    """Accept only `SELECT <int>`."""
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        keyword, value = sql.split()
+        if keyword != "SELECT":
+            raise ValueError(f"invalid query: {sql}")
+        return pd.DataFrame({"v": [int(value)]})
+
+
+@pytest.mark.parametrize(
+    "run_config",
+    [
+        TdsqlRunConfig(),
+        TdsqlRunConfig(arrow=True),
+        TdsqlRunConfig(compare_processes=2, compare_threshold=1),
+        TdsqlRunConfig(arrow=True, compare_processes=2, compare_threshold=1),
+    ],
+)
+def test_run(
+    run_config: TdsqlRunConfig,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: stub
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+  - filepath: ./tdsql.sql
+    expected: SELECT 2
+  - filepath: ./tdsql.sql
+    expected: FOO 1
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+    monkeypatch.setattr(client, "get_client", lambda database: _StubClient())
+    caplog.set_level("INFO")
+
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", run_config)
+
+    assert "1 tests passed, 2 tests failed" in caplog.text
+    # `SELECT 1` is executed only once
+    assert "3 query jobs were saved by deduplication" in caplog.text
+    assert (tmp_path / command.LOG_DIR_NAME).is_dir()
+
+
+def test_run_batch(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    pytest.importorskip("duckdb")
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: duckdb
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS i
+  - filepath: ./tdsql.sql
+    expected: SELECT 2 AS i
+  - filepath: ./tdsql.sql
+    expected: SELECT foo
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS i")
+    caplog.set_level("INFO")
+
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(batch_size=10))
+
+    assert "3 queries were fused into 1 query jobs" in caplog.text
+    assert "1 tests passed, 2 tests failed" in caplog.text
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+@pytest.mark.parametrize("batch_size", [0, 10])
+def test_run_batch_types(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture, batch_size: int, arrow: bool
+) -> None:
+    pytest.importorskip("duckdb")
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: duckdb
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT '2020-01-01' AS d, 1 AS i
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS i, DATE '2020-01-01' AS d
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT DATE '2020-01-01' AS d, 1 AS i")
+    caplog.set_level("INFO")
+
+    # the verdict does not depend on whether values went through json
+    with pytest.raises(SystemExit):
+        command.run(
+            tmp_path / "tdsql.yaml",
+            TdsqlRunConfig(batch_size=batch_size, arrow=arrow),
+        )
+
+    assert "1 tests passed, 1 tests failed" in caplog.text
+
+
+@pytest.mark.parametrize("batch_size", [0, 10])
+def test_run_translate_bigquery(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture, batch_size: int
+) -> None:
+    pytest.importorskip("duckdb")
+    util.write(tmp_path / "tdsql.yaml", "database: duckdb\nsource: [a.yml, b.yml]")
+    for name, translate in [("a", "true"), ("b", "false")]:
+        util.write(
+            tmp_path / f"{name}.yml",
+            f"""
+translate_bigquery: {translate}
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS x
+""",
+        )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS `x`")
+    caplog.set_level("INFO")
+
+    # the query is not shared between a.yml and b.yml
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(batch_size=batch_size))
+
+    assert "1 tests passed, 1 tests failed" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "expected,max_bytes_billed,msg",
+    [
+        ("SELECT 1 AS v", 100, None),
+        ("SELECT foo", 100, "tdsql.sql_[0-9]+: invalid query\nSELECT foo"),
+        (
+            "SELECT 1 AS v",
+            10,
+            "tdsql.sql_[0-9]+: 50 bytes will be processed but max_bytes_billed is 10",
+        ),
+    ],
+)
+def test_run_dry_run(
+    expected: str,
+    max_bytes_billed: int,
+    msg: str | None,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        f"""
+database: fake
+max_bytes_billed: {max_bytes_billed}
+tests:
+  - filepath: ./tdsql.sql
+    expected: {expected}
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS v")
+    client_ = FakeClient(
+        {"SELECT 1 AS v": pd.DataFrame({"v": [1]})},
+        bytes_processed={"SELECT 1 AS v": 50},
+    )
+    monkeypatch.setattr(client, "get_client", lambda database: client_)
+    caplog.set_level("INFO")
+
+    if msg is None:
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(dry_run=True))
+        assert "50 (actual), 50 (expected) bytes will be processed" in caplog.text
+        assert client_.select_count == 1
+    else:
+        with pytest.raises(SystemExit):
+            command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(dry_run=True))
+        assert re.search(msg, caplog.text)
+        # fail fast
+        assert "dry run failed, no query is executed" in caplog.text
+        assert client_.select_count == 0
+
+
+@pytest.fixture
+def cli_logger() -> Iterator[None]:
+    """Remove the handler which `main()` adds to the logger."""
+    handlers = list(logger.handlers)
+    level = logger.level
+    yield
+    for h in logger.handlers[:]:
+        if h not in handlers:
+            logger.removeHandler(h)
+    logger.setLevel(level)
+
+
+def test_main_dry_run(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    cli_logger: None,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        "database: fake\ntests:\n"
+        + "  - filepath: ./tdsql.sql\n    expected: SELECT 1 AS v\n",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS v")
+    client_ = FakeClient(
+        {"SELECT 1 AS v": pd.DataFrame({"v": [1]})},
+        bytes_processed={"SELECT 1 AS v": 50},
+    )
+    monkeypatch.setattr(client, "get_client", lambda database: client_)
+    monkeypatch.chdir(tmp_path)
+
+    command.main(["--dry-run"])
+
+    # INFO is written by the command line interface
+    err = capsys.readouterr().err
+    assert "50 (actual), 50 (expected) bytes will be processed" in err
+    assert "1 tests passed, 0 tests failed" in err
+
+
+@pytest.mark.parametrize(
+    "argv,msg",
+    [
+        # SELECT 1 AS v is executed only once
+        ([], "3 query jobs were saved by deduplication"),
+        (["--cache"], "cache: 0 hits, 1 misses"),
+        ([], "the longest test is"),
+    ],
+)
+def test_main_summary(
+    argv: list[str],
+    msg: str,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    cli_logger: None,
+) -> None:
+    tests = "  - filepath: ./tdsql.sql\n    expected: SELECT 1 AS v\n"
+    util.write(tmp_path / "tdsql.yaml", f"database: fake\ntests:\n{tests * 2}")
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS v")
+    client_ = FakeClient({"SELECT 1 AS v": pd.DataFrame({"v": [1]})})
+    monkeypatch.setattr(client, "get_client", lambda database: client_)
+    monkeypatch.chdir(tmp_path)
+
+    command.main(argv)
+
+    assert msg in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("compare_processes", [0, 2])
+def test_run_log_failures_only(
+    compare_processes: int,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: stub
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+  - filepath: ./tdsql.sql
+    expected: SELECT 2
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+    monkeypatch.setattr(client, "get_client", lambda database: _StubClient())
+    run_config = TdsqlRunConfig(
+        log_format="parquet",
+        log_failures_only=True,
+        compare_processes=compare_processes,
+        compare_threshold=1,
+    )
+
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", run_config)
+
+    logs = sorted(p.name for p in (tmp_path / command.LOG_DIR_NAME).iterdir())
+    assert [re.sub("[0-9]+", "N", p) for p in logs] == [
+        ".gitignore",
+        "tdsql_N_actual.parquet",
+        "tdsql_N_actual.sql",
+        "tdsql_N_expected.parquet",
+        "tdsql_N_expected.sql",
+    ]
+    assert pd.read_parquet(
+        next((tmp_path / command.LOG_DIR_NAME).glob("*_expected.parquet"))
+    )["v"].tolist() == [2]
+
+
+class _ObjectStubClient(BaseClient):
+    """Return `<int>` of `SELECT <int>` in an object column, `MIXED` with a str."""
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        keyword, value = sql.split()
+        if keyword == "SELECT":
+            return pd.DataFrame({"v": [int(value)]})
+        values: list[Any] = [int(value)] if keyword == "OBJECT" else [int(value), "a"]
+        return pd.DataFrame({"v": pd.Series(values, dtype=object)})
+
+
+@pytest.mark.parametrize("compare_processes", [0, 2])
+def test_run_compare_processes_object(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    compare_processes: int,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: stub
+auto_sort: false
+tests:
+  - filepath: ./tdsql.sql
+    expected: OBJECT 1
+  - filepath: ./mixed.sql
+    expected: MIXED 1
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+    # a column of mixed types cannot be converted into arrow
+    util.write(tmp_path / "mixed.sql", "MIXED 1")
+    monkeypatch.setattr(client, "get_client", lambda database: _ObjectStubClient())
+    caplog.set_level("INFO")
+
+    # int64 and integers in an object column do not match in any process
+    with pytest.raises(SystemExit):
+        command.run(
+            tmp_path / "tdsql.yaml",
+            TdsqlRunConfig(compare_processes=compare_processes, compare_threshold=1),
+        )
+
+    assert "1 tests passed, 1 tests failed" in caplog.text
+
+
+def test_run_replay(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: stub
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+  - filepath: ./tdsql.sql
+    expected: FOO 1
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+    cassette_dir = tmp_path / "cassette"
+    caplog.set_level("INFO")
+
+    monkeypatch.setattr(client, "get_client", lambda database: _StubClient())
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(record=cassette_dir))
+    assert "1 tests passed, 1 tests failed" in caplog.text
+
+    # database is not needed any more
+    monkeypatch.setattr(client, "get_client", None)
+    caplog.clear()
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(replay=cassette_dir))
+    assert "1 tests passed, 1 tests failed" in caplog.text
+    assert "ValueError: invalid query: FOO 1" in caplog.text
+
+
+def test_run_changed_only(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: stub
+tests:
+  - filepath: ./tdsql1.sql
+    expected: SELECT 1
+  - filepath: ./tdsql2.sql
+    expected: SELECT 2
+""",
+    )
+    util.write(tmp_path / "tdsql1.sql", "SELECT 1")
+    util.write(tmp_path / "tdsql2.sql", "SELECT 2")
+    monkeypatch.setattr(client, "get_client", lambda database: _StubClient())
+    caplog.set_level("INFO")
+    run_config = TdsqlRunConfig(changed_only=True)
+
+    command.run(tmp_path / "tdsql.yaml", run_config)
+    assert "2 tests passed, 0 tests failed" in caplog.text
+
+    caplog.clear()
+    command.run(tmp_path / "tdsql.yaml", run_config)
+    assert "0 tests passed, 0 tests failed" in caplog.text
+
+    caplog.clear()
+    util.write(tmp_path / "tdsql2.sql", "SELECT 3")
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", run_config)
+    assert "0 tests passed, 1 tests failed" in caplog.text
+
+    # failed test is executed again
+    caplog.clear()
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", run_config)
+    assert "0 tests passed, 1 tests failed" in caplog.text
+
+
+class _BatchClient(BaseClient):
+    """Return `SELECT <n>` as n rows, 3 rows per batch (row 5 can be changed)."""
+
+    def __init__(self, row5: int = 5) -> None:
+        self.row5 = row5
+        self.fetched = 0
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        return pd.concat(list(self.select_batches(sql, config)), ignore_index=True)
+
+    def select_batches(
+        self, sql: str, config: TdsqlTestConfig
+    ) -> Iterator[pd.DataFrame]:
+        n = int(sql.split()[1])
+        values = [self.row5 if i == 5 and sql.endswith("x") else i for i in range(n)]
+        yield pd.DataFrame({"v": pd.Series([], dtype="int64")})
+        for i in range(0, n, 3):
+            self.fetched += 1
+            yield pd.DataFrame({"v": values[i : i + 3]})
+
+
+@pytest.mark.parametrize(
+    "msg,actual_sql,expected_sql,row5,fetched",
+    [
+        (None, "SELECT 10", "SELECT 10", 5, 8),
+        (
+            r"value does not match at line: 6, column: v\nactual: 0, expected: 5",
+            "SELECT 100 x",
+            "SELECT 100",
+            0,
+            4,
+        ),
+        ("actual result is longer than expected result", "SELECT 8", "SELECT 7", 5, 6),
+        ("expected result is longer than actual result", "SELECT 7", "SELECT 8", 5, 6),
+    ],
+)
+def test_compare_stream(
+    msg: str | None,
+    actual_sql: str,
+    expected_sql: str,
+    row5: int,
+    fetched: int,
+    tmp_path: Path,
+) -> None:
+    util.write(tmp_path / "tdsql.sql", actual_sql)
+    t = TdsqlTestCase(tmp_path / "tdsql.sql", {}, expected_sql)
+    config = TdsqlTestConfig(database="stub", auto_sort=False)
+    client_ = _BatchClient(row5)
+
+    if msg is None:
+        command._compare_stream(t, config, client_, tmp_path)
+    else:
+        with pytest.raises(TdsqlAssertionError, match=msg):
+            command._compare_stream(t, config, client_, tmp_path)
+
+    assert client_.fetched == fetched
+
+
+def test_run_longest_first(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    tests = ""
+    results: dict[str, pd.DataFrame | Exception] = {}
+    for name in ["a", "b", "c"]:
+        util.write(tmp_path / f"{name}.sql", f"SELECT '{name}' AS v")
+        tests += f"  - filepath: ./{name}.sql\n    expected: SELECT '{name}' AS v\n"
+        results[f"SELECT '{name}' AS v"] = pd.DataFrame({"v": [name]})
+    util.write(
+        tmp_path / "tdsql.yaml", f"database: fake\nmax_threads: 1\ntests:\n{tests}"
+    )
+
+    executed: list[str] = []
+
+    class _Client(FakeClient):
+        def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+            executed.append(sql)
+            return super().select(sql, config)
+
+    monkeypatch.setattr(client, "get_client", lambda database: _Client(results))
+    caplog.set_level("INFO")
+
+    command.run(tmp_path / "tdsql.yaml")
+    assert executed == ["SELECT 'a' AS v", "SELECT 'b' AS v", "SELECT 'c' AS v"]
+
+    manifest_path = tmp_path / command.CACHE_DIR_NAME / command.MANIFEST_FILE_NAME
+    manifest = json.loads(util.read(manifest_path))
+    assert all("seconds" in v for v in manifest["tests"].values())
+    manifest["tests"]["tdsql.yaml:2"]["seconds"] = 10.0
+    util.write(manifest_path, json.dumps(manifest))
+
+    executed.clear()
+    command.run(tmp_path / "tdsql.yaml")
+    assert executed[0] == "SELECT 'c' AS v"
+    assert re.search(r"expected critical path 10\.[0-9]s", caplog.text)
+
+
+def test_run_shard(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    cli_logger: None,
+) -> None:
+    tests = ""
+    for i in range(5):
+        tests += f"  - filepath: ./tdsql.sql\n    expected: SELECT {i % 2} AS v\n"
+    util.write(tmp_path / "tdsql.yaml", f"database: fake\ntests:\n{tests}")
+    util.write(tmp_path / "tdsql.sql", "SELECT 0 AS v")
+    client_ = FakeClient({f"SELECT {i} AS v": pd.DataFrame({"v": [i]}) for i in [0, 1]})
+    monkeypatch.setattr(client, "get_client", lambda database: client_)
+
+    reports = [tmp_path / "shard1.json", tmp_path / "shard2.json"]
+    for i, path in enumerate(reports):
+        run_config = TdsqlRunConfig(shard=(i + 1, 2), result_json=path)
+        # only shard 2 has failed tests
+        with contextlib.suppress(SystemExit):
+            command.run(tmp_path / "tdsql.yaml", run_config)
+
+    identities = [
+        {t["identity"] for t in json.loads(util.read(p))["tests"]} for p in reports
+    ]
+    assert [len(i) for i in identities] == [3, 2]
+    assert identities[0] | identities[1] == {f"tdsql.yaml:{i}" for i in range(5)}
+
+    caplog.set_level("INFO")
+    output = tmp_path / "merged.json"
+    with pytest.raises(SystemExit):
+        command.main(["merge", "-o", str(output)] + [str(p) for p in reports])
+
+    merged = json.loads(util.read(output))
+    assert (merged["total"], merged["passed"], merged["failed"]) == (5, 3, 2)
+    assert "3 tests passed, 2 tests failed" in caplog.text
+    assert "missing" not in caplog.text
+
+    # a report of a shard is missing
+    with pytest.raises(SystemExit):
+        command.main(["merge", "-o", str(output), str(reports[0])])
+    assert "reports of shard [2] are missing" in caplog.text
+
+    # a test is reported twice
+    with pytest.raises(SystemExit):
+        command.main(["merge", "-o", str(output)] + [str(reports[0])] * 2)
+    assert "is reported twice" in caplog.text
+
+
+def test_run_shard_runners(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    cli_logger: None,
+) -> None:
+    tests = ""
+    for i in range(7):
+        util.write(tmp_path / "project" / f"{i}.sql", f"SELECT {i} AS v")
+        tests += f"  - filepath: ./{i}.sql\n    expected: SELECT {i} AS v\n"
+    util.write(tmp_path / "project" / "tdsql.yaml", f"database: fake\ntests:\n{tests}")
+    client_ = FakeClient(
+        {f"SELECT {i} AS v": pd.DataFrame({"v": [i]}) for i in range(7)},
+        latency=0.01,
+    )
+    monkeypatch.setattr(client, "get_client", lambda database: client_)
+    caplog.set_level("INFO")
+
+    # each runner has its own checkout and .tdsql_cache
+    runners = [tmp_path / "runner1", tmp_path / "runner2"]
+    for r in runners:
+        shutil.copytree(tmp_path / "project", r)
+
+    durations: Path | None = None
+    for run in ["first", "second", "third"]:
+        reports = [tmp_path / run / f"shard{i + 1}.json" for i in range(2)]
+        for i, r in enumerate(runners):
+            command.run(
+                r / "tdsql.yaml",
+                TdsqlRunConfig(
+                    shard=(i + 1, 2), durations=durations, result_json=reports[i]
+                ),
+            )
+
+        output = tmp_path / run / "merged.json"
+        command.main(["merge", "-o", str(output)] + [str(p) for p in reports])
+        merged = json.loads(util.read(output))
+        assert (merged["total"], merged["passed"]) == (7, 7)
+
+        # shards of the third run are balanced by durations of the second
+        if run == "second":
+            durations = output
+
+
+def test_run_max_failures(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    tests = ""
+    for i in range(1, 11):
+        tests += f"  - filepath: ./tdsql.sql\n    expected: SELECT {i} AS v\n"
+    util.write(
+        tmp_path / "tdsql.yaml", f"database: fake\nmax_threads: 1\ntests:\n{tests}"
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 0 AS v")
+    client_ = FakeClient(
+        {f"SELECT {i} AS v": pd.DataFrame({"v": [i]}) for i in range(11)},
+        latency=0.1,
+    )
+    monkeypatch.setattr(client, "get_client", lambda database: client_)
+    caplog.set_level("INFO")
+
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(max_failures=2))
+
+    assert "0 tests passed, 2 tests failed" in caplog.text
+    assert "stopped after 2 failures, 8 tests were not run" in caplog.text
+    # the running query is cancelled and the rest are not executed
+    assert client_.cancel_count == 1
+    assert client_.select_count < 11
+
+
+@pytest.mark.parametrize("shard", ["0/2", "3/2", "1"])
+def test_parse_args_shard(shard: str) -> None:
+    with pytest.raises(SystemExit):
+        command._parse_args(["--shard", shard])
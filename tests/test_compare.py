@@ -0,0 +1,230 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tdsql import compare
+
+
+@pytest.mark.parametrize(
+    "actual,expected,result",
+    [
+        # equal
+        (
+            pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}),
+            pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}),
+            None,
+        ),
+        # row-major order
+        (
+            pd.DataFrame({"a": [1, 2, 3], "b": ["x", "z", "y"]}),
+            pd.DataFrame({"a": [1, 2, 4], "b": ["x", "y", "y"]}),
+            (1, 1),
+        ),
+        (
+            pd.DataFrame({"a": [1, 5], "b": ["z", "y"]}),
+            pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}),
+            (0, 1),
+        ),
+        # type does not match
+        (
+            pd.DataFrame({"a": [1]}),
+            pd.DataFrame({"a": [1.0]}),
+            (0, 0),
+        ),
+        # acceptable error
+        (
+            pd.DataFrame({"a": [1.0, 1.0]}),
+            pd.DataFrame({"a": [1.001, 1.002]}),
+            (1, 0),
+        ),
+        # null
+        (
+            pd.DataFrame({"a": pd.array([None, 1], dtype="Int64")}),
+            pd.DataFrame({"a": pd.array([None, None], dtype="Int64")}),
+            (1, 0),
+        ),
+        (
+            pd.DataFrame({"a": [np.nan, 1.0]}),
+            pd.DataFrame({"a": [np.nan, 1.0]}),
+            None,
+        ),
+        # object
+        (
+            pd.DataFrame({"a": pd.Series([{"x": 1}, None], dtype=object)}),
+            pd.DataFrame({"a": pd.Series([{"x": 1}, 1], dtype=object)}),
+            (1, 0),
+        ),
+    ],
+)
+def test_find_first_mismatch(
+    actual: pd.DataFrame, expected: pd.DataFrame, result: tuple[int, int] | None
+) -> None:
+    assert compare.find_first_mismatch(actual, expected, 1.0e-3) == result
+
+
+def test_column_mismatch_consistency() -> None:
+    rng = np.random.default_rng(0)
+    n = 1000
+    columns: list[tuple[Any, Any]] = [
+        (rng.integers(0, 3, n), rng.integers(0, 3, n)),
+        (rng.random(n), rng.random(n)),
+        (
+            pd.array(rng.integers(0, 2, n), dtype="Int64"),
+            pd.array([None if i % 3 == 0 else i % 2 for i in range(n)], dtype="Int64"),
+        ),
+        (
+            np.where(rng.random(n) < 0.5, np.nan, 1.0),
+            np.where(rng.random(n) < 0.5, np.nan, 1.0),
+        ),
+        (
+            pd.Series(
+                rng.choice(np.array(["a", "b", None], dtype=object), n), dtype=object
+            ),
+            pd.Series(
+                rng.choice(np.array(["a", "b", 1], dtype=object), n), dtype=object
+            ),
+        ),
+    ]
+
+    for a, e in columns:
+        actual = pd.Series(a)
+        expected = pd.Series(e)
+        mask = compare.column_mismatch(actual, expected, 1.0e-3)
+        loop = [
+            not compare.is_equal(actual.iloc[i], expected.iloc[i], 1.0e-3)
+            for i in range(n)
+        ]
+        assert mask.tolist() == loop
+
+
+@pytest.mark.parametrize(
+    "actual,expected,actual_only,expected_only",
+    [
+        # order does not matter
+        (
+            pd.DataFrame({"a": [1, 2, 2], "b": ["x", "y", "y"]}),
+            pd.DataFrame({"a": [2, 1, 2], "b": ["y", "x", "y"]}),
+            [],
+            [],
+        ),
+        # duplicated rows are counted
+        (
+            pd.DataFrame({"a": [1, 1, 2]}),
+            pd.DataFrame({"a": [1, 2, 2]}),
+            [1],
+            [2],
+        ),
+        # type does not match
+        (
+            pd.DataFrame({"a": [1]}),
+            pd.DataFrame({"a": [1.0]}),
+            [0],
+            [0],
+        ),
+        # acceptable error (including the border of buckets)
+        (
+            pd.DataFrame({"a": [1.0, 2.0, -3.0, 0.0, np.nan], "b": [1, 2, 3, 4, 5]}),
+            pd.DataFrame(
+                {"a": [2.0009, 1.0005, -3.0, 0.0, np.nan], "b": [2, 1, 3, 4, 5]}
+            ),
+            [],
+            [],
+        ),
+        (
+            pd.DataFrame({"a": [1.0, 1.0]}),
+            pd.DataFrame({"a": [1.0, 1.1]}),
+            [1],
+            [1],
+        ),
+        # null
+        (
+            pd.DataFrame({"a": pd.array([None, 1], dtype="Int64")}),
+            pd.DataFrame({"a": pd.array([1, None], dtype="Int64")}),
+            [],
+            [],
+        ),
+        # unhashable
+        (
+            pd.DataFrame({"a": pd.Series([{"x": 1}, [1, 2]], dtype=object)}),
+            pd.DataFrame({"a": pd.Series([[1, 2], {"x": 2}], dtype=object)}),
+            [0],
+            [1],
+        ),
+    ],
+)
+def test_diff_multiset(
+    actual: pd.DataFrame,
+    expected: pd.DataFrame,
+    actual_only: list[int],
+    expected_only: list[int],
+) -> None:
+    actual_res, expected_res = compare.diff_multiset(actual, expected, 1.0e-3)
+
+    assert actual_res.index.tolist() == actual_only
+    assert expected_res.index.tolist() == expected_only
+
+
+@pytest.mark.parametrize(
+    "actual,expected,equal",
+    [
+        (1.0, 1.0009, True),
+        (1.0, 1.0015, False),
+        (1.0, 1.0019, False),
+        (10.0, 10.009, True),
+        (10.0, 10.015, False),
+        (100.0, 100.09, True),
+        (100.0, 100.17, False),
+        (-1.0, -1.0009, True),
+        (-1.0, -1.0015, False),
+        (-5.0, -5.0, True),
+        (-5.0, 5.0, False),
+        (0.0, 0.0, True),
+        (float("inf"), float("inf"), True),
+        (float("-inf"), float("inf"), False),
+    ],
+)
+def test_acceptable_error_border(actual: float, expected: float, equal: bool) -> None:
+    # hash mode and sort mode give the same verdict
+    actual_df = pd.DataFrame({"a": [actual]})
+    expected_df = pd.DataFrame({"a": [expected]})
+    actual_only, expected_only = compare.diff_multiset(actual_df, expected_df, 1.0e-3)
+
+    assert (len(actual_only) == 0 and len(expected_only) == 0) == equal
+    assert compare.is_equal(actual, expected, 1.0e-3) == equal
+    assert compare.find_first_mismatch(actual_df, expected_df, 1.0e-3) == (
+        None if equal else (0, 0)
+    )
+
+
+@pytest.mark.parametrize("acceptable_error", [1.0e-12, 1.0e-3, 0.3, 0.5, 2.0])
+def test_float_buckets(acceptable_error: float) -> None:
+    rng = np.random.default_rng(0)
+    expected = rng.choice([1.0e-300, 1.0, -3.3, 1.0e300], 10_000) * rng.uniform(
+        0.5, 2.0, 10_000
+    )
+    actual = expected * (1 + acceptable_error * rng.uniform(-1, 1, 10_000))
+    within = compare.within_error(actual, expected, acceptable_error)
+
+    actual_kind, actual_bucket = compare._float_buckets(actual, acceptable_error)
+    expected_kind, expected_bucket = compare._float_buckets(expected, acceptable_error)
+
+    # pairs within the error are found by probing the neighbouring buckets
+    assert (actual_kind[within] == expected_kind[within]).all()
+    assert (np.abs(actual_bucket - expected_bucket)[within] <= 1).all()
+
+
+def test_diff_multiset_residual() -> None:
+    # values near the border of hash buckets
+    rng = np.random.default_rng(0)
+    x = rng.uniform(1, 1000, 5_000)
+    actual = pd.DataFrame(
+        {"x": x, "y": rng.uniform(0, 1, 5_000), "k": x.astype(int) % 7}
+    )
+    expected = actual.assign(x=x * (1 + 0.9e-3 * rng.uniform(-1, 1, 5_000)))
+
+    actual_only, expected_only = compare.diff_multiset(
+        actual, expected.sample(frac=1, random_state=0), 1.0e-3
+    )
+    assert len(actual_only) == 0 and len(expected_only) == 0
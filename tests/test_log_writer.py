@@ -0,0 +1,77 @@
+from pathlib import Path
+import time
+
+import pandas as pd
+import pytest
+
+from tdsql.log_writer import LogWriter, make_log_dir, write_result
+from tdsql.test_case import TdsqlTestCase
+from tdsql import util
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.mark.parametrize(
+    "log_format,compression,filename",
+    [
+        ("csv", "", "result.csv"),
+        ("csv", "gzip", "result.csv.gz"),
+        ("parquet", "", "result.parquet"),
+        ("parquet", "zstd", "result.parquet"),
+        ("arrow", "", "result.arrow"),
+        ("arrow", "zstd", "result.arrow"),
+    ],
+)
+@pytest.mark.parametrize("is_pandas", [True, False])
+def test_write_result(
+    log_format: str, compression: str, filename: str, is_pandas: bool, tmp_path: Path
+) -> None:
+    df = pd.DataFrame({"i": [1, 2], "s": ["a", None]})
+    result = df if is_pandas else pa.Table.from_pandas(df, preserve_index=False)
+
+    write_result(result, tmp_path / "result", log_format, compression)
+
+    path = tmp_path / filename
+    if log_format == "csv":
+        actual = pd.read_csv(path)
+    elif log_format == "parquet":
+        actual = pd.read_parquet(path)
+    else:
+        with pa.memory_map(str(path), "r") as source:
+            actual = pa.ipc.open_file(source).read_all().to_pandas()
+
+    assert list(actual["i"]) == [1, 2]
+    assert actual["s"][0] == "a" and pd.isna(actual["s"][1])
+
+
+def test_log_writer(tmp_path: Path) -> None:
+    sqlpath = tmp_path / "tdsql.sql"
+    util.write(sqlpath, "SELECT 1")
+    test = TdsqlTestCase(sqlpath, {}, "SELECT 2")
+
+    writer = LogWriter(max_pending=1)
+    writer.write_queries(test, tmp_path)
+    writer.write_results(test, tmp_path, pd.DataFrame({"i": [1]}), ValueError())
+    writer.close()
+
+    assert util.read(tmp_path / f"tdsql_{test.id}_expected.sql") == "SELECT 2"
+    assert (tmp_path / f"tdsql_{test.id}_actual.csv").is_file()
+    # nothing is written for exceptions
+    assert not (tmp_path / f"tdsql_{test.id}_expected.csv").exists()
+
+
+def test_make_log_dir(tmp_path: Path) -> None:
+    log_dir = tmp_path / ".tdsql_log"
+    util.write(log_dir / "old.csv", "i\n1")
+    # left by the previous run which was killed
+    util.write(tmp_path / ".tdsql_log.old-0" / "old.csv", "i\n1")
+
+    make_log_dir(log_dir)
+
+    assert [p.name for p in log_dir.iterdir()] == [".gitignore"]
+    # old logs are removed in background
+    for _ in range(100):
+        if list(tmp_path.glob(".tdsql_log.old-*")) == []:
+            break
+        time.sleep(0.01)
+    assert list(tmp_path.glob(".tdsql_log.old-*")) == []
@@ -0,0 +1,25 @@
+from tdsql import plan
+
+
+def test_estimate() -> None:
+    assert plan.estimate([1.0, None, 3.0]) == [1.0, 2.0, 3.0]
+    assert plan.estimate([None, None]) == [0.0, 0.0]
+
+
+def test_lpt_order() -> None:
+    assert plan.lpt_order([1.0, 3.0, 1.0, 2.0]) == [1, 3, 0, 2]
+
+
+def test_makespan() -> None:
+    assert plan.makespan([3.0, 2.0, 2.0, 1.0], workers=2) == 4.0
+    # shorter first is worse
+    assert plan.makespan([1.0, 2.0, 2.0, 3.0], workers=2) == 5.0
+    assert plan.makespan([], workers=2) == 0.0
+
+
+def test_partition() -> None:
+    keys = ["a", "b", "c", "d"]
+    # by count, ties are broken by keys
+    assert plan.partition([1.0] * 4, keys, 2) == [0, 1, 0, 1]
+    assert plan.partition([3.0, 2.0, 2.0, 1.0], keys, 2) == [0, 1, 1, 0]
+    assert plan.partition([1.0], ["a"], 3) == [0]
@@ -0,0 +1,84 @@
+from threading import Lock
+from typing import Any
+import time
+
+import pandas as pd
+
+from tdsql.client.base import BaseClient
+from tdsql.scheduler import AdaptiveLimiter, AsyncScheduler
+from tdsql.test_config import TdsqlTestConfig
+
+
+class _ThrottledError(Exception):
+    pass
+
+
+class _AsyncClient(BaseClient):
+    """Each job finishes after 10ms, the first `throttle` submissions fail."""
+
+    supports_async = True
+
+    def __init__(self, throttle: int) -> None:
+        self.throttle = throttle
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = Lock()
+
+    def select(self, sql: str, config: TdsqlTestConfig) -> pd.DataFrame:
+        raise NotImplementedError()
+
+    def submit(self, sql: str, config: TdsqlTestConfig) -> Any:
+        with self._lock:
+            if self.throttle > 0:
+                self.throttle -= 1
+                raise _ThrottledError()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return (sql, time.monotonic())
+
+    def poll(self, job: Any) -> bool:
+        return bool(time.monotonic() - job[1] > 0.01)
+
+    def fetch(self, job: Any, arrow: bool = False) -> Any:
+        with self._lock:
+            self.in_flight -= 1
+        return pd.DataFrame({"sql": [job[0]]})
+
+    def is_throttled(self, error: Exception) -> bool:
+        return isinstance(error, _ThrottledError)
+
+
+def test_adaptive_limiter() -> None:
+    limiter = AdaptiveLimiter(initial=2, maximum=4)
+
+    for _ in range(2):
+        limiter.on_success(1.0)
+    assert limiter.limit == 3
+
+    # latency is not stable
+    for _ in range(3):
+        limiter.on_success(10.0)
+    assert limiter.limit == 3
+
+    limiter.on_throttled()
+    assert limiter.limit == 1
+
+    for _ in range(100):
+        limiter.on_success(1.0)
+    assert limiter.limit == 4
+    assert limiter.peak == 4
+
+
+def test_async_scheduler() -> None:
+    scheduler = AsyncScheduler(4, 8, poll_interval=0.001, backoff=0.001)
+    client_ = _AsyncClient(throttle=3)
+    config = TdsqlTestConfig(database="async")
+
+    try:
+        futures = [scheduler.submit(client_, f"SELECT {i}", config) for i in range(50)]
+        results = [f.result(timeout=10) for f in futures]
+    finally:
+        scheduler.shutdown()
+
+    assert [r["sql"][0] for r in results] == [f"SELECT {i}" for i in range(50)]
+    assert client_.max_in_flight <= scheduler.limiter.peak <= 8
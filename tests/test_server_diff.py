@@ -0,0 +1,168 @@
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from tdsql.exception import TdsqlAssertionError
+from tdsql.run_config import TdsqlRunConfig
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql import command
+from tdsql import server_diff
+from tdsql import util
+from tdsql import verdict
+
+duckdb = pytest.importorskip("tdsql.client.duckdb")
+
+
+@pytest.mark.parametrize(
+    "actual,expected,ignore_column_name,msg",
+    [
+        # duplicated rows
+        (
+            "SELECT 1 AS i, 'a' AS s UNION ALL SELECT 1, 'a' UNION ALL SELECT 2, NULL",
+            "SELECT 2 AS i, NULL AS s UNION ALL SELECT 1, 'a' UNION ALL SELECT 1, 'a'",
+            False,
+            None,
+        ),
+        (
+            "SELECT 1 AS i UNION ALL SELECT 1",
+            "SELECT 1 AS i",
+            False,
+            "rows do not match\nactual only: 1 rows\n i\n 1\nexpected only: 0 rows",
+        ),
+        # order of columns
+        ("SELECT 1 AS i, 2 AS j", "SELECT 2 AS j, 1 AS i", False, None),
+        ("SELECT 1 AS i, 2 AS j", "SELECT 1 AS x, 2 AS y", True, None),
+        (
+            "SELECT 1 AS i, 2 AS j",
+            "SELECT 2 AS j, 1 AS i",
+            True,
+            "actual only: 1 rows",
+        ),
+        # acceptable_error
+        ("SELECT 1.0::DOUBLE AS f", "SELECT 1.0001::DOUBLE AS f", False, None),
+        ("SELECT 1.0::DOUBLE AS f", "SELECT 1.1::DOUBLE AS f", False, "1.1"),
+        # downloaded and compared as usual
+        ("SELECT 1 AS i", "SELECT 1 AS j", False, "{'i'} only exsists in actual"),
+        # same json but different types
+        (
+            "SELECT DATE '2020-01-01' AS d",
+            "SELECT '2020-01-01' AS d",
+            False,
+            "value does not match",
+        ),
+        ("SELECT 1::INTEGER AS i", "SELECT 1::BIGINT AS i", False, "value does not"),
+        ("SELECT foo", "SELECT 1 AS i", False, "invalid query"),
+    ],
+)
+def test_compare(
+    actual: str,
+    expected: str,
+    ignore_column_name: bool,
+    msg: str | None,
+    tmp_path: Path,
+) -> None:
+    util.write(tmp_path / "tdsql.sql", actual)
+    test = TdsqlTestCase(tmp_path / "tdsql.sql", {}, expected)
+    config = TdsqlTestConfig(database="duckdb", ignore_column_name=ignore_column_name)
+    client_ = duckdb.DuckDBClient()
+    assert server_diff.accepts(client_, config)
+
+    if msg is None:
+        server_diff.compare(test, config, client_, tmp_path, TdsqlRunConfig())
+    else:
+        with pytest.raises(TdsqlAssertionError, match=msg):
+            server_diff.compare(test, config, client_, tmp_path, TdsqlRunConfig())
+
+
+def test_compare_many_mismatches(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, duckdb_client: Any
+) -> None:
+    monkeypatch.setattr(verdict, "MAX_DIFF_ROWS", 3)
+    util.write(tmp_path / "tdsql.sql", "SELECT i FROM range(10) AS t(i)")
+    test = TdsqlTestCase(tmp_path / "tdsql.sql", {}, "SELECT 1::BIGINT AS i")
+    config = TdsqlTestConfig(database="duckdb")
+
+    with pytest.raises(TdsqlAssertionError, match="actual only: 9 rows"):
+        server_diff.compare(test, config, duckdb_client, tmp_path, TdsqlRunConfig())
+
+    # only a part of mismatching rows is downloaded
+    assert len(pd.read_csv(tmp_path / f"tdsql_{test.id}_actual.csv")) == 3
+    # columns and the diff, results are not downloaded
+    assert len(duckdb_client.sqls) == 3
+
+
+@pytest.mark.parametrize(
+    "actual,expected,n_queries,msg",
+    [
+        (
+            "SELECT 1 AS i UNION ALL SELECT 2",
+            "SELECT 2 AS i UNION ALL SELECT 1",
+            3,
+            None,
+        ),
+        # hashes of duplicated rows are cancelled by BIT_XOR
+        (
+            "SELECT 1 AS i UNION ALL SELECT 1",
+            "SELECT 2 AS i UNION ALL SELECT 2",
+            4,
+            "actual only: 2 rows",
+        ),
+        ("SELECT 1 AS i", "SELECT 1 AS i WHERE false", 4, "actual only: 1 rows"),
+        # matched by the diff
+        ("SELECT 1.0::DOUBLE AS f", "SELECT 1.0001::DOUBLE AS f", 4, None),
+        # fingerprints of the same json are not used for different types
+        (
+            "SELECT DATE '2020-01-01' AS d",
+            "SELECT '2020-01-01' AS d",
+            4,
+            "value does not match",
+        ),
+    ],
+)
+def test_compare_fingerprint(
+    actual: str,
+    expected: str,
+    n_queries: int,
+    msg: str | None,
+    tmp_path: Path,
+    duckdb_client: Any,
+) -> None:
+    util.write(tmp_path / "tdsql.sql", actual)
+    test = TdsqlTestCase(tmp_path / "tdsql.sql", {}, expected)
+    config = TdsqlTestConfig(database="duckdb")
+    run_config = TdsqlRunConfig(fingerprint=True)
+
+    if msg is None:
+        server_diff.compare(test, config, duckdb_client, tmp_path, run_config)
+    else:
+        with pytest.raises(TdsqlAssertionError, match=msg):
+            server_diff.compare(test, config, duckdb_client, tmp_path, run_config)
+
+    # columns of both sides, fingerprints and the diff if they differ
+    # (or results of both sides if types of columns differ)
+    assert len(duckdb_client.sqls) == n_queries
+
+
+def test_run_server_diff(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: duckdb
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS i
+  - filepath: ./tdsql.sql
+    expected: SELECT 2 AS i
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS i")
+    caplog.set_level("INFO")
+
+    with pytest.raises(SystemExit):
+        command.run(tmp_path / "tdsql.yaml", TdsqlRunConfig(server_diff=True))
+
+    assert "rows do not match" in caplog.text
+    assert "1 tests passed, 1 tests failed" in caplog.text
@@ -1,4 +1,5 @@
 from pathlib import Path
+
 import pytest
 
 from tdsql import test_case
@@ -123,3 +124,29 @@ def test_replace_sql_err(
 
     with pytest.raises(InvalidInputError, match=msg):
         test_case._replace_sql(sqlpath, replace)
+
+
+def test_replace_sql_index(tmp_path: Path) -> None:
+    sqlpath = tmp_path / "tdsql.sql"
+    util.write(sqlpath, "SELECT 1 -- tdsql-line: test")
+
+    indexes: dict[Path, test_case.SqlIndex] = {}
+    index = test_case._index_sql(sqlpath, indexes)
+    assert test_case._index_sql(sqlpath, indexes) is index
+    assert test_case._replace_sql(sqlpath, {"test": "SELECT 2"}, indexes) == "SELECT 2"
+    # not modified by replacement
+    assert index.lines == ["SELECT 1 -- tdsql-line: test"]
+
+    # indexes are not shared unless they are given
+    util.write(sqlpath, "SELECT 3 -- tdsql-line: another")
+    assert test_case._index_sql(sqlpath, {}) is not index
+    assert test_case._replace_sql(sqlpath, {"another": "SELECT 4"}) == "SELECT 4"
+
+
+@pytest.mark.parametrize("ident", ["3,3", "1,3", "5,6", "0,1"])
+def test_replace_sql_out_of_range(ident: str, tmp_path: Path) -> None:
+    sqlpath = tmp_path / "tdsql.sql"
+    util.write(sqlpath, "SELECT\n1")
+
+    with pytest.raises(InvalidInputError, match="out of range"):
+        test_case._replace_sql(sqlpath, {ident: "SELECT 2"})
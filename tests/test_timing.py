@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+
+import pytest
+
+from tdsql.run_config import TdsqlRunConfig
+from tdsql import command
+from tdsql import timing
+from tdsql import util
+
+
+def test_timeline() -> None:
+    timeline = timing.Timeline()
+    timing.activate(timeline)
+    try:
+        with timing.span("parse_yaml"):
+            pass
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(timing.timed("query", "a_1", lambda: None)).result()
+            pool.submit(timing.timed("query", "a_2", lambda: None)).result()
+        # not labeled explicitly
+        with timing.task("a_1"), timing.span("compare"):
+            pass
+    finally:
+        timing.activate(None)
+
+    # not recorded
+    with timing.span("compare"):
+        pass
+
+    report = timeline.report()
+    assert {k: v["count"] for k, v in report["phases"].items()} == {
+        "parse_yaml": 1,
+        "queue_wait": 2,
+        "query": 2,
+        "compare": 1,
+    }
+    assert {t["label"]: set(t["phases"]) for t in report["tests"]} == {
+        "a_1": {"queue_wait", "query", "compare"},
+        "a_2": {"queue_wait", "query"},
+    }
+    seconds = [t["seconds"] for t in report["tests"]]
+    assert seconds == sorted(seconds, reverse=True)
+
+
+def test_report_nested() -> None:
+    timeline = timing.Timeline()
+    origin = timeline.origin
+    timeline.add("query", origin + 1, origin + 4, "a_1")
+    timeline.add("execute", origin + 1, origin + 3, "a_1")
+    timeline.add("download", origin + 3, origin + 4, "a_1")
+    timeline.add("compare", origin + 5, origin + 6, "a_1")
+    timeline.add("query", origin + 1, origin + 6, "a_2")
+
+    report = timeline.report()
+    # query of a_1 is not counted twice
+    assert [t["label"] for t in report["tests"]] == ["a_2", "a_1"]
+    assert [t["seconds"] for t in report["tests"]] == pytest.approx([5.0, 4.0])
+    assert report["tests"][1]["phases"]["query"] == pytest.approx(3.0)
+
+
+def test_run_trace(tmp_path: Path) -> None:
+    pytest.importorskip("duckdb")
+    util.write(
+        tmp_path / "tdsql.yaml",
+        """
+database: duckdb
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS i
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1 AS i")
+    run_config = TdsqlRunConfig(
+        timing_report=tmp_path / "timing.json", trace=tmp_path / "trace.json"
+    )
+
+    command.run(tmp_path / "tdsql.yaml", run_config)
+
+    report = json.loads(util.read(tmp_path / "timing.json"))
+    assert {
+        "parse_yaml",
+        "render",
+        "queue_wait",
+        "query",
+        "execute",
+        "download",
+        "compare",
+        "write_log",
+    } <= set(report["phases"])
+
+    trace = json.loads(util.read(tmp_path / "trace.json"))
+    events = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert len(events) == sum(p["count"] for p in report["phases"].values())
+    assert all(e["dur"] >= 0 for e in events)
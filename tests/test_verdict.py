@@ -0,0 +1,336 @@
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from tdsql.test_case import TdsqlTestCase
+from tdsql.test_config import TdsqlTestConfig
+from tdsql.exception import TdsqlAssertionError
+from tdsql import command
+from tdsql import util
+from tdsql import client
+from tdsql import verdict
+
+
+@pytest.mark.parametrize(
+    "msg,yamlstr,sqlstr",
+    [
+        # most simple
+        (
+            r"value does not match at line: 1, column: 1\nactual: 2, expected: 1",
+            """
+database: bigquery
+ignore_column_name: true
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+""",
+            """
+SELECT 2
+""",
+        ),
+        (
+            r"value does not match at line: 2, column: 1\nactual: 3, expected: 2",
+            """
+database: bigquery
+ignore_column_name: true
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 UNION ALL SELECT 2
+""",
+            """
+SELECT 1 UNION ALL SELECT 3
+""",
+        ),
+        # invalid query
+        (
+            r"invalid query\nSELECT foo",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT foo
+""",
+            """
+SELECT 1
+""",
+        ),
+        (
+            r"invalid query\nSELECT foo",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+""",
+            "SELECT foo",
+        ),
+        # auto_sort
+        (
+            r"value does not match at line: 1, column: num\n"
+            + r"actual: 2, expected: 1",
+            """
+database: bigquery
+auto_sort: false
+tests:
+  - filepath: ./tdsql.sql
+    expected: |
+      SELECT 1 AS num UNION ALL
+      SELECT 2
+""",
+            """
+SELECT 2 AS num UNION ALL
+SELECT 1
+""",
+        ),
+        # column does not match
+        (
+            r"""number of columns does not match
+actual: 2, expected 1""",
+            """
+database: bigquery
+ignore_column_name: true
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+""",
+            """
+SELECT 1, 2
+""",
+        ),
+        (
+            r"\{'two'\} only exsists in actual result",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS one
+""",
+            """
+SELECT 1 AS one, 2 AS two
+""",
+        ),
+        (
+            r"\{'two'\} only exsists in expected result",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS one, 2 AS two
+""",
+            """
+SELECT 1 AS one
+""",
+        ),
+        # equality
+        (
+            r"value does not match at line: 1, column: one\n"
+            + r"actual: 1, expected: 1.0",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1.0 AS one
+""",
+            """
+SELECT 1 AS one -- type does not match
+""",
+        ),
+        (
+            r"value does not match at line: 1, column: col\n"
+            + r"actual: 1.0, expected: 1.002",
+            """
+database: bigquery
+acceptable_error: 1.0e-3
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1.001 AS col
+  - filepath: ./tdsql.sql
+    expected: SELECT 1.002 AS col
+""",
+            """
+SELECT 1.0 AS col
+""",
+        ),
+        (
+            r"value does not match at line: 1, column: col\n"
+            + r"actual: 1, expected: <NA>",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT NULL AS col
+""",
+            """
+SELECT 1 AS col
+""",
+        ),
+        # number of rows does not match
+        (
+            "actual result is longer than expected result",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1 AS col
+""",
+            """
+SELECT 1 AS col UNION ALL
+SELECT 2
+""",
+        ),
+        (
+            "expected result is longer than actual result",
+            """
+database: bigquery
+tests:
+  - filepath: ./tdsql.sql
+    expected: |
+      SELECT 1 AS col UNION ALL
+      SELECT 2
+""",
+            """
+SELECT 1 AS col
+""",
+        ),
+    ],
+)
+def test_compare_results(msg: str, yamlstr: str, sqlstr: str, tmp_path: Path) -> None:
+    yamlpath = Path(tmp_path) / "tdsql.yaml"
+    sqlpath = Path(tmp_path) / "tdsql.sql"
+
+    util.write(yamlpath, yamlstr)
+    util.write(sqlpath, sqlstr)
+
+    test_config = command._detect_test_config(yamlpath)
+    test_cases = command._detect_test_cases(yamlpath)
+    client_ = client.get_client(test_config.database)
+
+    with pytest.raises(TdsqlAssertionError, match=msg):
+        for t in test_cases:
+            try:
+                t.actual_sql_result = client_.select(t.actual_sql, test_config)
+            except Exception as e:
+                t.actual_sql_result = e
+            try:
+                t.expected_sql_result = client_.select(t.expected_sql, test_config)
+            except Exception as e:
+                t.expected_sql_result = e
+
+            verdict.compare_results(t, test_config)
+
+
+def test_compare_results_hash(tmp_path: Path) -> None:
+    yamlpath = tmp_path / "tdsql.yaml"
+    util.write(
+        yamlpath,
+        """
+database: bigquery
+auto_sort_method: hash
+tests:
+  - filepath: ./tdsql.sql
+    expected: SELECT 1
+""",
+    )
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+
+    test_config = command._detect_test_config(yamlpath)
+    t = command._detect_test_cases(yamlpath)[0]
+    t.actual_sql_result = pd.DataFrame({"a": [1, 2, 2], "b": ["x", "y", "z"]})
+    t.expected_sql_result = pd.DataFrame({"b": ["z", "x", "y"], "a": [2, 1, 3]})
+
+    with pytest.raises(
+        TdsqlAssertionError,
+        match=r"rows do not match\nactual only: 1 rows\n a b\n 2 y\n"
+        + r"expected only: 1 rows\n a b\n 3 y",
+    ):
+        verdict.compare_results(t, test_config)
+
+
+@pytest.mark.parametrize(
+    "msg,actual,expected",
+    [
+        (
+            None,
+            [("a", [1]), ("a", [2]), ("b", [3])],
+            [("b", [3]), ("a", [1]), ("a", [2])],
+        ),
+        (
+            r"line: 1, column: a\nactual: 1, expected: 2",
+            [("a", [1]), ("a", [2])],
+            [("a", [2]), ("a", [1])],
+        ),
+        (
+            r"number of columns named {'a'} does not match",
+            [("a", [1]), ("a", [2])],
+            [("a", [1])],
+        ),
+    ],
+)
+@pytest.mark.parametrize("auto_sort", [False, True])
+def test_compare_results_duplicated_columns(
+    msg: str | None,
+    actual: list[tuple[str, list[Any]]],
+    expected: list[tuple[str, list[Any]]],
+    auto_sort: bool,
+    tmp_path: Path,
+) -> None:
+    pa = pytest.importorskip("pyarrow")
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+    config = TdsqlTestConfig(database="duckdb", auto_sort=auto_sort)
+    t = TdsqlTestCase(tmp_path / "tdsql.sql", {}, "SELECT 1")
+    # e.g. `SELECT 1 a, 2 a` in DuckDB with --arrow
+    t.actual_sql_result = pa.table([v for _, v in actual], names=[n for n, _ in actual])
+    t.expected_sql_result = pa.table(
+        [v for _, v in expected], names=[n for n, _ in expected]
+    )
+
+    if msg is None:
+        verdict.compare_results(t, config)
+    else:
+        with pytest.raises(TdsqlAssertionError, match=msg):
+            verdict.compare_results(t, config)
+
+
+@pytest.mark.parametrize(
+    "msg,expected_types,ignore_column_name",
+    [
+        (None, ["VARCHAR", "DATE"], False),
+        (
+            r"type does not match at column: d\nactual: DATE, expected: VARCHAR",
+            ["DATE", "VARCHAR"],
+            False,
+        ),
+        (None, ["DATE", "VARCHAR"], True),
+        (r"type does not match at column: 1", ["VARCHAR", "DATE"], True),
+    ],
+)
+@pytest.mark.parametrize("arrow", [False, True])
+def test_compare_results_types(
+    msg: str | None,
+    expected_types: list[str],
+    ignore_column_name: bool,
+    arrow: bool,
+    tmp_path: Path,
+) -> None:
+    util.write(tmp_path / "tdsql.sql", "SELECT 1")
+    config = TdsqlTestConfig(database="duckdb", ignore_column_name=ignore_column_name)
+    t = TdsqlTestCase(tmp_path / "tdsql.sql", {}, "SELECT 1")
+    # values which went through json (see tdsql.batch)
+    actual = pd.DataFrame({"d": ["2020-01-01"], "s": ["a"]})
+    expected = pd.DataFrame({"s": ["a"], "d": ["2020-01-01"]})
+    if ignore_column_name:
+        expected = pd.DataFrame({"x": ["2020-01-01"], "y": ["a"]})
+    if arrow:
+        pa = pytest.importorskip("pyarrow")
+        actual = pa.Table.from_pandas(actual, preserve_index=False)
+        expected = pa.Table.from_pandas(expected, preserve_index=False)
+    t.actual_sql_result = verdict.with_types(actual, ["DATE", "VARCHAR"])
+    t.expected_sql_result = verdict.with_types(expected, expected_types)
+
+    if msg is None:
+        verdict.compare_results(t, config)
+    else:
+        with pytest.raises(TdsqlAssertionError, match=msg):
+            verdict.compare_results(t, config)